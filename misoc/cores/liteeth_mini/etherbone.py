@@ -0,0 +1,406 @@
+from migen import *
+
+from misoc.interconnect import stream, wishbone
+from misoc.cores.liteeth_mini.common import eth_phy_layout, eth_mtu
+
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+EB_MAGIC = 0x4e6f
+
+
+class LiteEthEtherbone(Module):
+    """Wishbone master answering Etherbone packets over UDP/IPv4
+
+    Sits on the 32-bit, big-endian streams of ``LiteEthMACCore`` and
+    handles on its own the frames addressed to ``mac_address``,
+    ``ip_address`` and ``udp_port``, and the ARP requests for
+    ``ip_address``. Other frames are dropped.
+
+    Frames are received into ``nslots`` buffers and only processed once
+    complete and free of errors. The Etherbone records of a packet are
+    performed in order, writes before reads within a record. Every packet
+    is answered, with one record per record with reads carrying the data
+    read, so hosts can pipeline as many packets as there are buffers.
+    Only 32-bit addresses and data are supported.
+    """
+    def __init__(self, mac_address, ip_address, udp_port=1234, nslots=2):
+        self.sink = sink = stream.Endpoint(eth_phy_layout(32))
+        self.source = source = stream.Endpoint(eth_phy_layout(32))
+        self.master = master = wishbone.Interface()
+
+        # # #
+
+        slot_words = 512
+        slotbits = log2_int(nslots)
+        header_words = 11
+        max_udp_length = eth_mtu - 42
+
+        # receive frames into slots
+        rx_mem = Memory(32, nslots*slot_words)
+        rx_wport = rx_mem.get_port(write_capable=True)
+        rx_rport = rx_mem.get_port()
+        self.specials += rx_mem, rx_wport, rx_rport
+
+        def slot_address(index, slot):
+            return Cat(index, slot[:slotbits]) if slotbits else index
+
+        wr_slot = Signal(slotbits + 1)
+        rd_slot = Signal(slotbits + 1)
+        pending = Signal(slotbits + 1)
+        self.comb += pending.eq(wr_slot - rd_slot)
+
+        rx_index = Signal(max=slot_words + 1)
+        rx_sop = Signal(reset=1)
+        rx_drop = Signal()
+        dropping = Signal()
+        self.comb += [
+            sink.ack.eq(1),
+            dropping.eq(Mux(rx_sop, pending == nslots, rx_drop)),
+            rx_wport.adr.eq(slot_address(rx_index[:log2_int(slot_words)], wr_slot)),
+            rx_wport.dat_w.eq(sink.data),
+            rx_wport.we.eq(sink.stb & ~dropping & (rx_index != slot_words))
+        ]
+        self.sync += \
+            If(sink.stb,
+                rx_sop.eq(sink.eop),
+                rx_drop.eq(dropping),
+                If(rx_index != slot_words,
+                    rx_index.eq(rx_index + 1)
+                ),
+                If(sink.eop,
+                    rx_index.eq(0),
+                    If(~dropping & (rx_index != slot_words) & (sink.error == 0),
+                        wr_slot.eq(wr_slot + 1)
+                    )
+                )
+            )
+
+        # read frames, and realign the UDP payload that starts at byte 42
+        index = Signal(log2_int(slot_words))
+        index_next = Signal(log2_int(slot_words))
+        advance = Signal()
+        restart = Signal()
+        word = rx_rport.dat_r
+        prev = Signal(32)
+        payload = Signal(32)
+        self.comb += [
+            If(restart,
+                index_next.eq(0)
+            ).Elif(advance,
+                index_next.eq(index + 1)
+            ).Else(
+                index_next.eq(index)
+            ),
+            rx_rport.adr.eq(slot_address(index_next, rd_slot)),
+            payload.eq(Cat(word[16:], prev[:16]))
+        ]
+        self.sync += [
+            index.eq(index_next),
+            If(advance, prev.eq(word))
+        ]
+
+        headers = [Signal(32) for i in range(header_words)]
+        capture = Signal()
+        self.sync += \
+            If(capture,
+                Case(index, {i: h.eq(word) for i, h in enumerate(headers)})
+            )
+        h = headers
+        eth_dst = Cat(h[1][16:], h[0])
+        eth_src = Cat(h[2], h[1][:16])
+        ethertype = h[3][16:]
+        ip_verihl = h[3][8:16]
+        ip_fragment = h[5][16:30]
+        ip_protocol = h[5][:8]
+        ip_src = Cat(h[7][16:], h[6][:16])
+        ip_dst = Cat(h[8][16:], h[7][:16])
+        udp_src = h[8][:16]
+        udp_dst = h[9][16:]
+        udp_length = h[9][:16]
+        arp_operation = h[5][16:]
+        arp_spa = h[7]
+        arp_tpa = Cat(h[10][16:], h[9][:16])
+
+        is_arp = Signal()
+        is_udp = Signal()
+        self.comb += [
+            is_arp.eq(((eth_dst == mac_address) | (eth_dst == 2**48 - 1))
+                & (ethertype == ETHERTYPE_ARP)
+                & (arp_operation == 1)
+                & (arp_tpa == ip_address)),
+            is_udp.eq((eth_dst == mac_address)
+                & (ethertype == ETHERTYPE_IPV4)
+                & (ip_verihl == 0x45)
+                & (ip_fragment == 0)
+                & (ip_protocol == 17)
+                & (ip_dst == ip_address)
+                & (udp_dst == udp_port)
+                & (udp_length >= 8)
+                & (udp_length <= max_udp_length))
+        ]
+
+        # reply payload
+        tx_mem = Memory(32, slot_words)
+        tx_wport = tx_mem.get_port(write_capable=True)
+        tx_rport = tx_mem.get_port()
+        self.specials += tx_mem, tx_wport, tx_rport
+        tx_index = Signal(log2_int(slot_words))
+        self.comb += tx_wport.adr.eq(tx_index)
+
+        reply_arp = Signal()
+        reply_mac = Signal(48)
+        reply_ip = Signal(32)
+        reply_port = Signal(16)
+
+        remaining = Signal(max=max_udp_length//4 + 1)
+        wff = Signal()
+        rff = Signal()
+        byte_enable = Signal(8)
+        wcount = Signal(8)
+        rcount = Signal(8)
+        address = Signal(30)
+
+        def consume():
+            return [advance.eq(1), NextValue(remaining, remaining - 1)]
+
+        def write_reply(value):
+            return [
+                tx_wport.dat_w.eq(value),
+                tx_wport.we.eq(1),
+                NextValue(tx_index, tx_index + 1)
+            ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            restart.eq(1),
+            NextValue(tx_index, 0),
+            If(pending != 0,
+                NextState("HEADER")
+            )
+        )
+        fsm.act("HEADER",
+            capture.eq(1),
+            advance.eq(1),
+            If(index == header_words - 1,
+                NextState("DECODE")
+            )
+        )
+        fsm.act("DECODE",
+            NextValue(reply_arp, is_arp),
+            NextValue(reply_mac, eth_src),
+            NextValue(reply_ip, Mux(is_arp, arp_spa, ip_src)),
+            NextValue(reply_port, udp_src),
+            NextValue(remaining, (udp_length - 8)[2:]),
+            If(is_arp,
+                NextState("SEND")
+            ).Elif(is_udp,
+                NextState("EB_HEADER")
+            ).Else(
+                NextState("DONE")
+            )
+        )
+        fsm.act("EB_HEADER",
+            If((remaining != 0)
+                    & (payload[16:] == EB_MAGIC)
+                    & (payload[12:16] == 1)
+                    & ~payload[9]
+                    & (payload[:8] == 0x44),
+                consume(),
+                # version 1, no reads, probe response if probed
+                write_reply(Cat(C(0x44, 8), 0, payload[8], 1, 0, C(1, 4),
+                                C(EB_MAGIC, 16))),
+                If(payload[8],
+                    NextState("SEND")
+                ).Else(
+                    NextState("RECORD")
+                )
+            ).Else(
+                NextState("DONE")
+            )
+        )
+        fsm.act("RECORD",
+            If(remaining == 0,
+                NextState("SEND")
+            ).Else(
+                consume(),
+                NextValue(wff, payload[25]),
+                NextValue(rff, payload[29]),
+                NextValue(byte_enable, payload[16:24]),
+                NextValue(wcount, payload[8:16]),
+                NextValue(rcount, payload[:8]),
+                If(payload[8:16] != 0,
+                    NextState("WRITE_BASE")
+                ).Elif(payload[:8] != 0,
+                    NextState("READ_HEADER")
+                )
+            )
+        )
+        fsm.act("WRITE_BASE",
+            If(remaining == 0,
+                NextState("SEND")
+            ).Else(
+                consume(),
+                NextValue(address, payload[2:]),
+                NextState("WRITE")
+            )
+        )
+        fsm.act("WRITE",
+            master.adr.eq(address),
+            master.dat_w.eq(payload),
+            master.sel.eq(byte_enable),
+            master.we.eq(1),
+            If(remaining == 0,
+                NextState("SEND")
+            ).Else(
+                master.cyc.eq(1),
+                master.stb.eq(1),
+                If(master.ack,
+                    consume(),
+                    If(~wff,
+                        NextValue(address, address + 1)
+                    ),
+                    NextValue(wcount, wcount - 1),
+                    If(wcount == 1,
+                        If(rcount != 0,
+                            NextState("READ_HEADER")
+                        ).Else(
+                            NextState("RECORD")
+                        )
+                    )
+                )
+            )
+        )
+        fsm.act("READ_HEADER",
+            # the reply record writes the data read to the return address
+            write_reply(Cat(C(0, 8), rcount, byte_enable, 0, rff, C(0, 6))),
+            NextState("READ_BASE")
+        )
+        fsm.act("READ_BASE",
+            If(remaining == 0,
+                NextState("SEND")
+            ).Else(
+                consume(),
+                write_reply(payload),
+                NextState("READ")
+            )
+        )
+        fsm.act("READ",
+            master.adr.eq(payload[2:]),
+            master.sel.eq(byte_enable),
+            If(remaining == 0,
+                NextState("SEND")
+            ).Else(
+                master.cyc.eq(1),
+                master.stb.eq(1),
+                If(master.ack,
+                    consume(),
+                    write_reply(master.dat_r),
+                    NextValue(rcount, rcount - 1),
+                    If(rcount == 1,
+                        NextState("RECORD")
+                    )
+                )
+            )
+        )
+
+        # send replies, realigning the payload to byte 42
+        tx_word = Signal(log2_int(slot_words) + 1)
+        tx_last = Signal(log2_int(slot_words) + 1)
+        tx_rindex = Signal(log2_int(slot_words))
+        tx_rindex_next = Signal(log2_int(slot_words))
+        tx_prev = Signal(32)
+        tx_advance = Signal()
+        self.comb += [
+            If(fsm.ongoing("IDLE"),
+                tx_rindex_next.eq(0)
+            ).Elif(tx_advance,
+                tx_rindex_next.eq(tx_rindex + 1)
+            ).Else(
+                tx_rindex_next.eq(tx_rindex)
+            ),
+            tx_rport.adr.eq(tx_rindex_next),
+            tx_last.eq(Mux(reply_arp, header_words - 1, header_words - 1 + tx_index))
+        ]
+        self.sync += [
+            tx_rindex.eq(tx_rindex_next),
+            If(fsm.ongoing("IDLE"),
+                tx_prev.eq(0)
+            ).Elif(tx_advance,
+                tx_prev.eq(tx_rport.dat_r)
+            )
+        ]
+
+        udp_length_tx = Signal(16)
+        ip_length_tx = Signal(16)
+        ip_checksum = Signal(16)
+        checksum_sum = Signal(20)
+        checksum_fold = Signal(17)
+        self.comb += [
+            udp_length_tx.eq(8 + 4*tx_index),
+            ip_length_tx.eq(28 + 4*tx_index),
+            checksum_sum.eq(0x4500 + 0x4000 + 0x4011
+                + (ip_address >> 16) + (ip_address & 0xffff)
+                + ip_length_tx + reply_ip[16:] + reply_ip[:16]),
+            checksum_fold.eq(checksum_sum[:16] + checksum_sum[16:])
+        ]
+        self.sync += ip_checksum.eq(~(checksum_fold[:16] + checksum_fold[16]))
+
+        mac = C(mac_address, 48)
+        ip = C(ip_address, 32)
+        udp_words = [
+            reply_mac[16:],
+            Cat(mac[32:], reply_mac[:16]),
+            mac[:32],
+            Cat(C(0x4500, 16), C(ETHERTYPE_IPV4, 16)),
+            Cat(C(0, 16), ip_length_tx),
+            Cat(C(0x4011, 16), C(0x4000, 16)),
+            Cat(ip[16:], ip_checksum),
+            Cat(reply_ip[16:], ip[:16]),
+            Cat(C(udp_port, 16), reply_ip[:16]),
+            Cat(udp_length_tx, reply_port)
+        ]
+        arp_words = [
+            reply_mac[16:],
+            Cat(mac[32:], reply_mac[:16]),
+            mac[:32],
+            Cat(C(0x0001, 16), C(ETHERTYPE_ARP, 16)),
+            Cat(C(0x0604, 16), C(ETHERTYPE_IPV4, 16)),
+            Cat(mac[32:], C(0x0002, 16)),
+            mac[:32],
+            ip,
+            reply_mac[16:],
+            Cat(reply_ip[16:], reply_mac[:16]),
+            Cat(C(0, 16), reply_ip[:16])
+        ]
+        frame_word = Signal(32)
+        self.comb += \
+            If(reply_arp,
+                Case(tx_word, {i: frame_word.eq(w) for i, w in enumerate(arp_words)})
+            ).Elif(tx_word < len(udp_words),
+                Case(tx_word, {i: frame_word.eq(w) for i, w in enumerate(udp_words)})
+            ).Else(
+                frame_word.eq(Cat(tx_rport.dat_r[16:], tx_prev[:16]))
+            )
+
+        fsm.act("SEND",
+            source.stb.eq(1),
+            source.data.eq(frame_word),
+            source.eop.eq(tx_word == tx_last),
+            # the frame ends at byte 2 of the last word
+            If(source.eop,
+                source.last_be.eq(0b0100)
+            ),
+            If(source.ack,
+                tx_advance.eq(~reply_arp & (tx_word >= len(udp_words))),
+                NextValue(tx_word, tx_word + 1),
+                If(source.eop,
+                    NextValue(tx_word, 0),
+                    NextState("DONE")
+                )
+            )
+        )
+        fsm.act("DONE",
+            NextValue(rd_slot, rd_slot + 1),
+            NextState("IDLE")
+        )
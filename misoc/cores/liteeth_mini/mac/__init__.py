@@ -4,13 +4,15 @@ from misoc.interconnect.csr import *
 from misoc.cores.liteeth_mini.common import *
 from misoc.cores.liteeth_mini.mac.core import LiteEthMACCore
 from misoc.cores.liteeth_mini.mac.wishbone import LiteEthMACWishboneInterface
+from misoc.cores.liteeth_mini.etherbone import LiteEthEtherbone
 
 
 class LiteEthMAC(Module, AutoCSR):
     def __init__(self, phy, dw,
                  interface="wishbone",
                  endianness="big",
-                 with_preamble_crc=True):
+                 with_preamble_crc=True,
+                 mac_address=None, ip_address=None, udp_port=1234):
         self.submodules.core = LiteEthMACCore(phy, dw, endianness, with_preamble_crc)
         self.csrs = []
         if interface == "wishbone":
@@ -21,6 +23,17 @@ class LiteEthMAC(Module, AutoCSR):
             ]
             self.ev, self.bus = self.interface.sram.ev, self.interface.bus
             self.csrs = self.interface.get_csrs() + self.core.get_csrs()
+        elif interface == "etherbone":
+            if dw != 32:
+                raise ValueError("Etherbone requires a 32-bit MAC")
+            self.submodules.interface = LiteEthEtherbone(mac_address,
+                                                         ip_address, udp_port)
+            self.comb += [
+                self.interface.source.connect(self.core.sink),
+                self.core.source.connect(self.interface.sink)
+            ]
+            self.master = self.interface.master
+            self.csrs = self.core.get_csrs()
         else:
             raise NotImplementedError
 
@@ -0,0 +1,87 @@
+from migen import *
+from migen.genlib.cdc import MultiReg, BusSynchronizer
+
+from misoc.interconnect.csr import *
+
+
+class StreamMonitor(Module, AutoCSR):
+    """Measures the activity of a stream endpoint
+
+    Over each window of ``window`` cycles of ``clock_domain``, the domain
+    of the endpoint, counts the cycles with a transfer (``stb & ack``),
+    the cycles where the sink stalls the source (``stb & ~ack``), the idle
+    cycles (``~stb``) and the packets (transfers with ``eop``). The three
+    kinds of cycles add up to the window.
+
+    The counts of the last complete window are carried to the system clock
+    domain, and writing ``update`` latches them into their status
+    registers. The monitor only observes the endpoint.
+    """
+    def __init__(self, endpoint, clock_domain="sys", counter_bits=32,
+                 window=2**20):
+        self._window = CSRStorage(counter_bits, reset=window)
+        self._update = CSR()
+        self._transfers = CSRStatus(counter_bits)
+        self._stalls = CSRStatus(counter_bits)
+        self._idle = CSRStatus(counter_bits)
+        self._packets = CSRStatus(counter_bits)
+
+        ###
+
+        sync = getattr(self.sync, clock_domain)
+
+        window = Signal(counter_bits)
+        if clock_domain == "sys":
+            self.comb += window.eq(self._window.storage)
+        else:
+            self.specials += MultiReg(self._window.storage, window, clock_domain)
+
+        stb = Signal()
+        ack = Signal()
+        eop = Signal()
+        sync += [
+            stb.eq(endpoint.stb),
+            ack.eq(endpoint.ack),
+            eop.eq(endpoint.eop)
+        ]
+
+        # 1-bit signals, as ~stb would widen in the additions
+        events = [Signal() for i in range(4)]
+        self.comb += [
+            events[0].eq(stb & ack),
+            events[1].eq(stb & ~ack),
+            events[2].eq(~stb),
+            events[3].eq(stb & ack & eop)
+        ]
+        counters = [Signal(counter_bits) for event in events]
+        results = [Signal(counter_bits) for event in events]
+        count = Signal(counter_bits)
+        sync += \
+            If(count >= window - 1,
+                count.eq(0),
+                [result.eq(counter + event)
+                    for result, counter, event in zip(results, counters, events)],
+                [counter.eq(0) for counter in counters]
+            ).Else(
+                count.eq(count + 1),
+                [If(event, counter.eq(counter + 1))
+                    for counter, event in zip(counters, events)]
+            )
+
+        if clock_domain == "sys":
+            sys_results = results
+        else:
+            self.submodules.synchronizer = BusSynchronizer(
+                len(results)*counter_bits, clock_domain, "sys")
+            sys_results = [Signal(counter_bits) for result in results]
+            self.comb += [
+                self.synchronizer.i.eq(Cat(*results)),
+                Cat(*sys_results).eq(self.synchronizer.o)
+            ]
+
+        statuses = [self._transfers, self._stalls, self._idle, self._packets]
+        self.sync += \
+            If(self._update.re,
+                [status.status.eq(result)
+                    for status, result in zip(statuses, sys_results)]
+            )
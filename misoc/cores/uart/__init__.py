@@ -1 +1,2 @@
 from misoc.cores.uart.core import UART, RS232PHY
+from misoc.cores.uart.bridge import UARTWishboneBridge
@@ -0,0 +1,276 @@
+from migen import *
+from migen.genlib.misc import WaitTimer
+
+from misoc.interconnect import stream, wishbone
+from misoc.cores.liteeth_mini.mac.crc import LiteEthMACCRCEngine
+
+
+CMD_WRITE = 0x01
+CMD_READ = 0x02
+
+ACK_SUCCESS = ord("K")
+ACK_CRCERROR = ord("C")
+
+
+class UARTWishboneBridge(Module):
+    """Wishbone master controlled by binary commands over a UART
+
+    A command is a command byte (``CMD_WRITE`` or ``CMD_READ``), a length
+    byte giving the number of 32-bit words of the burst (0 stands for
+    256), the word address of the first word (4 bytes), and, for writes,
+    the data words. Multi-byte fields are most significant byte first.
+
+    Reads reply with the data words. Writes are buffered and performed
+    once the whole command has been received, and are not replied to.
+
+    With ``with_crc``, each command is followed by the CRC-16 (XMODEM,
+    as used by the serial boot loader) of its bytes. The bridge replies
+    ``ACK_CRCERROR`` to commands with a bad CRC and does not perform them.
+    Otherwise it replies ``ACK_SUCCESS``, followed by the data words and
+    their CRC-16 for reads, or after the data has been written for writes.
+
+    A command that is not completed within ``timeout`` seconds is
+    discarded.
+
+    The PHY receiver cannot be stalled and the bridge only buffers a few
+    bytes while it transmits, so hosts must wait for the reply to a command
+    before sending the next one. Writes without CRC can be sent
+    back-to-back.
+    """
+    def __init__(self, phy, clk_freq, with_crc=False, timeout=1e-2):
+        self.wishbone = wishbone.Interface()
+
+        # # #
+
+        rx_fifo = stream.SyncFIFO([("data", 8)], 16)
+        self.submodules += rx_fifo
+        self.comb += phy.source.connect(rx_fifo.sink)
+        rx = rx_fifo.source
+        tx = phy.sink
+
+        write_fifo = stream.SyncFIFO([("data", 32)], 256)
+        self.submodules += write_fifo
+
+        cmd = Signal(8)
+        length = Signal(8)
+        last_count = Signal(8)
+        count = Signal(8)
+        last_word = Signal()
+        byte_count = Signal(2)
+        address = Signal(30)
+        word = Signal(32)
+        self.comb += [
+            last_count.eq(length - 1),
+            last_word.eq(count == last_count)
+        ]
+
+        self.submodules.timer = timer = WaitTimer(int(timeout*clk_freq))
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        receiving = Signal()
+        self.comb += timer.wait.eq(receiving & ~rx.stb)
+
+        status = Signal(8)
+        if with_crc:
+            received_crc = Signal(16)
+            rx_crc = Signal(16)
+            tx_crc = Signal(16)
+            rx_crc_update = Signal()
+            tx_crc_update = Signal()
+            rx_crc_engine = LiteEthMACCRCEngine(8, 16, 0x1021)
+            tx_crc_engine = LiteEthMACCRCEngine(8, 16, 0x1021)
+            self.submodules += rx_crc_engine, tx_crc_engine
+            self.comb += [
+                # bytes are sent most significant bit first into the CRC
+                rx_crc_engine.data.eq(rx.data[::-1]),
+                If(fsm.ongoing("IDLE"),
+                    rx_crc_engine.last.eq(0)
+                ).Else(
+                    rx_crc_engine.last.eq(rx_crc)
+                ),
+                tx_crc_engine.data.eq(tx.data[::-1]),
+                tx_crc_engine.last.eq(tx_crc)
+            ]
+            self.sync += [
+                If(rx.stb & rx.ack & rx_crc_update,
+                    rx_crc.eq(rx_crc_engine.next)
+                ),
+                If(tx.stb & tx.ack & tx_crc_update,
+                    tx_crc.eq(tx_crc_engine.next)
+                )
+            ]
+            read_state = "CRC"
+        else:
+            rx_crc_update = Signal()
+            tx_crc_update = Signal()
+            read_state = "READ"
+
+        fsm.act("IDLE",
+            rx.ack.eq(1),
+            rx_crc_update.eq(1),
+            If(rx.stb & ((rx.data == CMD_WRITE) | (rx.data == CMD_READ)),
+                NextValue(cmd, rx.data),
+                NextState("LENGTH")
+            )
+        )
+        # discard partially received commands, and the data they have
+        # buffered, when the host stops sending
+        def timeout():
+            return If(timer.done & ~rx.stb,
+                NextValue(status, 0),
+                NextState("FLUSH")
+            )
+
+        fsm.act("LENGTH",
+            rx.ack.eq(1),
+            rx_crc_update.eq(1),
+            receiving.eq(1),
+            If(rx.stb,
+                NextValue(length, rx.data),
+                NextValue(byte_count, 0),
+                NextState("ADDRESS")
+            ),
+            timeout()
+        )
+        fsm.act("ADDRESS",
+            rx.ack.eq(1),
+            rx_crc_update.eq(1),
+            receiving.eq(1),
+            If(rx.stb,
+                NextValue(address, Cat(rx.data, address)),
+                NextValue(byte_count, byte_count + 1),
+                If(byte_count == 3,
+                    NextValue(count, 0),
+                    If(cmd == CMD_WRITE,
+                        NextState("WRITE_DATA")
+                    ).Else(
+                        NextState(read_state)
+                    )
+                )
+            ),
+            timeout()
+        )
+        fsm.act("WRITE_DATA",
+            rx.ack.eq(1),
+            rx_crc_update.eq(1),
+            receiving.eq(1),
+            write_fifo.sink.data.eq(Cat(rx.data, word)),
+            If(rx.stb,
+                NextValue(word, Cat(rx.data, word)),
+                NextValue(byte_count, byte_count + 1),
+                If(byte_count == 3,
+                    write_fifo.sink.stb.eq(1),
+                    NextValue(count, count + 1),
+                    If(last_word,
+                        NextState("CRC" if with_crc else "WRITE_BUS")
+                    )
+                )
+            ),
+            timeout()
+        )
+        fsm.act("WRITE_BUS",
+            self.wishbone.adr.eq(address),
+            self.wishbone.dat_w.eq(write_fifo.source.data),
+            self.wishbone.sel.eq(0xf),
+            self.wishbone.we.eq(1),
+            If(write_fifo.source.stb,
+                self.wishbone.cyc.eq(1),
+                self.wishbone.stb.eq(1),
+                If(self.wishbone.ack,
+                    write_fifo.source.ack.eq(1),
+                    NextValue(address, address + 1)
+                )
+            ).Else(
+                NextState("STATUS" if with_crc else "IDLE")
+            )
+        )
+        fsm.act("READ",
+            self.wishbone.adr.eq(address),
+            self.wishbone.cyc.eq(1),
+            self.wishbone.stb.eq(1),
+            If(self.wishbone.ack,
+                NextValue(word, self.wishbone.dat_r),
+                NextValue(address, address + 1),
+                NextValue(byte_count, 0),
+                NextState("SEND_WORD")
+            )
+        )
+        fsm.act("SEND_WORD",
+            tx.stb.eq(1),
+            tx.data.eq(word[24:]),
+            tx_crc_update.eq(1),
+            If(tx.ack,
+                NextValue(word, word << 8),
+                NextValue(byte_count, byte_count + 1),
+                If(byte_count == 3,
+                    NextValue(count, count + 1),
+                    If(last_word,
+                        NextState("SEND_CRC" if with_crc else "IDLE")
+                    ).Else(
+                        NextState("READ")
+                    )
+                )
+            )
+        )
+        if with_crc:
+            fsm.act("FLUSH",
+                write_fifo.source.ack.eq(1),
+                If(~write_fifo.source.stb,
+                    If(status == ACK_CRCERROR,
+                        NextState("STATUS")
+                    ).Else(
+                        NextState("IDLE")
+                    )
+                )
+            )
+            fsm.act("CRC",
+                rx.ack.eq(1),
+                receiving.eq(1),
+                If(rx.stb,
+                    NextValue(received_crc, Cat(rx.data, received_crc)),
+                    NextValue(byte_count, byte_count + 1),
+                    If(byte_count == 1,
+                        If(Cat(rx.data, received_crc[:8]) == rx_crc,
+                            NextValue(status, ACK_SUCCESS),
+                            If(cmd == CMD_WRITE,
+                                NextState("WRITE_BUS")
+                            ).Else(
+                                NextState("STATUS")
+                            )
+                        ).Else(
+                            NextValue(status, ACK_CRCERROR),
+                            NextState("FLUSH")
+                        )
+                    )
+                ),
+                timeout()
+            )
+            fsm.act("STATUS",
+                tx.stb.eq(1),
+                tx.data.eq(status),
+                If(tx.ack,
+                    NextValue(tx_crc, 0),
+                    If((status == ACK_SUCCESS) & (cmd == CMD_READ),
+                        NextState("READ")
+                    ).Else(
+                        NextState("IDLE")
+                    )
+                )
+            )
+            fsm.act("SEND_CRC",
+                tx.stb.eq(1),
+                tx.data.eq(Mux(byte_count[0], tx_crc[:8], tx_crc[8:])),
+                If(tx.ack,
+                    NextValue(byte_count, byte_count + 1),
+                    If(byte_count[0],
+                        NextState("IDLE")
+                    )
+                )
+            )
+        else:
+            fsm.act("FLUSH",
+                write_fifo.source.ack.eq(1),
+                If(~write_fifo.source.stb,
+                    NextState("IDLE")
+                )
+            )
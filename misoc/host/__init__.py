@@ -0,0 +1,3 @@
+from misoc.host.csr import CSRMap, Client
+from misoc.host.transport import Transport, SimulationTransport
+from misoc.host.etherbone import EtherboneTransport
@@ -0,0 +1,204 @@
+import csv
+
+
+class CSRMap:
+    """CSR map of a SoC, as written by ``Builder(csr_csv=...)``
+
+    ``registers`` maps register names to ``(address, nwords, mode)``,
+    where ``address`` is the byte address of the first (most significant)
+    CSR word and ``mode`` is ``"ro"`` or ``"rw"``. ``constants`` maps the
+    SoC constants to their values; they are only in the file if the SoC
+    was built with ``csr_csv_constants=True``. Without them, ``busword``
+    must be given if the CSR data width is not 8.
+    """
+    def __init__(self, registers, constants=dict(), busword=None):
+        self.registers = dict(registers)
+        self.constants = dict(constants)
+        if busword is None:
+            busword = self.constants.get("CONFIG_CSR_DATA_WIDTH", 8)
+        self.busword = busword
+
+    @classmethod
+    def from_csv(cls, filename, **kwargs):
+        with open(filename, newline="") as f:
+            return cls.from_lines(f, **kwargs)
+
+    @classmethod
+    def from_lines(cls, lines, **kwargs):
+        registers = dict()
+        constants = dict()
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            name, value, nwords, mode = row
+            if mode == "constant":
+                if value == "":
+                    value = None
+                else:
+                    try:
+                        value = int(value, 0)
+                    except ValueError:
+                        pass
+                constants[name] = value
+            else:
+                registers[name] = int(value, 0), int(nwords), mode
+        return cls(registers, constants, **kwargs)
+
+
+class Register:
+    def __init__(self, client, name, address, nwords, mode):
+        self.client = client
+        self.name = name
+        self.address = address
+        self.nwords = nwords
+        self.mode = mode
+
+    def read(self):
+        return self.client.read(self)
+
+    def write(self, value):
+        self.client.write(self, value)
+
+    def __repr__(self):
+        return "<Register {} @0x{:08x}>".format(self.name, self.address)
+
+
+class _Namespace:
+    def __init__(self, items):
+        self._items = items
+
+    def __getattr__(self, name):
+        try:
+            return self._items[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name):
+        return self._items[name]
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __dir__(self):
+        return sorted(self._items)
+
+
+class Pending:
+    """Result of a read issued within a batch, available once the batch
+    has been flushed"""
+    def __init__(self, busword, words):
+        self._busword = busword
+        self._words = words
+        self._value = None
+
+    @property
+    def done(self):
+        return self._value is not None
+
+    @property
+    def value(self):
+        if self._value is None:
+            raise ValueError("batch has not been flushed yet")
+        return self._value
+
+    def _complete(self, results):
+        value = 0
+        for operation, offset in self._words:
+            value = (value << self._busword) | results[operation][offset]
+        self._value = value
+
+
+class Client:
+    """Accesses the CSRs of a remote SoC through a transport
+
+    Registers are attributes of ``regs`` and constants attributes of
+    ``constants``; the latter are served from the CSR map and never
+    reach the transport.
+
+    All the CSR words of a register are accessed in a single transaction.
+    Within ``with client.batch():``, reads and writes are queued instead,
+    accesses to consecutive CSR words are coalesced into bursts, and
+    everything is sent in one transaction when the block exits; reads then
+    return ``Pending`` objects whose ``value`` is available afterwards.
+    """
+    def __init__(self, csr_map, transport):
+        self.csr_map = csr_map
+        self.transport = transport
+        self.busword = csr_map.busword
+        self.regs = _Namespace({
+            name: Register(self, name, address, nwords, mode)
+            for name, (address, nwords, mode) in csr_map.registers.items()})
+        self.constants = _Namespace(csr_map.constants)
+
+        self._batch_depth = 0
+        self._operations = []
+        self._pending = []
+
+    def _queue(self, kind, address, data=None):
+        # returns the operation and the offset within it
+        if self._operations:
+            last = self._operations[-1]
+            last_kind, last_address, last_data = last
+            length = last_data if last_kind == "read" else len(last_data)
+            if (last_kind == kind
+                    and last_address + 4*length == address
+                    and length < self.transport.max_burst):
+                if kind == "read":
+                    last[2] += 1
+                else:
+                    last_data.append(data)
+                return len(self._operations) - 1, length
+        self._operations.append([kind, address, 1 if kind == "read" else [data]])
+        return len(self._operations) - 1, 0
+
+    def read(self, register):
+        words = [self._queue("read", register.address + 4*i)
+                 for i in range(register.nwords)]
+        pending = Pending(self.busword, words)
+        self._pending.append(pending)
+        if self._batch_depth:
+            return pending
+        self.flush()
+        return pending.value
+
+    def write(self, register, value):
+        if register.mode == "ro":
+            raise ValueError("register {} is read-only".format(register.name))
+        mask = 2**self.busword - 1
+        for i in range(register.nwords):
+            shift = (register.nwords - 1 - i)*self.busword
+            self._queue("write", register.address + 4*i, (value >> shift) & mask)
+        if not self._batch_depth:
+            self.flush()
+
+    def flush(self):
+        if not self._operations:
+            return
+        operations = [tuple(operation) for operation in self._operations]
+        pending = self._pending
+        self._operations = []
+        self._pending = []
+        results = self.transport.transact(operations)
+        for p in pending:
+            p._complete(results)
+
+    def batch(self):
+        return _Batch(self)
+
+
+class _Batch:
+    def __init__(self, client):
+        self.client = client
+
+    def __enter__(self):
+        self.client._batch_depth += 1
+        return self.client
+
+    def __exit__(self, type, value, traceback):
+        self.client._batch_depth -= 1
+        if not self.client._batch_depth:
+            if type is None:
+                self.client.flush()
+            else:
+                self.client._operations = []
+                self.client._pending = []
@@ -0,0 +1,192 @@
+import socket
+import collections
+
+from misoc.host.transport import Transport
+
+
+EB_MAGIC = 0x4e6f
+EB_VERSION = 1
+EB_FLAG_PF = 0x1
+EB_FLAG_PR = 0x2
+EB_FLAG_NR = 0x4
+EB_SIZES = 0x44
+
+# UDP payload of a 1500-byte MTU
+MAX_PACKET = 1472
+
+
+class EtherboneError(Exception):
+    pass
+
+
+def encode_header(flags=0):
+    return (EB_MAGIC.to_bytes(2, "big")
+            + bytes([(EB_VERSION << 4) | flags, EB_SIZES]))
+
+
+def encode_record(write_address=0, write_values=[], return_address=0,
+                  read_addresses=[], byte_enable=0xf):
+    """Encodes a record writing ``write_values`` at consecutive words from
+    the byte address ``write_address``, then reading the byte addresses
+    ``read_addresses``, to be returned to ``return_address``."""
+    if len(write_values) > 255 or len(read_addresses) > 255:
+        raise ValueError("at most 255 writes and reads per record")
+    record = bytes([0, byte_enable, len(write_values), len(read_addresses)])
+    if write_values:
+        record += write_address.to_bytes(4, "big")
+        for value in write_values:
+            record += value.to_bytes(4, "big")
+    if read_addresses:
+        record += return_address.to_bytes(4, "big")
+        for address in read_addresses:
+            record += address.to_bytes(4, "big")
+    return record
+
+
+def decode_packet(data):
+    """Decodes an Etherbone packet into its header flags and a list of
+    records ``(write_address, write_values, return_address,
+    read_addresses)``."""
+    words = [int.from_bytes(data[i:i+4], "big")
+             for i in range(0, len(data) - len(data) % 4, 4)]
+    if not words or words[0] >> 16 != EB_MAGIC:
+        raise EtherboneError("not an Etherbone packet")
+    flags = (words[0] >> 8) & 0xf
+    records = []
+    i = 1
+    while i < len(words):
+        wcount = (words[i] >> 8) & 0xff
+        rcount = words[i] & 0xff
+        i += 1
+        write_address = write_values = return_address = read_addresses = None
+        if wcount:
+            write_address = words[i]
+            write_values = words[i+1:i+1+wcount]
+            i += 1 + wcount
+        if rcount:
+            return_address = words[i]
+            read_addresses = words[i+1:i+1+rcount]
+            i += 1 + rcount
+        if i > len(words):
+            raise EtherboneError("truncated record")
+        records.append((write_address, write_values or [],
+                        return_address, read_addresses or []))
+    return flags, records
+
+
+class EtherboneTransport(Transport):
+    """``misoc.host`` transport to a ``LiteEthEtherbone`` over UDP
+
+    ``host`` is a host name or an IPv4 address, resolved once. Each
+    operation becomes one Etherbone record, and records are packed into as
+    few packets as fit in ``max_packet`` bytes. Up to ``window``
+    packets are sent before waiting for the reply to the oldest one, which
+    should not exceed the number of receive buffers of the bridge.
+
+    Replies left over from an earlier transaction, e.g. one that timed out,
+    are discarded: the socket is drained before each transaction, and the
+    return addresses of the reads carry a transaction sequence number.
+
+    ``sock`` is a UDP socket, or an object with the same ``sendto``,
+    ``recvfrom`` and ``settimeout`` methods.
+    """
+    max_burst = 255
+    max_packet = MAX_PACKET
+
+    def __init__(self, host, port=1234, window=2, timeout=1.0, sock=None):
+        Transport.__init__(self)
+        self.address = (socket.gethostbyname(host), port)
+        self.window = window
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(timeout)
+        self.sock = sock
+        self.timeout = timeout
+        self.packets = 0
+        self._sequence = 0
+
+    def close(self):
+        self.sock.close()
+
+    def _receive(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except socket.timeout:
+                raise EtherboneError("no reply from {}:{}".format(*self.address))
+            if address == self.address:
+                return decode_packet(data)
+
+    def _drain(self):
+        self.sock.settimeout(0)
+        try:
+            while True:
+                self.sock.recvfrom(2048)
+        except (BlockingIOError, socket.timeout):
+            pass
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def probe(self):
+        """Returns whether the device answers Etherbone probes"""
+        self._drain()
+        self.sock.sendto(encode_header(EB_FLAG_PF), self.address)
+        flags, records = self._receive()
+        return bool(flags & EB_FLAG_PR)
+
+    def _transact(self, operations):
+        if len(operations) > 2**24:
+            raise ValueError("at most 2**24 operations per transaction")
+        self._drain()
+        self._sequence = (self._sequence + 1) % 2**8
+        # return addresses: sequence number and operation index
+        tag = self._sequence << 24
+
+        # packets as (payload, indices of the read operations)
+        packets = []
+        payload = encode_header()
+        reads = []
+        for i, (kind, address, data) in enumerate(operations):
+            if kind == "read":
+                record = encode_record(return_address=tag | i, read_addresses=
+                    [address + 4*j for j in range(data)])
+            else:
+                record = encode_record(address, data)
+            if len(payload) + len(record) > self.max_packet:
+                packets.append((payload, reads))
+                payload = encode_header()
+                reads = []
+            payload += record
+            if kind == "read":
+                reads.append(i)
+        packets.append((payload, reads))
+
+        results = [None]*len(operations)
+        outstanding = collections.deque()
+        def receive():
+            reads = outstanding.popleft()
+            # reads are returned as writes to their return address
+            while True:
+                flags, records = self._receive()
+                # replies to earlier transactions have reads of another
+                # sequence number, or none where reads are expected
+                stale = (bool(reads) and not records) or any(
+                    return_address is None or return_address >> 24 != self._sequence
+                    for return_address, _, _, _ in records)
+                if not stale:
+                    break
+            if len(records) != len(reads):
+                raise EtherboneError("unexpected reply")
+            for i, (return_address, values, _, _) in zip(reads, records):
+                if return_address != tag | i or len(values) != operations[i][2]:
+                    raise EtherboneError("unexpected reply")
+                results[i] = values
+        for payload, reads in packets:
+            if len(outstanding) == self.window:
+                receive()
+            self.sock.sendto(payload, self.address)
+            self.packets += 1
+            outstanding.append(reads)
+        while outstanding:
+            receive()
+        return results
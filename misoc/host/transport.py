@@ -0,0 +1,83 @@
+import threading
+import queue
+
+from migen import run_simulation, passive
+
+
+class Transport:
+    """Carries batches of CSR accesses to a SoC
+
+    ``transact`` receives a list of operations, each either
+    ``("read", address, count)`` or ``("write", address, values)``, where
+    ``address`` is the byte address of the first 32-bit bus word and
+    consecutive words are 4 bytes apart. It performs them in order as one
+    round trip, and returns a list with the values read by each operation
+    (``None`` for writes).
+    """
+    # longest burst of words in one operation
+    max_burst = 256
+
+    def __init__(self):
+        self.transactions = 0
+
+    def transact(self, operations):
+        self.transactions += 1
+        return self._transact(operations)
+
+    def _transact(self, operations):
+        raise NotImplementedError
+
+
+class SimulationTransport(Transport):
+    """Performs the operations with a Wishbone master in a Migen simulation
+
+    The host code passed to ``run`` executes in a separate thread while
+    the simulation runs; the simulation is stalled between transactions.
+    """
+    def __init__(self, bus):
+        Transport.__init__(self)
+        self.bus = bus
+        self.cycles = 0
+        self._requests = queue.Queue()
+        self._replies = queue.Queue()
+
+    def _transact(self, operations):
+        self._requests.put(operations)
+        return self._replies.get()
+
+    def generator(self):
+        while True:
+            operations = self._requests.get()
+            if operations is None:
+                return
+            results = []
+            for kind, address, data in operations:
+                if kind == "read":
+                    results.append((yield from self.bus.read_burst(address >> 2, data)))
+                else:
+                    yield from self.bus.write_burst(address >> 2, data)
+                    results.append(None)
+            self._replies.put(results)
+
+    @passive
+    def _count_cycles(self):
+        while True:
+            self.cycles += 1
+            yield
+
+    def run(self, dut, host):
+        error = None
+        def target():
+            nonlocal error
+            try:
+                host()
+            except BaseException as e:
+                error = e
+            finally:
+                self._requests.put(None)
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        run_simulation(dut, [self.generator(), self._count_cycles()])
+        thread.join()
+        if error is not None:
+            raise error
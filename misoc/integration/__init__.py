@@ -1,2 +1,8 @@
+import os
+
 from misoc.integration.soc_core import SoCCore
 from misoc.integration.soc_sdram import SoCSDRAM
+
+if os.environ.get("MISOC_PROFILE"):
+    from misoc.integration.profiler import _profile_process
+    _profile_process(os.environ["MISOC_PROFILE"])
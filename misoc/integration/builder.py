@@ -1,13 +1,18 @@
 import os
 import io
 import subprocess
-import struct
+import hashlib
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from misoc.integration import cpu_interface, soc_sdram, sdram_init
+from misoc.integration.mem_init import read_mem_words, write_mem_init
+from misoc.integration.profiler import phase
 
 
 __all__ = ["misoc_software_packages", "misoc_extra_software_packages",
-           "misoc_directory",
+           "misoc_software_dependencies", "misoc_directory",
            "Builder", "builder_args", "builder_argdict"]
 
 
@@ -27,6 +32,13 @@ misoc_extra_software_packages = [
 ]
 
 
+# Packages that must be compiled before a given package can be linked.
+# Packages not listed here do not depend on any other package.
+misoc_software_dependencies = {
+    "bios": ["libcompiler-rt", "libbase", "libnet"]
+}
+
+
 misoc_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 
@@ -53,11 +65,274 @@ class WriteGenerated(io.StringIO):
                 f.write(self.getvalue())
 
 
+# Files produced by the vendor toolchains that are kept in the gateware cache.
+_bitstream_extensions = [".bit", ".bin", ".sof", ".rbf", ".svf", ".jed", ".mcs"]
+
+
+# Files that Migen toolchains write next to the top-level Verilog and that
+# describe the build: constraints, and project and synthesis scripts.
+_input_extensions = [".ucf", ".xdc", ".sdc", ".pcf", ".lpf", ".qsf",
+                     ".prj", ".xst", ".ys", ".tcl"]
+
+# Extension of the $readmemh files of initialized memories, written by the
+# Verilog conversion or by Builder(mem_init_files=True).
+_mem_init_extension = ".init"
+
+
+class _GatewareCache:
+    """Content-addressed cache of gateware bitstreams.
+
+    An instance is passed as the ``run`` argument of the platform build.
+    Migen toolchains write all HDL, constraint and build script files into
+    the build directory and then test ``run`` to decide whether to invoke
+    the vendor tools. At that point, the contents of the top-level Verilog,
+    constraint and script files, of the memory initialization files and of
+    the external sources are hashed together with the toolchain options. If a bitstream was previously stored under this
+    hash in the ``cache`` subdirectory, it is copied back into the build
+    directory and the toolchain is not run.
+    """
+    def __init__(self, build_dir, build_name="top", options=None, sources=()):
+        self.build_dir = build_dir
+        self.build_name = build_name
+        self.options = options
+        self.sources = sources
+        self.cache_dir = os.path.join(build_dir, "cache")
+        self.digest = None
+        self.hit = None
+
+    def _input_files(self):
+        r = [self.build_name + ".v"]
+        r += [self.build_name + ext for ext in _input_extensions
+              if os.path.exists(os.path.join(self.build_dir, self.build_name + ext))]
+        r += sorted(name for name in os.listdir(self.build_dir)
+                    if name.endswith(_mem_init_extension))
+        return [os.path.join(self.build_dir, name) for name in r]
+
+    def compute_digest(self):
+        h = hashlib.sha256()
+        h.update(repr(self.options).encode())
+        for filename in self._input_files():
+            h.update(os.path.relpath(filename, self.build_dir).encode() + b"\0")
+            with open(filename, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        for filename, language, library in sorted(self.sources):
+            h.update(filename.encode() + b"\0")
+            with open(filename, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        return h.hexdigest()
+
+    def _entry_files(self, directory):
+        return [self.build_name + ext for ext in _bitstream_extensions
+                if os.path.exists(os.path.join(directory, self.build_name + ext))]
+
+    def lookup(self):
+        self.digest = self.compute_digest()
+        entry_dir = os.path.join(self.cache_dir, self.digest)
+        files = self._entry_files(entry_dir)
+        self.hit = bool(files)
+        for name in files:
+            shutil.copyfile(os.path.join(entry_dir, name),
+                            os.path.join(self.build_dir, name))
+        return self.hit
+
+    def store(self):
+        if self.hit or self.digest is None:
+            return
+        entry_dir = os.path.join(self.cache_dir, self.digest)
+        os.makedirs(entry_dir, exist_ok=True)
+        for name in self._entry_files(self.build_dir):
+            shutil.copyfile(os.path.join(self.build_dir, name),
+                            os.path.join(entry_dir, name))
+
+    def __bool__(self):
+        # evaluated by the toolchain once all input files are written
+        return not self.lookup()
+
+
+def _plain_data(value):
+    # representation of strings, numbers and containers of them that does
+    # not depend on the order of sets and dictionaries
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_plain_data(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(repr(_plain_data(v)) for v in value)
+    if isinstance(value, dict):
+        return sorted(((repr(_plain_data(k)), _plain_data(v))
+                       for k, v in value.items()), key=lambda kv: kv[0])
+    raise TypeError("Not plain data: {!r}".format(value))
+
+
+def _toolchain_options(toolchain):
+    """Returns the public attributes of ``toolchain`` that are plain data,
+    such as the command line options of the vendor tools, which Migen
+    toolchains may only write to their build scripts once ``run`` has
+    been tested."""
+    r = []
+    for name, value in sorted(vars(toolchain).items()):
+        if name.startswith("_"):
+            continue
+        try:
+            r.append((name, _plain_data(value)))
+        except TypeError:
+            # signals, HDL objects; they end up in the generated files
+            pass
+    return r
+
+
+def _run_scheduled(tasks, dependencies, fn, jobs):
+    """Calls ``fn(task, task_jobs)`` on each task once all the tasks it
+    depends on have completed, sharing ``jobs`` job slots between the tasks
+    that run at the same time.
+
+    When several tasks are ready, the free slots are split evenly between
+    them, each task getting at least one, and tasks are started in list
+    order. ``task_jobs`` is the number of slots of the task, which it gives
+    back when it completes. The first exception raised by ``fn`` is
+    re-raised after the running tasks are finished, and no further tasks
+    are started."""
+    done = set()
+    pending = list(tasks)
+    running = dict()
+    free = jobs
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            ready = [task for task in pending
+                     if all(d in done for d in dependencies.get(task, []))]
+            for i, task in enumerate(ready):
+                if free <= 0:
+                    break
+                task_jobs = max(1, free//(len(ready) - i))
+                free -= task_jobs
+                pending.remove(task)
+                running[executor.submit(fn, task, task_jobs)] = task, task_jobs
+            if not running:
+                raise ValueError("Unsatisfiable dependencies for: "
+                                 + ", ".join(pending))
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                task, task_jobs = running.pop(future)
+                free += task_jobs
+                if future.exception() is not None:
+                    wait(running.keys())
+                    raise future.exception()
+                done.add(task)
+
+
+# Directories of misoc/software outside of their own that packages are
+# compiled from.
+_software_extra_sources = {
+    "libcompiler-rt": [os.path.join("compiler_rt", "lib", "builtins")],
+    "libunwind": ["unwinder"]
+}
+
+
+def _hash_tree(h, directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            h.update(os.path.relpath(path, directory).encode() + b"\0")
+            with open(path, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+
+
+def _compiler_version(cpu_type):
+    mak = dict(cpu_interface.get_cpu_mak(cpu_type))
+    if mak["CLANG"]:
+        cmd = ["clang", "--version"]
+    else:
+        cmd = [mak["TRIPLE"] + "-gcc", "--version"]
+    try:
+        return subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        # the build itself reports the missing compiler
+        return b""
+
+
+class _SoftwareCache:
+    """Shares compiled software packages between builds.
+
+    Packages are stored in ``directory`` under a hash of the package name,
+    the contents of its source directory, the CPU flags, the version of the
+    compiler and the contents of the MiSoC and generated headers. A package
+    with the same hash is copied from the cache instead of being compiled.
+    Several processes can share the same directory, which must be given as
+    an absolute path.
+    """
+    def __init__(self, directory, cpu_type, generated_dir):
+        self.directory = directory
+        h = hashlib.sha256()
+        h.update(repr(cpu_interface.get_cpu_mak(cpu_type)).encode())
+        h.update(_compiler_version(cpu_type))
+        for name in sorted(os.listdir(generated_dir)):
+            # variables.mak contains the paths of this build
+            if name == "variables.mak":
+                continue
+            h.update(name.encode() + b"\0")
+            with open(os.path.join(generated_dir, name), "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        software_dir = os.path.join(misoc_directory, "software")
+        with open(os.path.join(software_dir, "common.mak"), "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+        _hash_tree(h, os.path.join(software_dir, "include"))
+        self._base = h.digest()
+
+    def key(self, name, src_dir):
+        h = hashlib.sha256(self._base)
+        h.update(name.encode() + b"\0" + src_dir.encode() + b"\0")
+        _hash_tree(h, src_dir)
+        for directory in _software_extra_sources.get(name, []):
+            h.update(directory.encode() + b"\0")
+            _hash_tree(h, os.path.join(misoc_directory, "software", directory))
+        return h.hexdigest()
+
+    def fetch(self, key, dst_dir):
+        entry_dir = os.path.join(self.directory, key)
+        if not os.path.isdir(entry_dir):
+            return False
+        for name in os.listdir(entry_dir):
+            shutil.copy2(os.path.join(entry_dir, name), dst_dir)
+        return True
+
+    def store(self, key, src_dir):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        for name in os.listdir(src_dir):
+            path = os.path.join(src_dir, name)
+            if name != "Makefile" and os.path.isfile(path) and not os.path.islink(path):
+                shutil.copy2(path, tmp_dir)
+        try:
+            os.rename(tmp_dir, os.path.join(self.directory, key))
+        except OSError:
+            # stored concurrently by another build
+            shutil.rmtree(tmp_dir)
+
+
+class _DeferredRun:
+    """Passed as the ``run`` argument of the platform build to call ``hook``
+    once the toolchain has written its input files, before it decides
+    (according to ``run``) whether to invoke the vendor tools."""
+    def __init__(self, hook, run):
+        self.hook = hook
+        self.run = run
+        self.result = None
+
+    def __bool__(self):
+        if self.result is None:
+            self.hook()
+            self.result = bool(self.run)
+        return self.result
+
+
 class Builder:
     def __init__(self, soc, output_dir=None,
                  compile_software=True, compile_gateware=True,
                  gateware_toolchain_path=None,
-                 csr_csv=None):
+                 csr_csv=None, csr_csv_constants=False, gateware_cache=False,
+                 jobs=1, pipelined=False, mem_init_files=False,
+                 software_cache=None):
         self.soc = soc
         if output_dir is None:
             output_dir = "misoc_{}_{}".format(
@@ -70,8 +345,19 @@ class Builder:
         self.compile_gateware = compile_gateware
         self.gateware_toolchain_path = gateware_toolchain_path
         self.csr_csv = csr_csv
+        self.csr_csv_constants = csr_csv_constants
+        self.gateware_cache = gateware_cache
+        self.jobs = jobs
+        self.pipelined = pipelined
+        self.mem_init_files = mem_init_files
+        # resolved before the gateware build changes the working directory,
+        # which it may do while the software is compiled
+        if software_cache is not None:
+            software_cache = os.path.abspath(software_cache)
+        self.software_cache = software_cache
 
         self.software_packages = []
+        self.software_dependencies = dict()
         for name in misoc_software_packages:
             self.add_software_package(name)
 
@@ -79,12 +365,29 @@ class Builder:
         for name in misoc_extra_software_packages:
             self.add_software_package(name)
 
-    def add_software_package(self, name, src_dir=None):
+    def add_software_package(self, name, src_dir=None, depends=None):
+        """Adds a software package to be compiled with ``make``.
+
+        ``depends`` lists the names of the packages that must be compiled
+        before this one. By default, MiSoC packages use
+        ``misoc_software_dependencies`` and external packages depend on all
+        packages added before them.
+        """
+        if depends is None:
+            if src_dir is None:
+                depends = misoc_software_dependencies.get(name, [])
+            else:
+                depends = [n for n, d in self.software_packages]
         if src_dir is None:
             src_dir = os.path.join(misoc_directory, "software", name)
         self.software_packages.append((name, src_dir))
+        self.software_dependencies[name] = list(depends)
 
     def _generate_includes(self):
+        with phase("include generation", "software"):
+            self._do_generate_includes()
+
+    def _do_generate_includes(self):
         cpu_type = self.soc.cpu_type
         memory_regions = self.soc.get_memory_regions()
         flash_boot_address = getattr(self.soc, "flash_boot_address", None)
@@ -133,9 +436,11 @@ class Builder:
 
         if self.csr_csv is not None:
             with open(self.csr_csv, "w") as f:
-                f.write(cpu_interface.get_csr_csv(csr_regions))
+                f.write(cpu_interface.get_csr_csv(csr_regions,
+                    constants if self.csr_csv_constants else []))
 
     def _generate_software(self):
+        src_dirs = dict(self.software_packages)
         for name, src_dir in self.software_packages:
             dst_dir = os.path.join(self.output_dir, "software", name)
             os.makedirs(dst_dir, exist_ok=True)
@@ -147,25 +452,93 @@ class Builder:
                 except FileNotFoundError:
                     pass
                 os.symlink(src, dst)
-            if self.compile_software:
-                if os.name != "nt":
-                    cmd = ["make", "-C", dst_dir]
-                else:
-                    cmd = ["make", "-C", dst_dir, "-f", src]
+
+        if self.software_cache is None:
+            cache = None
+        else:
+            cache = _SoftwareCache(self.software_cache, self.soc.cpu_type,
+                os.path.join(self.output_dir, "software", "include", "generated"))
+
+        def compile_package(name, jobs):
+            dst_dir = os.path.join(self.output_dir, "software", name)
+            # Only packages that do not link against other packages
+            # (libraries) are shared.
+            shared = cache is not None and not self.software_dependencies[name]
+            if shared:
+                key = cache.key(name, src_dirs[name])
+                if cache.fetch(key, dst_dir):
+                    return
+            cmd = ["make", "-C", dst_dir, "-j{}".format(jobs)]
+            if os.name == "nt":
+                cmd += ["-f", os.path.join(src_dirs[name], "Makefile")]
+            with phase("software package " + name, "software"):
                 subprocess.check_call(cmd)
+            if shared:
+                cache.store(key, dst_dir)
 
-    def _initialize_rom(self):
+        if self.compile_software:
+            _run_scheduled([name for name, src_dir in self.software_packages],
+                           self.software_dependencies, compile_package,
+                           self.jobs)
+
+    def _read_rom_data(self):
         bios_file = os.path.join(self.output_dir, "software", "bios",
                                  "bios.bin")
+        boot_data = read_mem_words(bios_file)
+        if len(boot_data)*4 > self.soc.integrated_rom_size:
+            raise ValueError("BIOS ({} bytes) does not fit in the integrated "
+                             "ROM ({} bytes)".format(len(boot_data)*4,
+                                                     self.soc.integrated_rom_size))
+        return boot_data
+
+    def _initialize_rom(self):
+        if self.soc.integrated_rom_size:
+            self.soc.initialize_rom(self._read_rom_data().tolist())
+
+    def _build_gateware(self, before_run=None):
+        if self.gateware_toolchain_path is None:
+            kwargs = dict()
+        else:
+            kwargs = {"toolchain_path": self.gateware_toolchain_path}
+        build_dir = os.path.join(self.output_dir, "gateware")
+        if self.mem_init_files:
+            self.soc.externalize_mem_init(build_dir)
+        cache = None
+        run = self.compile_gateware
+        if self.compile_gateware and self.gateware_cache:
+            platform = self.soc.platform
+            toolchain = getattr(platform, "toolchain", platform)
+            options = (platform.device, type(toolchain).__name__,
+                       _toolchain_options(toolchain), sorted(kwargs.items()))
+            cache = _GatewareCache(build_dir, options=options,
+                                   sources=platform.sources)
+            run = cache
+        if before_run is not None:
+            run = _DeferredRun(before_run, run)
+        with phase("gateware build", "gateware"):
+            self.soc.build(build_dir=build_dir, run=run, **kwargs)
+        if cache is not None:
+            cache.store()
+
+    def _build_pipelined(self):
+        # The HDL is generated while the software compiles. The integrated
+        # ROM loads the BIOS from a file that is written once the software
+        # is compiled, just before the vendor tools are run.
+        rom_init_file = "rom.init"
+        build_dir = os.path.join(self.output_dir, "gateware")
         if self.soc.integrated_rom_size:
-            with open(bios_file, "rb") as boot_file:
-                boot_data = []
-                while True:
-                    w = boot_file.read(4)
-                    if not w:
-                        break
-                    boot_data.append(struct.unpack(">I", w)[0])
-            self.soc.initialize_rom(boot_data)
+            self.soc.set_rom_init_file(rom_init_file)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            software = executor.submit(self._generate_software)
+
+            def initialize_rom():
+                software.result()
+                if self.soc.integrated_rom_size:
+                    write_mem_init(os.path.join(build_dir, rom_init_file),
+                                   self._read_rom_data())
+            self._build_gateware(initialize_rom)
+            software.result()
 
     def build(self):
         self.soc.finalize()
@@ -175,14 +548,12 @@ class Builder:
                              "intitialize integrated ROM")
 
         self._generate_includes()
-        self._generate_software()
-        self._initialize_rom()
-        if self.gateware_toolchain_path is None:
-            kwargs = dict()
+        if self.pipelined:
+            self._build_pipelined()
         else:
-            kwargs = {"toolchain_path": self.gateware_toolchain_path}
-        self.soc.build(build_dir=os.path.join(self.output_dir, "gateware"),
-                       run=self.compile_gateware, **kwargs)
+            self._generate_software()
+            self._initialize_rom()
+            self._build_gateware()
 
 
 def builder_args(parser):
@@ -201,6 +572,29 @@ def builder_args(parser):
     parser.add_argument("--csr-csv", default=None,
                         help="store CSR map in CSV format into the "
                              "specified file")
+    parser.add_argument("--csr-csv-constants", action="store_true",
+                        help="also store the SoC constants in the CSR map, "
+                             "as rows of the form 'name,value,,constant'")
+    parser.add_argument("--gateware-cache", action="store_true",
+                        help="reuse the bitstream of a previous build if the "
+                             "generated HDL, constraints and toolchain "
+                             "options are unchanged")
+    parser.add_argument("--jobs", default=1, type=int,
+                        help="number of make jobs to run in parallel, "
+                             "shared between the software packages that "
+                             "are compiled at the same time")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="compile the software while the HDL is being "
+                             "generated and load the BIOS into the "
+                             "integrated ROM from an external file")
+    parser.add_argument("--mem-init-files", action="store_true",
+                        help="load the contents of the integrated memories "
+                             "from $readmemh files instead of embedding them "
+                             "in the HDL")
+    parser.add_argument("--software-cache", default=None,
+                        help="directory where compiled software libraries "
+                             "are shared between builds with the same CPU, "
+                             "compiler, sources and generated headers")
 
 
 def builder_argdict(args):
@@ -209,5 +603,11 @@ def builder_argdict(args):
         "compile_software": not args.no_compile_software,
         "compile_gateware": not args.no_compile_gateware,
         "gateware_toolchain_path": args.gateware_toolchain_path,
-        "csr_csv": args.csr_csv
+        "csr_csv": args.csr_csv,
+        "csr_csv_constants": args.csr_csv_constants,
+        "gateware_cache": args.gateware_cache,
+        "jobs": args.jobs,
+        "pipelined": args.pipelined,
+        "mem_init_files": args.mem_init_files,
+        "software_cache": args.software_cache
     }
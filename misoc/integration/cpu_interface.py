@@ -81,7 +81,7 @@ def _get_rw_functions_c(reg_name, reg_base, nwords, busword, read_only, with_acc
 
     if with_access_functions:
         r += "static inline "+ctype+" "+reg_name+"_read(void) {\n"
-        if size > 1:
+        if nwords > 1:
             r += "\t"+ctype+" r = MMPTR("+hex(reg_base)+");\n"
             for byte in range(1, nwords):
                 r += "\tr <<= "+str(busword)+";\n\tr |= MMPTR("+hex(reg_base+4*byte)+");\n"
@@ -102,13 +102,105 @@ def _get_rw_functions_c(reg_name, reg_base, nwords, busword, read_only, with_acc
     return r
 
 
+def _get_mem_ctype(width):
+    if width > 64:
+        return None
+    elif width > 32:
+        return "unsigned long long int"
+    elif width > 16:
+        return "unsigned int"
+    elif width > 8:
+        return "unsigned short int"
+    else:
+        return "unsigned char"
+
+
+def _get_page_csrs(regions):
+    # maps the names of CSR memories to (bank, page CSR), for memories
+    # spanning several pages of the CSR bank address space
+    r = dict()
+    for name, origin, busword, obj in regions:
+        if not isinstance(obj, Memory):
+            for csr in obj:
+                r[name + "_" + csr.name] = (name, csr)
+    return {name: r[name + "_page"]
+            for name, origin, busword, obj in regions
+            if isinstance(obj, Memory) and name + "_page" in r}
+
+
+# CSR memories are accessed in blocks of memory words. Each memory word
+# spans one or more (most significant first) CSR words, with a stride of
+# 4 bytes, and a page register selects a 512 CSR word window into memories
+# larger than that.
+def _get_mem_functions_c(name, origin, busword, memory, paged):
+    ctype = _get_mem_ctype(memory.width)
+    if ctype is None:
+        return ""
+    csrw = (memory.width + busword - 1)//busword
+    words_per_page = 512//csrw
+    stride = str(csrw)+"*" if csrw > 1 else ""
+
+    def loop(access_word, variables=""):
+        r  = "\tvolatile unsigned int *p;\n"
+        r += "\tunsigned int n;\n"
+        r += variables
+        r += "\twhile(len) {\n"
+        if paged:
+            r += "\t\t"+name+"_page_write(offset/"+str(words_per_page)+");\n"
+            r += "\t\tp = (volatile unsigned int *)"+hex(origin)+" + "+ \
+                stride+"(offset % "+str(words_per_page)+");\n"
+            r += "\t\tn = "+str(words_per_page)+" - offset % "+str(words_per_page)+";\n"
+            r += "\t\tif(n > len)\n\t\t\tn = len;\n"
+        else:
+            r += "\t\tp = (volatile unsigned int *)"+hex(origin)+" + "+stride+"offset;\n"
+            r += "\t\tn = len;\n"
+        r += "\t\toffset += n;\n\t\tlen -= n;\n"
+        if csrw == 1:
+            r += "\t\tfor(; n >= 4; n -= 4) {\n"
+            for i in range(4):
+                r += "\t\t\t"+access_word(i)+"\n"
+            r += "\t\t\tbuf += 4;\n\t\t\tp += 4;\n\t\t}\n"
+        r += "\t\tfor(; n; n--) {\n"
+        r += "\t\t\t"+access_word(0)+"\n"
+        r += "\t\t\tbuf++;\n\t\t\tp += "+str(csrw)+";\n\t\t}\n"
+        r += "\t}\n"
+        return r
+
+    def read_word(i):
+        if csrw == 1:
+            return "buf["+str(i)+"] = p["+str(i)+"];"
+        r = "v = p[0];"
+        for k in range(1, csrw):
+            r += " v <<= "+str(busword)+"; v |= p["+str(k)+"];"
+        return r + " buf[0] = v;"
+
+    def write_word(i):
+        if csrw == 1:
+            return "p["+str(i)+"] = buf["+str(i)+"];"
+        return " ".join("p["+str(k)+"] = buf[0]"+
+                        (" >> "+str((csrw-k-1)*busword) if k != csrw-1 else "")+";"
+                        for k in range(csrw))
+
+    r  = "static inline void "+name+"_read_block(unsigned int offset, "+ctype+" *buf, unsigned int len) {\n"
+    r += loop(read_word, "\t"+ctype+" v;\n" if csrw > 1 else "")
+    r += "}\n"
+    r += "static inline void "+name+"_write_block(unsigned int offset, const "+ctype+" *buf, unsigned int len) {\n"
+    r += loop(write_word)
+    r += "}\n"
+    return r
+
+
 def get_csr_header(regions, constants, with_access_functions=True):
     r = "#ifndef __GENERATED_CSR_H\n#define __GENERATED_CSR_H\n"
     if with_access_functions:
         r += "#include <hw/common.h>\n"
+    page_csrs = _get_page_csrs(regions)
     for name, origin, busword, obj in regions:
         if isinstance(obj, Memory):
             r += "#define CSR_"+name.upper()+"_BASE "+hex(origin)+"\n"
+            if with_access_functions:
+                r += _get_mem_functions_c(name, origin, busword, obj,
+                                          name in page_csrs)
         else:
             r += "\n/* "+name+" */\n"
             r += "#define CSR_"+name.upper()+"_BASE "+hex(origin)+"\n"
@@ -136,25 +228,30 @@ def get_csr_header(regions, constants, with_access_functions=True):
     return r
 
 
+def _get_rstype(size):
+    if size > 64:
+        return None
+    elif size > 32:
+        return "u64"
+    elif size > 16:
+        return "u32"
+    elif size > 8:
+        return "u16"
+    elif size > 1:
+        return "u8"
+    else:
+        return "bool"
+
+
 def _get_rw_functions_rs(reg_name, reg_base, nwords, busword, read_only):
     r = ""
 
     r += "    pub const "+reg_name.upper()+"_ADDR: *mut u32 = "+hex(reg_base)+" as *mut u32;\n"
     r += "    pub const "+reg_name.upper()+"_SIZE: usize = "+str(nwords)+";\n\n"
 
-    size = nwords*busword
-    if size > 64:
+    rstype = _get_rstype(nwords*busword)
+    if rstype is None:
         return r
-    elif size > 32:
-        rstype = "u64"
-    elif size > 16:
-        rstype = "u32"
-    elif size > 8:
-        rstype = "u16"
-    elif size > 1:
-        rstype = "u8"
-    else:
-        rstype = "bool"
 
     rsname = reg_name.upper()+"_ADDR"
 
@@ -185,15 +282,96 @@ def _get_rw_functions_rs(reg_name, reg_base, nwords, busword, read_only):
     return r
 
 
+def _get_mem_functions_rs(name, busword, memory, page_csr):
+    # see _get_mem_functions_c
+    rstype = _get_rstype(max(memory.width, 8))
+    if rstype is None:
+        return ""
+    csrw = (memory.width + busword - 1)//busword
+    words_per_page = 512//csrw
+    base = "super::"+name.upper()+"_BASE"
+
+    def loop(access_word):
+        r  = "      let mut offset = offset;\n"
+        r += "      let mut i = 0;\n"
+        r += "      while i < buf.len() {\n"
+        if page_csr is not None:
+            bank, csr = page_csr
+            page_rstype = _get_rstype(((csr.size + busword - 1)//busword)*busword)
+            r += "        super::"+bank+"::"+csr.name+"_write((offset / "+ \
+                str(words_per_page)+") as "+page_rstype+");\n"
+            r += "        let p = "+base+".offset(("+str(csrw)+"*(offset % "+ \
+                str(words_per_page)+")) as isize);\n"
+            r += "        let n = core::cmp::min(buf.len() - i, "+str(words_per_page)+ \
+                " - offset % "+str(words_per_page)+");\n"
+        else:
+            r += "        let p = "+base+".offset(("+str(csrw)+"*offset) as isize);\n"
+            r += "        let n = buf.len() - i;\n"
+        r += "        let mut j = 0;\n"
+        if csrw == 1:
+            r += "        while j + 4 <= n {\n"
+            for k in range(4):
+                r += "          "+access_word(k)+"\n"
+            r += "          j += 4;\n"
+            r += "        }\n"
+        r += "        while j < n {\n"
+        r += "          "+access_word(0)+"\n"
+        r += "          j += 1;\n"
+        r += "        }\n"
+        r += "        i += n;\n"
+        r += "        offset += n;\n"
+        r += "      }\n"
+        return r
+
+    def index(k):
+        return "j + "+str(k) if k else "j"
+
+    def read_word(k):
+        if csrw == 1:
+            return "buf[i + "+index(k)+"] = read_volatile(p.offset(("+index(k)+") as isize)) as "+rstype+";"
+        r = "let q = p.offset(("+str(csrw)+"*j) as isize); "
+        r += "let v = read_volatile(q) as "+rstype+"; "
+        for w in range(1, csrw):
+            r += "let v = v << "+str(busword)+" | read_volatile(q.offset("+str(w)+")) as "+rstype+"; "
+        return r + "buf[i + j] = v;"
+
+    def write_word(k):
+        if csrw == 1:
+            return "write_volatile(p.offset(("+index(k)+") as isize), buf[i + "+index(k)+"] as u32);"
+        r = "let q = p.offset(("+str(csrw)+"*j) as isize);"
+        for w in range(csrw):
+            shift = (csrw-w-1)*busword
+            value = "buf[i + j] >> "+str(shift) if shift else "buf[i + j]"
+            r += " write_volatile(q.offset("+str(w)+"), ("+value+") as u32);"
+        return r
+
+    r  = "  pub mod "+name+" {\n"
+    r += "    use core::ptr::{read_volatile, write_volatile};\n\n"
+    r += "    #[inline(always)]\n"
+    r += "    pub unsafe fn read_block(offset: usize, buf: &mut ["+rstype+"]) {\n"
+    r += loop(read_word)
+    r += "    }\n\n"
+    r += "    #[inline(always)]\n"
+    r += "    pub unsafe fn write_block(offset: usize, buf: &["+rstype+"]) {\n"
+    r += loop(write_word)
+    r += "    }\n"
+    r += "  }\n\n"
+    return r
+
+
 def get_csr_rust(regions, constants, with_access_functions=True):
     r  = "// Include this file as:\n"
     r += "//     include!(concat!(env!(\"BUILDINC_DIRECTORY\"), \"/generated/csr.rs\"));\n"
     r += "#[allow(dead_code)]\n"
     r += "pub mod csr {\n"
 
+    page_csrs = _get_page_csrs(regions)
     for name, origin, busword, obj in regions:
         r += "  pub const "+name.upper()+"_BASE: *mut u32 = "+hex(origin)+" as *mut u32;\n"
-        if not isinstance(obj, Memory):
+        if isinstance(obj, Memory):
+            r += "\n"
+            r += _get_mem_functions_rs(name, busword, obj, page_csrs.get(name))
+        else:
             r += "\n"
             r += "  pub mod "+name+" {\n"
             r += "    use core::ptr::{read_volatile, write_volatile};\n\n"
@@ -233,7 +411,10 @@ def get_rust_cfg(regions, constants):
     return r
 
 
-def get_csr_csv(regions):
+def get_csr_csv(regions, constants=[]):
+    # Registers are "name,address,nwords,mode" rows. Constants, if any, are
+    # appended as "name,value,,constant" rows, which consumers of the
+    # register-only format must skip.
     r = ""
     for name, origin, busword, obj in regions:
         if not isinstance(obj, Memory):
@@ -241,4 +422,10 @@ def get_csr_csv(regions):
                 nr = (csr.size + busword - 1)//busword
                 r += "{}_{},0x{:08x},{},{}\n".format(name, csr.name, origin, nr, "ro" if isinstance(csr, CSRStatus) else "rw")
                 origin += 4*nr
+    for name, value in constants:
+        if value is None:
+            value = ""
+        elif isinstance(value, str):
+            value = "\"" + value.replace("\"", "\"\"") + "\""
+        r += "{},{},,constant\n".format(name, value)
     return r
@@ -0,0 +1,83 @@
+import sys
+import array
+
+from migen import *
+
+
+__all__ = ["FileInitMemory", "read_mem_words", "write_mem_init"]
+
+
+class FileInitMemory(Memory):
+    """Memory whose contents can be loaded from an external file.
+
+    When ``init_file`` is set, the generated Verilog loads the memory with
+    ``$readmemh`` from that file (relative to the gateware build directory)
+    instead of embedding the contents in the HDL. The file can then be
+    written or replaced after the HDL has been generated, e.g. with
+    ``write_mem_init``. When ``init_file`` is ``None``, the memory behaves
+    like a regular ``Memory``.
+    """
+    def __init__(self, *args, init_file=None, **kwargs):
+        Memory.__init__(self, *args, **kwargs)
+        self.init_file = init_file
+
+    @staticmethod
+    def emit_verilog(memory, ns, *args):
+        if memory.init_file is None:
+            return Memory.emit_verilog(memory, ns, *args)
+
+        init = memory.init
+        memory.init = None
+        try:
+            r = Memory.emit_verilog(memory, ns, *args)
+        finally:
+            memory.init = init
+        r += "initial begin\n"
+        r += "\t$readmemh(\"" + memory.init_file + "\", " + ns.get_name(memory) + ");\n"
+        r += "end\n\n"
+        return r
+
+
+def _word_typecode(width):
+    for typecode in "BHILQ":
+        if array.array(typecode).itemsize*8 == width:
+            return typecode
+    raise ValueError("Unsupported word width: {}".format(width))
+
+
+def read_mem_words(filename, width=32, byteorder="big"):
+    """Reads a binary file into an ``array`` of ``width``-bit words.
+
+    The file is padded with zeros to a whole number of words.
+    """
+    typecode = _word_typecode(width)
+    with open(filename, "rb") as f:
+        data = f.read()
+    nbytes = width//8
+    if len(data) % nbytes:
+        data += bytes(nbytes - len(data) % nbytes)
+    words = array.array(typecode)
+    words.frombytes(data)
+    if byteorder != sys.byteorder:
+        words.byteswap()
+    return words
+
+
+def write_mem_init(filename, data, width=32):
+    """Writes the words in ``data`` to ``filename`` in ``$readmemh`` format."""
+    digits = (width + 3)//4
+    try:
+        words = array.array(_word_typecode(width), data)
+    except (ValueError, OverflowError):
+        words = None
+    if words is not None:
+        # convert to big endian in bulk and let bytes.hex() do the formatting
+        if sys.byteorder == "little":
+            words.byteswap()
+        h = words.tobytes().hex()
+        content = "".join(h[i:i+digits] + "\n" for i in range(0, len(h), digits))
+    else:
+        formatter = "{:0" + str(digits) + "x}\n"
+        content = "".join(formatter.format(d) for d in data)
+    with open(filename, "w") as f:
+        f.write(content)
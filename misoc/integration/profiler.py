@@ -0,0 +1,228 @@
+"""
+Elaboration profiler
+********************
+
+Opt-in instrumentation that measures where time goes while a SoC is
+constructed, finalized, converted to HDL and while its software is built.
+
+Each phase records its wall time and the number of memory blocks allocated
+by the Python interpreter (net of those freed). With ``trace_memory``,
+the net number of bytes allocated is also measured with ``tracemalloc``.
+
+Instrumented phases:
+
+ * ``SoCCore.__init__``,
+ * the ``do_finalize`` method of every module that defines one,
+ * ``CSRBankArray.scan``,
+ * HDL conversion (``migen.fhdl.verilog.convert``),
+ * include generation and each software package in ``Builder``.
+
+Usage::
+
+    with Profiler() as profiler:
+        soc = BaseSoC()
+        Builder(soc).build()
+    print(profiler.report())
+    profiler.write_trace("trace.json")
+
+The trace can be loaded into ``chrome://tracing``. Setting the
+``MISOC_PROFILE`` environment variable to a file name profiles the whole
+process, prints the report and writes the trace to that file at exit.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+from functools import wraps
+
+from migen import Module
+from migen.fhdl import verilog
+
+
+__all__ = ["Profiler", "phase"]
+
+
+_active = None
+
+
+class _Event:
+    def __init__(self, name, category, tid, start):
+        self.name = name
+        self.category = category
+        self.tid = tid
+        self.start = start
+        self.duration = 0.0
+        self.children_duration = 0.0
+        self.blocks = 0
+        self.bytes = None
+
+
+class Profiler:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.events = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._patches = []
+        self._t0 = None
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    @contextmanager
+    def phase(self, name, category="misoc"):
+        stack = self._stack()
+        event = _Event(name, category, threading.get_ident(),
+                       time.perf_counter() - self._t0)
+        stack.append(event)
+        blocks = sys.getallocatedblocks()
+        if self.trace_memory:
+            traced = tracemalloc.get_traced_memory()[0]
+        try:
+            yield event
+        finally:
+            event.duration = time.perf_counter() - self._t0 - event.start
+            event.blocks = sys.getallocatedblocks() - blocks
+            if self.trace_memory:
+                event.bytes = tracemalloc.get_traced_memory()[0] - traced
+            stack.pop()
+            if stack:
+                stack[-1].children_duration += event.duration
+            with self._lock:
+                self.events.append(event)
+
+    def _wrap(self, obj, attr, name_fn, category):
+        original = getattr(obj, attr)
+        profiler = self
+
+        @wraps(original)
+        def wrapper(*args, **kwargs):
+            name = name_fn(*args)
+            if name is None:
+                return original(*args, **kwargs)
+            with profiler.phase(name, category):
+                return original(*args, **kwargs)
+        setattr(obj, attr, wrapper)
+        self._patches.append((obj, attr, original))
+
+    def _instrument(self):
+        from misoc.integration.soc_core import SoCCore
+        from misoc.interconnect.csr_bus import CSRBankArray
+
+        def finalize_name(module, *args):
+            if module.finalized or type(module).do_finalize is Module.do_finalize:
+                return None
+            return type(module).__name__ + ".do_finalize"
+
+        self._wrap(SoCCore, "__init__", lambda *args: "SoCCore.__init__", "elaboration")
+        self._wrap(Module, "finalize", finalize_name, "finalization")
+        self._wrap(CSRBankArray, "scan", lambda *args: "CSRBankArray.scan", "finalization")
+        self._wrap(verilog, "convert", lambda *args: "HDL conversion", "conversion")
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise ValueError("A profiler is already active")
+        _active = self
+        self._t0 = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._stop_tracemalloc = True
+        else:
+            self._stop_tracemalloc = False
+        self._instrument()
+
+    def stop(self):
+        global _active
+        for obj, attr, original in reversed(self._patches):
+            setattr(obj, attr, original)
+        self._patches = []
+        if self._stop_tracemalloc:
+            tracemalloc.stop()
+        _active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def summary(self):
+        """Returns a list of ``(name, count, total, self_time, blocks,
+        bytes)`` tuples, sorted by decreasing self time."""
+        r = OrderedDict()
+        for e in self.events:
+            count, total, self_time, blocks, nbytes = r.get(e.name, (0, 0.0, 0.0, 0, None))
+            if e.bytes is not None:
+                nbytes = (nbytes or 0) + e.bytes
+            r[e.name] = (count + 1, total + e.duration,
+                         self_time + e.duration - e.children_duration,
+                         blocks + e.blocks, nbytes)
+        r = [(name, ) + v for name, v in r.items()]
+        r.sort(key=lambda x: x[3], reverse=True)
+        return r
+
+    def report(self):
+        r = "{:<40} {:>6} {:>10} {:>10} {:>10} {:>12}\n".format(
+            "phase", "count", "total (s)", "self (s)", "blocks", "bytes")
+        for name, count, total, self_time, blocks, nbytes in self.summary():
+            r += "{:<40} {:>6} {:>10.3f} {:>10.3f} {:>10} {:>12}\n".format(
+                name, count, total, self_time, blocks,
+                "" if nbytes is None else nbytes)
+        return r
+
+    def get_trace(self):
+        pid = os.getpid()
+        events = []
+        for e in sorted(self.events, key=lambda e: e.start):
+            args = {"blocks": e.blocks}
+            if e.bytes is not None:
+                args["bytes"] = e.bytes
+            events.append({
+                "name": e.name,
+                "cat": e.category,
+                "ph": "X",
+                "ts": e.start*1e6,
+                "dur": e.duration*1e6,
+                "pid": pid,
+                "tid": e.tid,
+                "args": args
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.get_trace(), f)
+
+
+@contextmanager
+def phase(name, category="misoc"):
+    """Records ``name`` as a phase of the active profiler, if any."""
+    profiler = _active
+    if profiler is None:
+        yield None
+    else:
+        with profiler.phase(name, category) as event:
+            yield event
+
+
+def _profile_process(filename):
+    profiler = Profiler()
+    profiler.start()
+
+    def finish():
+        profiler.stop()
+        sys.stderr.write(profiler.report())
+        profiler.write_trace(filename)
+    atexit.register(finish)
@@ -36,7 +36,12 @@ static void command_p{n}(int cmd)
     #
     # sdrrd/sdrwr functions utilities
     #
-    r += "#define DFII_PIX_DATA_SIZE CSR_DFII_PI0_WRDATA_SIZE\n"
+    # The phase data registers span several CSR words, most significant
+    # first. Bytes are accessed through helpers that work with any CSR
+    # data width.
+    r += "#ifndef CONFIG_CSR_DATA_WIDTH\n#define CONFIG_CSR_DATA_WIDTH 8\n#endif\n"
+    r += "#define DFII_PIX_DATA_BITS "+str(sdram_phy_settings.dfi_databits)+"\n"
+    r += "#define DFII_PIX_DATA_SIZE (DFII_PIX_DATA_BITS/8)\n"
     dfii_pix_wrdata_addr = []
     for n in range(nphases):
         dfii_pix_wrdata_addr.append("CSR_DFII_PI{n}_WRDATA_ADDR".format(n=n))
@@ -54,6 +59,30 @@ const unsigned int dfii_pix_rddata_addr[{n}] = {{
     {dfii_pix_rddata_addr}
 }};
 """.format(n=nphases, dfii_pix_rddata_addr=",\n\t".join(dfii_pix_rddata_addr))
+    r += """
+static inline unsigned int dfii_pix_data_addr(unsigned int base, int byte)
+{
+    int bit = DFII_PIX_DATA_BITS - 8*(byte + 1);
+    return base + 4*(CSR_DFII_PI0_WRDATA_SIZE - 1 - bit/CONFIG_CSR_DATA_WIDTH);
+}
+
+static inline int dfii_pix_data_shift(int byte)
+{
+    return (DFII_PIX_DATA_BITS - 8*(byte + 1)) % CONFIG_CSR_DATA_WIDTH;
+}
+
+static inline unsigned char dfii_pix_rddata_read(int phase, int byte)
+{
+    return MMPTR(dfii_pix_data_addr(dfii_pix_rddata_addr[phase], byte)) >> dfii_pix_data_shift(byte);
+}
+
+static inline void dfii_pix_wrdata_write(int phase, int byte, unsigned char value)
+{
+    unsigned int addr = dfii_pix_data_addr(dfii_pix_wrdata_addr[phase], byte);
+    int shift = dfii_pix_data_shift(byte);
+    MMPTR(addr) = (MMPTR(addr) & ~(0xffU << shift)) | ((unsigned int)value << shift);
+}
+"""
     r += "\n"
 
     # init sequence
@@ -1,9 +1,11 @@
+import os
 from operator import itemgetter
 
 from migen import *
 
 from misoc.cores import lm32, mor1kx, tmpu, identifier, timer, uart
 from misoc.interconnect import wishbone, csr_bus, wishbone2csr
+from misoc.integration.mem_init import FileInitMemory, write_mem_init
 
 
 __all__ = ["mem_decoder", "SoCCore", "soc_core_args", "soc_core_argdict"]
@@ -13,6 +15,45 @@ def mem_decoder(address, start=26, end=29):
     return lambda a: a[start:end] == ((address >> (start+2)) & (2**(end-start))-1)
 
 
+# Topologies of the main Wishbone interconnect. With "shared", all masters
+# arbitrate for a single bus. With "crossbar", each slave has its own
+# arbiter, so that masters accessing different slaves do not block each
+# other, at the cost of one decoder per master and one arbiter per slave.
+_wishbone_interconnects = {
+    "shared": wishbone.InterconnectShared,
+    "crossbar": wishbone.Crossbar
+}
+
+
+def _allocate_csr_addresses(csr_map, csr_devices, n):
+    """Returns a dictionary mapping CSR device names to addresses.
+
+    Devices in ``csr_map`` get the address given there. The other devices
+    of ``csr_devices`` get the lowest free addresses, in order. Addresses
+    must be in ``range(n)``.
+    """
+    r = dict()
+    used = dict()
+    for name, address in sorted(csr_map.items(), key=itemgetter(1)):
+        if not 0 <= address < n:
+            raise ValueError("CSR address of {} out of range: {}".format(name, address))
+        if address in used:
+            raise ValueError("CSR address conflict between {} and {}".format(used[address], name))
+        r[name] = address
+        used[address] = name
+    address = 0
+    for name in csr_devices:
+        if name in r:
+            continue
+        while address in used:
+            address += 1
+        if address >= n:
+            raise ValueError("Too many CSR devices: no address left for {}".format(name))
+        r[name] = address
+        used[address] = name
+    return r
+
+
 class SoCCore(Module):
     mem_map = {
         "rom":      0x00000000,  # (default shadow @0x80000000)
@@ -20,19 +61,29 @@ class SoCCore(Module):
         "main_ram": 0x40000000,  # (default shadow @0xc0000000)
         "csr":      0x60000000,  # (default shadow @0xe0000000)
     }
+    # CSR devices with a fixed address. Devices listed in csr_devices
+    # but not here are allocated the remaining addresses in order.
+    csr_map = {}
     def __init__(self, platform, clk_freq,
                 cpu_type="lm32", cpu_reset_address=0x00000000,
                 integrated_rom_size=0,
                 integrated_sram_size=4096,
                 integrated_main_ram_size=16*1024,
                 shadow_base=0x80000000,
-                csr_data_width=8, csr_address_width=14,
+                csr_data_width=8, csr_address_width=14, csr_low_latency=False,
                 with_uart=True, uart_baudrate=115200,
                 ident="",
-                with_timer=True):
+                with_timer=True,
+                wishbone_interconnect="shared", wishbone_register=True):
         self.platform = platform
         self.clk_freq = clk_freq
 
+        if wishbone_interconnect not in _wishbone_interconnects:
+            raise ValueError("Unsupported Wishbone interconnect: {}".format(
+                wishbone_interconnect))
+        self.wishbone_interconnect = wishbone_interconnect
+        self.wishbone_register = wishbone_register
+
         self.cpu_type = cpu_type
         if integrated_rom_size:
             cpu_reset_address = 0
@@ -47,6 +98,9 @@ class SoCCore(Module):
 
         self.shadow_base = shadow_base
 
+        if csr_data_width not in (8, 16, 32):
+            raise ValueError("Unsupported CSR data width: {}".format(
+                csr_data_width))
         self.csr_data_width = csr_data_width
         self.csr_address_width = csr_address_width
 
@@ -79,20 +133,28 @@ class SoCCore(Module):
         self.add_wb_master(self.tmpu.output_bus)
 
         if integrated_rom_size:
-            self.submodules.rom = wishbone.SRAM(integrated_rom_size, read_only=True)
+            self.submodules.rom = wishbone.SRAM(
+                FileInitMemory(32, integrated_rom_size//4, name="rom"),
+                read_only=True)
             self.register_rom(self.rom.bus, integrated_rom_size)
 
         if integrated_sram_size:
-            self.submodules.sram = wishbone.SRAM(integrated_sram_size)
+            self.submodules.sram = wishbone.SRAM(
+                FileInitMemory(32, integrated_sram_size//4, name="sram"))
             self.register_mem("sram", self.mem_map["sram"], self.sram.bus, integrated_sram_size)
 
         # Note: Main Ram can be used when no external SDRAM is available and use SDRAM mapping.
         if integrated_main_ram_size:
-            self.submodules.main_ram = wishbone.SRAM(integrated_main_ram_size)
+            self.submodules.main_ram = wishbone.SRAM(
+                FileInitMemory(32, integrated_main_ram_size//4, name="main_ram"))
             self.register_mem("main_ram", self.mem_map["main_ram"], self.main_ram.bus, integrated_main_ram_size)
 
+        # In low-latency mode, the CSR bus is driven combinatorially from
+        # the Wishbone bus and CSR accesses take two cycles instead of four,
+        # at the expense of a longer path to the register banks.
         self.submodules.wishbone2csr = wishbone2csr.WB2CSR(
-            bus_csr=csr_bus.Interface(csr_data_width, csr_address_width))
+            bus_csr=csr_bus.Interface(csr_data_width, csr_address_width),
+            registered=not csr_low_latency)
         self.register_mem("csr", self.mem_map["csr"], self.wishbone2csr.wishbone)
 
         if with_uart:
@@ -103,6 +165,7 @@ class SoCCore(Module):
         if ident:
             self.submodules.identifier = identifier.Identifier(ident)
         self.config["CLOCK_FREQUENCY"] = int(clk_freq)
+        self.config["CSR_DATA_WIDTH"] = csr_data_width
         self.config["SOC_PLATFORM"] = platform.name
 
         if with_timer:
@@ -112,6 +175,28 @@ class SoCCore(Module):
     def initialize_rom(self, data):
         self.rom.mem.init = data
 
+    def set_rom_init_file(self, filename):
+        """Makes the integrated ROM load its contents from ``filename``,
+        relative to the gateware build directory, instead of embedding them
+        in the generated HDL."""
+        self.rom.mem.init_file = filename
+
+    def externalize_mem_init(self, directory):
+        """Writes the contents of the initialized integrated memories (ROM,
+        SRAM and main RAM) to ``$readmemh`` files in ``directory``, which
+        must be the gateware build directory, and makes the generated HDL
+        load them from there."""
+        os.makedirs(directory, exist_ok=True)
+        for name in "rom", "sram", "main_ram":
+            if not hasattr(self, name):
+                continue
+            mem = getattr(self, name).mem
+            if mem.init is not None and mem.init_file is None:
+                filename = name + ".init"
+                write_mem_init(os.path.join(directory, filename),
+                               mem.init, mem.width)
+                mem.init_file = filename
+
     def add_wb_master(self, wbm):
         if self.finalized:
             raise FinalizeError
@@ -165,10 +250,17 @@ class SoCCore(Module):
     def get_csr_dev_address(self, name, memory):
         if memory is not None:
             name = name + "_" + memory.name_override
-        try:
-            return self.csr_devices.index(name)
-        except ValueError:
-            return None
+        return self._csr_addresses.get(name)
+
+    def _csr_source_names(self):
+        # CSR memories are registered as <object>_<memory>, so any
+        # underscore-delimited prefix of a device name can be the object.
+        r = set()
+        for name in list(self.csr_map) + self.csr_devices:
+            parts = name.split("_")
+            for i in range(1, len(parts) + 1):
+                r.add("_".join(parts[:i]))
+        return r
 
     def do_finalize(self):
         registered_mems = {regions[0] for regions in self._memory_regions}
@@ -177,12 +269,15 @@ class SoCCore(Module):
                 raise FinalizeError("CPU needs a {} to be registered with register_mem()".format(mem))
 
         # Wishbone
-        self.submodules.wishbonecon = wishbone.InterconnectShared(self._wb_masters,
-            self._wb_slaves, register=True)
+        interconnect = _wishbone_interconnects[self.wishbone_interconnect]
+        self.submodules.wishbonecon = interconnect(self._wb_masters,
+            self._wb_slaves, register=self.wishbone_register)
 
         # CSR
+        self._csr_addresses = _allocate_csr_addresses(self.csr_map,
+            self.csr_devices, 2**(self.csr_address_width - 9))
         self.submodules.csrbankarray = csr_bus.CSRBankArray(self,
-            self.get_csr_dev_address,
+            self.get_csr_dev_address, names=self._csr_source_names(),
             data_width=self.csr_data_width, address_width=self.csr_address_width)
         self.submodules.csrcon = csr_bus.Interconnect(
             self.wishbone2csr.csr, self.csrbankarray.get_buses())
@@ -210,11 +305,20 @@ def soc_core_args(parser):
                         help="size/enable the integrated (BIOS) ROM")
     parser.add_argument("--integrated-main-ram-size", default=None, type=int,
                         help="size/enable the integrated main RAM")
+    parser.add_argument("--wishbone-interconnect", default=None,
+                        choices=sorted(_wishbone_interconnects),
+                        help="select the main Wishbone interconnect topology")
+    parser.add_argument("--csr-data-width", default=None, type=int,
+                        choices=[8, 16, 32],
+                        help="data width of the CSR bus")
+    parser.add_argument("--csr-low-latency", default=None, action="store_true",
+                        help="decode CSR accesses combinatorially")
 
 
 def soc_core_argdict(args):
     r = dict()
-    for a in "cpu_type", "integrated_rom_size", "integrated_main_ram_size":
+    for a in "cpu_type", "integrated_rom_size", "integrated_main_ram_size", \
+             "wishbone_interconnect", "csr_data_width", "csr_low_latency":
         arg = getattr(args, a)
         if arg is not None:
             r[a] = arg
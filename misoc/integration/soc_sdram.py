@@ -5,13 +5,15 @@ from misoc.interconnect import wishbone, wishbone2lasmi, lasmi_bus
 from misoc.interconnect.csr import AutoCSR
 from misoc.cores import dfii, minicon, lasmicon
 from misoc.integration.soc_core import *
+from misoc.integration.soc_core import _wishbone_interconnects
 
 
 __all__ = ["SoCSDRAM", "soc_sdram_args", "soc_sdram_argdict"]
 
 
 class SoCSDRAM(SoCCore):
-    def __init__(self, platform, clk_freq, l2_size=8192, **kwargs):
+    def __init__(self, platform, clk_freq, l2_size=8192, l2_ways=1,
+                 with_l2_perf_counters=False, **kwargs):
         SoCCore.__init__(self, platform, clk_freq,
                          integrated_main_ram_size=0, **kwargs)
         self.csr_devices += ["dfii", "l2_cache"]
@@ -19,6 +21,8 @@ class SoCSDRAM(SoCCore):
         if l2_size:
             self.config["L2_SIZE"] = l2_size
         self.l2_size = l2_size
+        self.l2_ways = l2_ways
+        self.with_l2_perf_counters = with_l2_perf_counters
         
         self._sdram_phy = []
         self._cpulevel_sdram_ifs = []
@@ -82,7 +86,9 @@ class SoCSDRAM(SoCCore):
             bridge_if = self.get_native_sdram_if()
             if self.l2_size:
                 l2_cache = wishbone.Cache(self.l2_size//4,
-                    self._cpulevel_sdram_if_arbitrated, bridge_if)
+                    self._cpulevel_sdram_if_arbitrated, bridge_if,
+                    ways=self.l2_ways,
+                    with_perf_counters=self.with_l2_perf_counters)
                 # XXX Vivado ->2015.1 workaround, Vivado is not able to map correctly our L2 cache.
                 # Issue is reported to Xilinx and should be fixed in next releases (2015.2?).
                 # Remove this workaround when fixed by Xilinx.
@@ -106,7 +112,9 @@ class SoCSDRAM(SoCCore):
             if self.l2_size:
                 l2_cache = wishbone.Cache(self.l2_size//4,
                     self._cpulevel_sdram_if_arbitrated,
-                    wishbone.Interface(bridge_if.dw))
+                    wishbone.Interface(bridge_if.dw),
+                    ways=self.l2_ways,
+                    with_perf_counters=self.with_l2_perf_counters)
                 # XXX Vivado ->2015.1 workaround, Vivado is not able to map correctly our L2 cache.
                 # Issue is reported to Xilinx and should be fixed in next releases (2015.2?).
                 # Remove this workaround when fixed by Xilinx.
@@ -147,11 +155,20 @@ def soc_sdram_args(parser):
                         help="select CPU: lm32, or1k")
     parser.add_argument("--integrated-rom-size", default=None, type=int,
                         help="size/enable the integrated (BIOS) ROM")
+    parser.add_argument("--wishbone-interconnect", default=None,
+                        choices=sorted(_wishbone_interconnects),
+                        help="select the main Wishbone interconnect topology")
+    parser.add_argument("--csr-data-width", default=None, type=int,
+                        choices=[8, 16, 32],
+                        help="data width of the CSR bus")
+    parser.add_argument("--csr-low-latency", default=None, action="store_true",
+                        help="decode CSR accesses combinatorially")
 
 
 def soc_sdram_argdict(args):
     r = dict()
-    for a in "cpu_type", "integrated_rom_size":
+    for a in "cpu_type", "integrated_rom_size", "wishbone_interconnect", \
+             "csr_data_width", "csr_low_latency":
         arg = getattr(args, a)
         if arg is not None:
             r[a] = arg
@@ -240,7 +240,7 @@ class CSRStorage(_CompoundCSR):
             backstore = Signal(self.size - busword, name=self.name + "_backstore")
         for i in reversed(range(nwords)):
             nbits = min(self.size - i*busword, busword)
-            sc = CSR(nbits, self.name + str(i) if nwords else self.name)
+            sc = CSR(nbits, self.name + str(i) if nwords > 1 else self.name)
             self.simple_csrs.append(sc)
             lo = i*busword
             hi = lo+nbits
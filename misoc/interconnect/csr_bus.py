@@ -127,8 +127,11 @@ class SRAM(Module):
             return [self._page]
 
 
+# With registered=False, read data is decoded combinatorially from the
+# address, for low-latency CSR buses. This lengthens the critical path
+# from the bus address to the read data.
 class CSRBank(csr.GenericBank):
-    def __init__(self, description, address=0, bus=None):
+    def __init__(self, description, address=0, bus=None, registered=True):
         if bus is None:
             bus = Interface()
         self.bus = bus
@@ -149,10 +152,14 @@ class CSRBank(csr.GenericBank):
             ]
 
         brcases = dict((i, self.bus.dat_r.eq(c.w)) for i, c in enumerate(self.simple_csrs))
-        self.sync += [
+        read = [
             self.bus.dat_r.eq(0),
             If(sel, Case(self.bus.adr[:self.decode_bits], brcases))
         ]
+        if registered:
+            self.sync += read
+        else:
+            self.comb += read
 
 
 # address_map(name, memory) returns the CSR offset at which to map
@@ -161,17 +168,31 @@ class CSRBank(csr.GenericBank):
 # Otherwise, it is a memory object belonging to source.name.
 # address_map is called exactly once for each object at each call to
 # scan(), so it can have side effects.
+# If names is None, all attributes of source can be mapped. Otherwise, only
+# the attributes of source listed in names are mapped, which saves
+# gathering the CSRs and memories of the others. The constants of all
+# attributes are collected in both cases.
+# registered is passed to the register banks.
 class CSRBankArray(Module):
-    def __init__(self, source, address_map, *ifargs, **ifkwargs):
+    def __init__(self, source, address_map, *ifargs, names=None,
+                 registered=True, **ifkwargs):
         self.source = source
         self.address_map = address_map
+        self.names = names
+        self.registered = registered
         self.scan(ifargs, ifkwargs)
 
     def scan(self, ifargs, ifkwargs):
         self.banks = []
         self.srams = []
         self.constants = []
+        names = None if self.names is None else set(self.names)
         for name, obj in xdir(self.source, True):
+            if hasattr(obj, "get_constants"):
+                for constant in obj.get_constants():
+                    self.constants.append((name, constant))
+            if names is not None and name not in names:
+                continue
             if hasattr(obj, "get_csrs"):
                 csrs = obj.get_csrs()
             else:
@@ -192,15 +213,13 @@ class CSRBankArray(Module):
                     self.submodules += mmap
                     csrs += mmap.get_csrs()
                     self.srams.append((name, memory, mapaddr, mmap))
-            if hasattr(obj, "get_constants"):
-                for constant in obj.get_constants():
-                    self.constants.append((name, constant))
             if csrs:
                 mapaddr = self.address_map(name, None)
                 if mapaddr is None:
                     continue
                 bank_bus = Interface(*ifargs, **ifkwargs)
-                rmap = CSRBank(csrs, mapaddr, bus=bank_bus)
+                rmap = CSRBank(csrs, mapaddr, bus=bank_bus,
+                               registered=self.registered)
                 self.submodules += rmap
                 self.banks.append((name, csrs, mapaddr, rmap))
 
@@ -1,6 +1,9 @@
+from fractions import Fraction
+from math import gcd
+
 from migen import *
 from migen.genlib.record import *
-from migen.genlib import fifo
+from migen.genlib import fifo, roundrobin
 
 
 def _make_m2s(layout):
@@ -92,6 +95,119 @@ class AsyncFIFO(_FIFOWrapper):
         _FIFOWrapper.__init__(self, fifo.AsyncFIFO, layout, depth)
 
 
+class PipeValid(Module):
+    """Registers ``stb``, ``eop`` and the payload
+
+    Breaks the combinational paths from sink to source. ``ack`` is still
+    combinational.
+    """
+    def __init__(self, layout):
+        self.sink = sink = Endpoint(layout)
+        self.source = source = Endpoint(layout)
+
+        # # #
+
+        self.comb += sink.ack.eq(~source.stb | source.ack)
+        self.sync += \
+            If(sink.ack,
+                source.stb.eq(sink.stb),
+                source.eop.eq(sink.eop),
+                source.payload.eq(sink.payload)
+            )
+
+
+class PipeReady(Module):
+    """Skid buffer registering ``ack``
+
+    Breaks the combinational path of ``ack`` from source to sink. The data
+    accepted while the source is stalled is kept in a register and sent
+    first once the source acknowledges.
+    """
+    def __init__(self, layout):
+        self.sink = sink = Endpoint(layout)
+        self.source = source = Endpoint(layout)
+
+        # # #
+
+        valid = Signal()
+        buf = Endpoint(layout)
+        self.comb += [
+            sink.ack.eq(~valid),
+            If(valid,
+                source.stb.eq(1),
+                source.eop.eq(buf.eop),
+                source.payload.eq(buf.payload)
+            ).Else(
+                source.stb.eq(sink.stb),
+                source.eop.eq(sink.eop),
+                source.payload.eq(sink.payload)
+            )
+        ]
+        self.sync += [
+            If(source.ack,
+                valid.eq(0)
+            ).Elif(sink.stb & ~valid,
+                valid.eq(1)
+            ),
+            If(~valid,
+                buf.eop.eq(sink.eop),
+                buf.payload.eq(sink.payload)
+            )
+        ]
+
+
+class Buffer(Module):
+    """Fully registered stage: a ``PipeValid`` followed by a ``PipeReady``
+
+    Like the stages it is made of, it sustains one transfer per cycle, and
+    costs two payload registers where a ``SyncFIFO`` would need a memory
+    and its pointers.
+    """
+    def __init__(self, layout, pipe_valid=True, pipe_ready=True):
+        self.sink = sink = Endpoint(layout)
+        self.source = source = Endpoint(layout)
+
+        # # #
+
+        stages = [sink]
+        if pipe_valid:
+            self.submodules.pipe_valid = PipeValid(layout)
+            stages.append(self.pipe_valid)
+        if pipe_ready:
+            self.submodules.pipe_ready = PipeReady(layout)
+            stages.append(self.pipe_ready)
+        stages.append(source)
+        self.submodules.pipeline = Pipeline(*stages)
+
+
+class Pipeline(Module):
+    """Connects the sources of its arguments to the sinks of the next ones
+
+    The arguments are modules with ``sink`` and ``source`` endpoints, or
+    endpoints. The sink of the first one and the source of the last one
+    are exposed as ``sink`` and ``source``. Modules are not added as
+    submodules.
+    """
+    def __init__(self, *modules):
+        if len(modules) < 2:
+            raise ValueError("Pipeline needs at least two elements")
+        if isinstance(modules[0], Endpoint):
+            self.sink = modules[0]
+        elif hasattr(modules[0], "sink"):
+            self.sink = modules[0].sink
+        if isinstance(modules[-1], Endpoint):
+            self.source = modules[-1]
+        elif hasattr(modules[-1], "source"):
+            self.source = modules[-1].source
+
+        # # #
+
+        for s, d in zip(modules, modules[1:]):
+            source = s if isinstance(s, Endpoint) else s.source
+            sink = d if isinstance(d, Endpoint) else d.sink
+            self.comb += source.connect(sink)
+
+
 class Multiplexer(Module):
     def __init__(self, layout, n):
         self.source = Endpoint(layout)
@@ -128,6 +244,100 @@ class Demultiplexer(Module):
         self.comb += Case(self.sel, cases)
 
 
+class Arbiter(Module):
+    """Grants the source to one sink at a time, for whole packets
+
+    With the ``"round_robin"`` policy, the grant goes to the next sink with
+    data after the one that ends its packet. With ``"priority"``, it goes
+    to the lowest-numbered sink with data. The grant only changes at
+    packet boundaries, and the first word of a packet from another sink is
+    sent on the cycle following the end of the previous packet. With
+    ``"priority"``, a sink that keeps the grant at the end of its packet
+    and has nothing more to send costs one idle cycle.
+    """
+    def __init__(self, layout, n, policy="round_robin"):
+        self.source = source = Endpoint(layout)
+        self.sinks = sinks = []
+        for i in range(n):
+            sink = Endpoint(layout)
+            setattr(self, "sink"+str(i), sink)
+            sinks.append(sink)
+        self.grant = Signal(max=max(2, n))
+
+        # # #
+
+        request = Signal(n)
+        busy = Signal()
+        ce = Signal()
+        self.comb += [
+            request.eq(Cat(*[sink.stb for sink in sinks])),
+            # the grant changes once a packet ends, or when the granted sink
+            # has no packet to send
+            ce.eq((source.stb & source.ack & source.eop)
+                  | (~busy & ~source.stb))
+        ]
+        self.sync += \
+            If(source.stb & source.ack,
+                busy.eq(~source.eop)
+            )
+
+        if policy == "round_robin":
+            self.submodules.rr = roundrobin.RoundRobin(n, roundrobin.SP_CE)
+            self.comb += [
+                self.rr.request.eq(request),
+                self.rr.ce.eq(ce),
+                self.grant.eq(self.rr.grant)
+            ]
+        elif policy == "priority":
+            self.sync += \
+                If(ce,
+                    [If(request[i], self.grant.eq(i))
+                        for i in reversed(range(n))]
+                )
+        else:
+            raise ValueError("Unknown arbitration policy " + policy)
+
+        cases = {}
+        for i, sink in enumerate(sinks):
+            cases[i] = sink.connect(source)
+        self.comb += Case(self.grant, cases)
+
+
+class Dispatcher(Module):
+    """Routes each packet to the source given by a payload field
+
+    The value of ``field`` in the first word of a packet selects the source
+    that receives the whole packet. Packets selecting a source beyond the
+    last one are dropped.
+    """
+    def __init__(self, layout, n, field):
+        self.sink = sink = Endpoint(layout)
+        self.sources = sources = []
+        for i in range(n):
+            source = Endpoint(layout)
+            setattr(self, "source"+str(i), source)
+            sources.append(source)
+
+        # # #
+
+        value = getattr(sink, field)
+        busy = Signal()
+        sel = Signal(len(value))
+        sel_r = Signal(len(value))
+        self.comb += sel.eq(Mux(busy, sel_r, value))
+        self.sync += \
+            If(sink.stb & sink.ack,
+                busy.eq(~sink.eop),
+                sel_r.eq(sel)
+            )
+
+        cases = {}
+        for i, source in enumerate(sources):
+            cases[i] = sink.connect(source)
+        cases["default"] = sink.ack.eq(1)
+        self.comb += Case(sel, cases)
+
+
 class _UpConverter(Module):
     def __init__(self, nbits_from, nbits_to, ratio, reverse,
                  report_valid_token_count):
@@ -239,17 +449,89 @@ class _IdentityConverter(Module):
             self.comb += source.valid_token_count.eq(1)
 
 
+class _Gearbox(Module):
+    # Converter between widths that are not multiples of each other. Bits
+    # are shifted in and out of a buffer of nbits_from + nbits_to bits,
+    # least significant first (most significant first with reverse), so
+    # that one word can be received and one sent every cycle. The last word
+    # of a packet is padded with zeros.
+    def __init__(self, nbits_from, nbits_to, ratio, reverse,
+                 report_valid_token_count):
+        if report_valid_token_count:
+            raise ValueError("Cannot report valid token count with non-integer ratio")
+        self.sink = sink = Endpoint([("data", nbits_from)])
+        self.source = source = Endpoint([("data", nbits_to)])
+        self.ratio = ratio
+
+        # # #
+
+        width = nbits_from + nbits_to
+        buf = Signal(width)
+        level = Signal(max=width + 1)
+        level_out = Signal(max=width + 1)
+        flush = Signal()
+        sink_data = sink.data[::-1] if reverse else sink.data
+        source_data = buf[:nbits_to]
+
+        # control path
+        self.comb += [
+            source.stb.eq((level >= nbits_to) | (flush & (level != 0))),
+            source.eop.eq(flush & (level <= nbits_to)),
+            If(source.stb & source.ack,
+                If(level > nbits_to,
+                    level_out.eq(level - nbits_to)
+                ).Else(
+                    level_out.eq(0)
+                )
+            ).Else(
+                level_out.eq(level)
+            ),
+            sink.ack.eq(~flush & (level_out <= nbits_to))
+        ]
+        self.sync += [
+            If(sink.stb & sink.ack,
+                level.eq(level_out + nbits_from),
+                If(sink.eop, flush.eq(1))
+            ).Else(
+                level.eq(level_out)
+            ),
+            If(source.stb & source.ack & source.eop, flush.eq(0))
+        ]
+
+        # data path: bits above level are kept at zero
+        shifted = Signal(width)
+        self.comb += [
+            If(source.stb & source.ack,
+                shifted.eq(buf >> nbits_to)
+            ).Else(
+                shifted.eq(buf)
+            ),
+            source.data.eq(source_data[::-1] if reverse else source_data)
+        ]
+        step = gcd(nbits_from, nbits_to)
+        cases = {l: buf.eq(shifted | (sink_data << l))
+                 for l in range(0, nbits_to + 1, step)}
+        self.sync += \
+            If(sink.stb & sink.ack,
+                Case(level_out, cases)
+            ).Else(
+                buf.eq(shifted)
+            )
+
+
 def _get_converter_ratio(nbits_from, nbits_to):
     if nbits_from > nbits_to:
         specialized_cls = _DownConverter
-        if nbits_from % nbits_to:
-            raise ValueError("Ratio must be an int")
         ratio = nbits_from//nbits_to
+        if nbits_from % nbits_to:
+            specialized_cls = _Gearbox
+            ratio = Fraction(nbits_from, nbits_to)
     elif nbits_from < nbits_to:
         specialized_cls = _UpConverter
-        if nbits_to % nbits_from:
-            raise ValueError("Ratio must be an int")
         ratio = nbits_to//nbits_from
+        if nbits_to % nbits_from:
+            specialized_cls = _Gearbox
+            ratio = Fraction(nbits_to, nbits_from)
     else:
         specialized_cls = _IdentityConverter
         ratio = 1
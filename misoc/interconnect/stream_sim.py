@@ -0,0 +1,132 @@
+import random
+
+from migen import passive
+
+
+def _words(data):
+    # bytes, bytearray, lists and NumPy arrays
+    if hasattr(data, "tolist"):
+        data = data.tolist()
+    return [int(word) for word in data]
+
+
+class StreamSource:
+    """Drives a stream endpoint from buffers in simulation
+
+    Each buffer given to ``send`` is sent as a packet, its words in
+    ``field`` of the payload and ``eop`` with the last one; empty buffers
+    are rejected. ``stb`` is withdrawn with probability ``1 - valid_rate``
+    before each word. ``timestamps`` receives the cycle of each transfer.
+
+    Signal accesses are batched into as few simulator requests as
+    possible: a word held by the sink costs a single read per cycle.
+    """
+    def __init__(self, endpoint, field="data", valid_rate=1.0, seed=0):
+        self.endpoint = endpoint
+        self.field = getattr(endpoint, field)
+        self.valid_rate = valid_rate
+        self.prng = random.Random(seed)
+        self.words = []
+        self.eops = []
+        self.timestamps = []
+
+    def send(self, data, eop=True):
+        words = _words(data)
+        if not words:
+            raise ValueError("Empty buffer")
+        self.words += words
+        self.eops += [0]*(len(words) - 1) + [int(eop)]
+
+    def generator(self):
+        endpoint, field = self.endpoint, self.field
+        words, eops, timestamps = self.words, self.eops, self.timestamps
+        random = self.prng.random
+        valid_rate = self.valid_rate
+        # statements are built once, and once per data value
+        stb_on = endpoint.stb.eq(1)
+        stb_off = endpoint.stb.eq(0)
+        eop_on = endpoint.eop.eq(1)
+        eop_off = endpoint.eop.eq(0)
+        assigns = dict()
+        cycle = 0
+        eop = 0
+        for word, word_eop in zip(words, eops):
+            if valid_rate < 1.0:
+                while random() > valid_rate:
+                    yield stb_off
+                    yield
+                    cycle += 1
+            try:
+                assign = assigns[word]
+            except KeyError:
+                assign = assigns[word] = field.eq(word)
+            if word_eop != eop:
+                eop = word_eop
+                yield [stb_on, assign, eop_on if eop else eop_off]
+            else:
+                yield [stb_on, assign]
+            yield
+            cycle += 1
+            while not (yield endpoint.ack):
+                yield
+                cycle += 1
+            timestamps.append(cycle)
+        yield stb_off
+
+
+class StreamSink:
+    """Receives from a stream endpoint in simulation
+
+    ``ack`` is withdrawn with probability ``1 - ready_rate`` on each cycle.
+    The words received from ``field`` of the payload are appended to
+    ``words``, grouped into ``packets`` by ``eop``, and the cycle of each
+    transfer to ``timestamps``.
+    """
+    def __init__(self, endpoint, field="data", ready_rate=1.0, seed=0):
+        self.endpoint = endpoint
+        self.field = getattr(endpoint, field)
+        self.ready_rate = ready_rate
+        self.prng = random.Random(seed)
+        self.words = []
+        self.packets = []
+        self.timestamps = []
+        self._packet = []
+
+    def generator(self, count=None):
+        """Runs until ``count`` words have been received, or as a passive
+        generator if ``count`` is ``None``"""
+        if count is None:
+            return passive(self._receive)(None)
+        return self._receive(count)
+
+    def _receive(self, count):
+        endpoint = self.endpoint
+        words, packets, timestamps = self.words, self.packets, self.timestamps
+        packet = self._packet
+        random = self.prng.random
+        ready_rate = self.ready_rate
+        request = [endpoint.stb, self.field, endpoint.eop]
+        requests = {
+            True: request + [endpoint.ack.eq(1)],
+            False: request + [endpoint.ack.eq(0)]
+        }
+        ack = False
+        cycle = 0
+        while count is None or len(words) < count:
+            next_ack = ready_rate >= 1.0 or random() <= ready_rate
+            if next_ack != ack:
+                stb, data, eop, _ = yield requests[next_ack]
+            else:
+                stb, data, eop = yield request
+            # the values read are those of the cycle before this edge, when
+            # the previous ack was in effect
+            if stb and ack:
+                words.append(data)
+                packet.append(data)
+                timestamps.append(cycle)
+                if eop:
+                    packets.append(list(packet))
+                    packet.clear()
+            ack = next_ack
+            yield
+            cycle += 1
@@ -5,12 +5,10 @@ from migen import *
 from migen.genlib import roundrobin
 from migen.genlib.record import *
 from migen.genlib.misc import split, displacer, chooser
-from migen.genlib.fsm import FSM, NextState
+from migen.genlib.fsm import FSM, NextState, NextValue
 
 from misoc.interconnect import csr
 
-# TODO: rewrite without FlipFlop
-
 
 _layout = [
     ("adr",             30, DIR_M_TO_S),
@@ -26,16 +24,27 @@ _layout = [
     ("err",              1, DIR_S_TO_M)
 ]
 
+# Pipelined (Wishbone B4) interfaces add a stall signal. A request is
+# accepted in each cycle where stb is asserted and stall is not, and the
+# master may present the next request in the following cycle. The slave
+# acks accepted requests in order, and the master keeps cyc asserted until
+# all of them have been acked.
+_pipelined_layout = _layout + [
+    ("stall",            1, DIR_S_TO_M)
+]
+
 
 class Interface(Record):
-    def __init__(self, data_width=32):
-        Record.__init__(self, set_layout_parameters(_layout,
+    def __init__(self, data_width=32, pipelined=False):
+        self.pipelined = pipelined
+        Record.__init__(self, set_layout_parameters(
+            _pipelined_layout if pipelined else _layout,
             data_width=data_width,
             sel_width=data_width//8))
 
     @staticmethod
     def like(other):
-        return Interface(len(other.dat_w))
+        return Interface(len(other.dat_w), getattr(other, "pipelined", False))
 
     def _do_transaction(self):
         yield self.cyc.eq(1)
@@ -46,9 +55,60 @@ class Interface(Record):
         yield self.cyc.eq(0)
         yield self.stb.eq(0)
 
+    def _set_request(self, request):
+        adr, we, dat, sel = request
+        yield self.adr.eq(adr)
+        yield self.we.eq(we)
+        yield self.dat_w.eq(dat)
+        yield self.sel.eq(sel)
+
+    def _do_pipelined(self, requests):
+        results = []
+        issued = 0
+        outstanding = 0
+        yield self.cyc.eq(1)
+        yield self.stb.eq(1)
+        yield from self._set_request(requests[0])
+        yield
+        while issued < len(requests) or outstanding:
+            if issued < len(requests) and not (yield self.stall):
+                # the current request is accepted at the next clock edge
+                issued += 1
+                outstanding += 1
+                if issued < len(requests):
+                    yield from self._set_request(requests[issued])
+                else:
+                    yield self.stb.eq(0)
+            if (yield self.ack):
+                results.append((yield self.dat_r))
+                outstanding -= 1
+            yield
+        yield self.cyc.eq(0)
+        return results
+
+    def _do_burst(self, requests):
+        # classic incrementing burst, terminated by cti=7
+        results = []
+        yield self.cyc.eq(1)
+        yield self.stb.eq(1)
+        for i, request in enumerate(requests):
+            yield from self._set_request(request)
+            yield self.cti.eq(7 if i == len(requests) - 1 else 2)
+            yield
+            while not (yield self.ack):
+                yield
+            results.append((yield self.dat_r))
+        yield self.cyc.eq(0)
+        yield self.stb.eq(0)
+        yield self.cti.eq(0)
+        return results
+
     def write(self, adr, dat, sel=None):
         if sel is None:
             sel = 2**len(self.sel) - 1
+        if self.pipelined:
+            yield from self._do_pipelined([(adr, 1, dat, sel)])
+            return
         yield self.adr.eq(adr)
         yield self.dat_w.eq(dat)
         yield self.sel.eq(sel)
@@ -56,11 +116,43 @@ class Interface(Record):
         yield from self._do_transaction()
 
     def read(self, adr):
+        if self.pipelined:
+            return (yield from self._do_pipelined([(adr, 0, 0, 0)]))[0]
         yield self.adr.eq(adr)
         yield self.we.eq(0)
         yield from self._do_transaction()
         return (yield self.dat_r)
 
+    def write_burst(self, adr, data, sel=None):
+        """Writes consecutive words starting at ``adr``. On pipelined
+        interfaces, the writes are issued back-to-back. On classic
+        interfaces, they form an incrementing burst."""
+        if sel is None:
+            sel = 2**len(self.sel) - 1
+        requests = [(adr + i, 1, dat, sel) for i, dat in enumerate(data)]
+        if self.pipelined:
+            yield from self._do_pipelined(requests)
+        else:
+            yield from self._do_burst(requests)
+
+    def read_burst(self, adr, n):
+        """Reads ``n`` consecutive words starting at ``adr``. On pipelined
+        interfaces, the reads are issued back-to-back. On classic
+        interfaces, they form an incrementing burst."""
+        requests = [(adr + i, 0, 0, 0) for i in range(n)]
+        if self.pipelined:
+            return (yield from self._do_pipelined(requests))
+        else:
+            return (yield from self._do_burst(requests))
+
+
+def _check_pipelined(interfaces):
+    pipelined = {getattr(i, "pipelined", False) for i in interfaces}
+    if len(pipelined) > 1:
+        raise ValueError("Cannot mix classic and pipelined Wishbone interfaces, "
+                         "use a bridge")
+    return pipelined.pop()
+
 
 class InterconnectPointToPoint(Module):
     def __init__(self, master, slave):
@@ -68,23 +160,29 @@ class InterconnectPointToPoint(Module):
 
 
 class Arbiter(Module):
+    # The grant only changes when the granted master deasserts cyc, so
+    # pipelined masters keep the bus until all their requests are acked.
     def __init__(self, masters, target):
+        pipelined = _check_pipelined(list(masters) + [target])
+        layout = _pipelined_layout if pipelined else _layout
         self.submodules.rr = roundrobin.RoundRobin(len(masters))
 
         # mux master->slave signals
-        for name, size, direction in _layout:
+        for name, size, direction in layout:
             if direction == DIR_M_TO_S:
                 choices = Array(getattr(m, name) for m in masters)
                 self.comb += getattr(target, name).eq(choices[self.rr.grant])
 
         # connect slave->master signals
-        for name, size, direction in _layout:
+        for name, size, direction in layout:
             if direction == DIR_S_TO_M:
                 source = getattr(target, name)
                 for i, m in enumerate(masters):
                     dest = getattr(m, name)
                     if name == "ack" or name == "err":
                         self.comb += dest.eq(source & (self.rr.grant == i))
+                    elif name == "stall":
+                        self.comb += dest.eq(source | (self.rr.grant != i))
                     else:
                         self.comb += dest.eq(source)
 
@@ -100,7 +198,11 @@ class Decoder(Module):
     # 1) wishbone.Slave reference.
     # register adds flip-flops after the address comparators. Improves timing,
     # but breaks Wishbone combinatorial feedback.
-    def __init__(self, master, slaves, register=False):
+    # With pipelined interfaces, up to max_pending requests can be
+    # outstanding, all to the same slave: a request to another slave is
+    # stalled until the previous slave has acked all its requests, so that
+    # acks are returned in order. register has no effect in this mode.
+    def __init__(self, master, slaves, register=False, max_pending=16):
         ns = len(slaves)
         slave_sel = Signal(ns)
         slave_sel_r = Signal(ns)
@@ -108,6 +210,10 @@ class Decoder(Module):
         # decode slave addresses
         self.comb += [slave_sel[i].eq(fun(master.adr))
             for i, (fun, bus) in enumerate(slaves)]
+
+        if _check_pipelined([master] + [bus for fun, bus in slaves]):
+            self._pipelined(master, slaves, slave_sel, max_pending)
+            return
         if register:
             self.sync += slave_sel_r.eq(slave_sel)
         else:
@@ -133,10 +239,62 @@ class Decoder(Module):
         masked = [Replicate(slave_sel_r[i], len(master.dat_r)) & slaves[i][1].dat_r for i in range(ns)]
         self.comb += master.dat_r.eq(reduce(or_, masked))
 
+    def _pipelined(self, master, slaves, slave_sel, max_pending):
+        ns = len(slaves)
+        pending = Signal(max=max_pending+1)
+        active = Signal(ns)  # slave with pending requests
+        blocked = Signal()
+        accept = Signal()
+        response_sel = Signal(ns)
+
+        self.comb += [
+            blocked.eq((pending == max_pending) |
+                       ((pending != 0) & (slave_sel != active))),
+            master.stall.eq(blocked |
+                reduce(or_, [slave_sel[i] & bus.stall
+                             for i, (fun, bus) in enumerate(slaves)])),
+            accept.eq(master.cyc & master.stb & ~master.stall)
+        ]
+        self.sync += [
+            If(~master.cyc,
+                pending.eq(0)
+            ).Elif(accept & ~master.ack,
+                pending.eq(pending + 1)
+            ).Elif(~accept & master.ack,
+                pending.eq(pending - 1)
+            ),
+            If(accept, active.eq(slave_sel))
+        ]
+
+        # connect master->slaves signals except cyc and stb
+        for fun, bus in slaves:
+            for name, size, direction in _layout:
+                if direction == DIR_M_TO_S and name not in ("cyc", "stb"):
+                    self.comb += getattr(bus, name).eq(getattr(master, name))
+
+        for i, (fun, bus) in enumerate(slaves):
+            self.comb += [
+                bus.cyc.eq(master.cyc & ((slave_sel[i] & ~blocked) |
+                                         (active[i] & (pending != 0)))),
+                bus.stb.eq(master.stb & slave_sel[i] & ~blocked)
+            ]
+
+        self.comb += [
+            master.ack.eq(reduce(or_, [bus.ack for fun, bus in slaves])),
+            master.err.eq(reduce(or_, [bus.err for fun, bus in slaves]))
+        ]
+
+        # responses come from the active slave, or from the selected one
+        # if it acks in the cycle its request is accepted
+        self.comb += response_sel.eq(Mux(pending == 0, slave_sel, active))
+        masked = [Replicate(response_sel[i], len(master.dat_r)) & bus.dat_r
+                  for i, (fun, bus) in enumerate(slaves)]
+        self.comb += master.dat_r.eq(reduce(or_, masked))
+
 
 class InterconnectShared(Module):
     def __init__(self, masters, slaves, register=False):
-        shared = Interface()
+        shared = Interface(pipelined=_check_pipelined(masters))
         self.submodules += Arbiter(masters, shared)
         self.submodules += Decoder(shared, slaves, register)
 
@@ -144,7 +302,8 @@ class InterconnectShared(Module):
 class Crossbar(Module):
     def __init__(self, masters, slaves, register=False):
         matches, busses = zip(*slaves)
-        access = [[Interface() for j in slaves] for i in masters]
+        pipelined = _check_pipelined(masters)
+        access = [[Interface(pipelined=pipelined) for j in slaves] for i in masters]
         # decode each master into its access row
         for row, master in zip(access, masters):
             row = list(zip(matches, row))
@@ -160,13 +319,18 @@ class DownConverter(Module):
     This module splits Wishbone accesses from a master interface to a smaller
     slave interface.
 
+    The N sub-accesses are issued as soon as the master presents its request,
+    as an incrementing classic burst or, on pipelined slaves, as N
+    back-to-back requests. The master is acked with the ack of the last
+    sub-access.
+
     Writes:
-        Writes from master are splitted N writes to the slave. Access is acked when the last
-        access is acked by the slave.
+        Writes from master are splitted N writes to the slave.
 
     Reads:
         Read from master are splitted in N reads to the the slave. Read datas from
-        the slave are cached before being presented concatenated on the last access.
+        the slave are cached before being presented concatenated on the last access,
+        the last one being forwarded directly from the slave.
 
     TODO:
         Manage err signal? (Not implemented since we generally don't use it on Migen/MiSoC modules)
@@ -175,73 +339,51 @@ class DownConverter(Module):
         dw_from = len(master.dat_r)
         dw_to = len(slave.dat_w)
         ratio = dw_from//dw_to
+        pipelined = getattr(slave, "pipelined", False)
 
         # # #
 
-        read = Signal()
-        write = Signal()
+        request = Signal()
+        self.comb += request.eq(master.stb & master.cyc)
 
-        counter = Signal(max=ratio)
-        counter_reset = Signal()
-        counter_ce = Signal()
+        # sub-accesses are acked in order, count them
+        acked = Signal(max=ratio)
+        acked_done = Signal()
+        self.comb += acked_done.eq(acked == ratio-1)
         self.sync += \
-            If(counter_reset,
-                counter.eq(0)
-            ).Elif(counter_ce,
-                counter.eq(counter + 1)
-            )
-        counter_done = Signal()
-        self.comb += counter_done.eq(counter == ratio-1)
-
-        # Main FSM
-        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
-        fsm.act("IDLE",
-            counter_reset.eq(1),
-            If(master.stb & master.cyc,
-                If(master.we,
-                    NextState("WRITE")
+            If(~request,
+                acked.eq(0)
+            ).Elif(slave.ack,
+                If(acked_done,
+                    acked.eq(0)
                 ).Else(
-                    NextState("READ")
+                    acked.eq(acked + 1)
                 )
             )
-        )
-        fsm.act("WRITE",
-            write.eq(1),
-            slave.we.eq(1),
-            slave.cyc.eq(1),
-            If(master.stb & master.cyc,
-                slave.stb.eq(1),
-                If(slave.ack,
-                    counter_ce.eq(1),
-                    If(counter_done,
-                        master.ack.eq(1),
-                        NextState("IDLE")
-                    )
-                )
-            ).Elif(~master.cyc,
-                NextState("IDLE")
-            )
-        )
-        fsm.act("READ",
-            read.eq(1),
-            slave.cyc.eq(1),
-            If(master.stb & master.cyc,
-                slave.stb.eq(1),
-                If(slave.ack,
-                    counter_ce.eq(1),
-                    If(counter_done,
-                        master.ack.eq(1),
-                        NextState("IDLE")
-                    )
+
+        if pipelined:
+            issued = Signal(max=ratio+1)
+            self.comb += slave.stb.eq(request & (issued != ratio))
+            self.sync += \
+                If(~request | (slave.ack & acked_done),
+                    issued.eq(0)
+                ).Elif(slave.stb & ~slave.stall,
+                    issued.eq(issued + 1)
                 )
-            ).Elif(~master.cyc,
-                NextState("IDLE")
-            )
-        )
+            counter = issued[:len(acked)]
+        else:
+            self.comb += slave.stb.eq(request)
+            counter = acked
+
+        self.comb += [
+            slave.cyc.eq(request),
+            slave.we.eq(master.we),
+            master.ack.eq(slave.ack & acked_done)
+        ]
 
         # Address
         self.comb += [
-            If(counter_done,
+            If(counter == ratio-1,
                 slave.cti.eq(7) # indicate end of burst
             ).Else(
                 slave.cti.eq(2)
@@ -253,16 +395,15 @@ class DownConverter(Module):
         cases = {}
         for i in range(ratio):
             cases[i] = [
-                slave.sel.eq(master.sel[i*dw_to//8:(i+1)*dw_to]),
+                slave.sel.eq(master.sel[i*dw_to//8:(i+1)*dw_to//8]),
                 slave.dat_w.eq(master.dat_w[i*dw_to:(i+1)*dw_to])
             ]
         self.comb += Case(counter, cases)
 
-
         cached_data = Signal(dw_from)
         self.comb += master.dat_r.eq(Cat(cached_data[dw_to:], slave.dat_r))
         self.sync += \
-            If(read & counter_ce,
+            If(~master.we & slave.ack,
                 cached_data.eq(master.dat_r)
             )
 
@@ -274,13 +415,20 @@ class UpConverter(Module):
     to a wider slave interface. This allows efficient use wishbone bursts.
 
     Writes:
-        Wishbone writes are cached before being written to the slave. Access to
-        the slave is done at the end of a burst or when address reach end of burst
-        addressing.
+        Wishbone writes are collected in a fill buffer before being written to
+        the slave. The buffer is moved to an eviction register when the
+        master leaves the wide word, reaches its last sub-word or ends the
+        burst, so that the slave write of one wide word overlaps with the
+        filling of the next one.
 
     Reads:
-        Cache is refilled only at the beginning of each burst, the subsequent
-        reads of a burst use the cached data.
+        A wide word is fetched from the slave at the first read of each wide
+        word of a burst, the subsequent reads of the burst within this wide
+        word use the buffered data. Reads wait for pending writes.
+
+    Incrementing master bursts (cti=2) are mapped onto slave bursts: slave
+    accesses are issued with cti=2 and cyc is kept asserted between them
+    until the master ends its burst.
 
     TODO:
         Manage err signal? (Not implemented since we generally don't use it on Migen/MiSoC modules)
@@ -290,145 +438,184 @@ class UpConverter(Module):
         dw_to = len(slave.dat_w)
         ratio = dw_to//dw_from
         ratiobits = log2_int(ratio)
+        selw = dw_from//8
 
         # # #
 
-        write = Signal()
-        evict = Signal()
-        refill = Signal()
-        read = Signal()
-
-        address = FlipFlop(30)
-        self.submodules += address
-        self.comb += address.d.eq(master.adr)
-
-        counter = Signal(max=ratio)
-        counter_ce = Signal()
-        counter_reset = Signal()
-        self.sync += \
-            If(counter_reset,
-                counter.eq(0)
-            ).Elif(counter_ce,
-                counter.eq(counter + 1)
-            )
-        counter_offset = Signal(max=ratio)
-        counter_done = Signal()
+        request = Signal()
+        burst = Signal()
+        adr = Signal(len(slave.adr))
+        offset = Signal(ratiobits)
         self.comb += [
-            counter_offset.eq(address.q),
-            counter_done.eq((counter + counter_offset) == ratio-1)
+            request.eq(master.cyc & master.stb),
+            burst.eq(master.cti == 2),
+            adr.eq(master.adr[ratiobits:]),
+            offset.eq(master.adr[:ratiobits])
         ]
 
-        cached_data = Signal(dw_to)
-        cached_sel = Signal(dw_to//8)
-
-        end_of_burst = Signal()
-        self.comb += end_of_burst.eq(~master.cyc |
-                                     (master.stb & master.cyc & master.ack & ((master.cti == 7) | counter_done)))
+        def subwords(signal, width):
+            return [signal[i*width:(i+1)*width] for i in range(ratio)]
+
+        # Write datapath
+        fill_data = Signal(dw_to)
+        fill_sel = Signal(dw_to//8)
+        fill_adr = Signal(len(slave.adr))
+        fill_valid = Signal()
+        fill_close = Signal()
+        fill_burst = Signal()
+
+        evict_data = Signal(dw_to)
+        evict_sel = Signal(dw_to//8)
+        evict_adr = Signal(len(slave.adr))
+        evict_pending = Signal()
+        evict_burst = Signal()
+        evict_done = Signal()
+        self.comb += evict_done.eq(evict_pending & slave.ack)
+
+        move = Signal()
+        mergeable = Signal()
+        write_ack = Signal()
+        self.comb += [
+            mergeable.eq(fill_valid & ~fill_close & (fill_adr == adr)),
+            move.eq(fill_valid & (~evict_pending | evict_done) &
+                    (fill_close | ~master.cyc | (request & ~(master.we & mergeable)))),
+            write_ack.eq(request & master.we & (mergeable | ~fill_valid | move))
+        ]
 
+        write_cases = {}
+        for i, (d, s) in enumerate(zip(subwords(fill_data, dw_from),
+                                       subwords(fill_sel, selw))):
+            write_cases[i] = [
+                d.eq(master.dat_w),
+                s.eq(master.sel)
+            ]
+        self.sync += [
+            If(move,
+                evict_data.eq(fill_data),
+                evict_sel.eq(fill_sel),
+                evict_adr.eq(fill_adr),
+                evict_burst.eq(fill_burst),
+                evict_pending.eq(1)
+            ).Elif(evict_done,
+                evict_pending.eq(0)
+            ),
+            If(write_ack,
+                If(~mergeable,
+                    fill_sel.eq(0),
+                    fill_adr.eq(adr)
+                ),
+                Case(offset, write_cases),
+                fill_valid.eq(1),
+                fill_close.eq(~burst | (offset == ratio-1)),
+                fill_burst.eq(burst & (offset == ratio-1))
+            ).Elif(move,
+                fill_valid.eq(0)
+            )
+        ]
 
-        need_refill = FlipFlop(reset=1)
-        self.submodules += need_refill
+        # Read datapath
+        read_data = Signal(dw_to)
+        read_adr = Signal(len(slave.adr))
+        read_valid = Signal()
+        read_hit = Signal()
+        read_fetch = Signal()
+        read_ack = Signal()
         self.comb += [
-            need_refill.reset.eq(end_of_burst),
-            need_refill.d.eq(0)
+            read_hit.eq(read_valid & (read_adr == adr)),
+            read_fetch.eq(request & ~master.we & ~read_hit &
+                          ~fill_valid & ~evict_pending),
+            read_ack.eq(request & ~master.we & ~fill_valid & ~evict_pending &
+                        (read_hit | slave.ack))
+        ]
+        self.sync += [
+            If(read_fetch & slave.ack,
+                read_data.eq(slave.dat_r),
+                read_adr.eq(adr)
+            ),
+            # buffered data is only used within a burst
+            If(~master.cyc | write_ack | (read_ack & ~burst),
+                read_valid.eq(0)
+            ).Elif(read_fetch & slave.ack,
+                read_valid.eq(1)
+            )
         ]
+        data = Mux(read_hit, read_data, slave.dat_r)
+        self.comb += master.dat_r.eq(Array(subwords(data, dw_from))[offset])
 
-        # Main FSM
-        self.submodules.fsm = fsm = FSM()
-        fsm.act("IDLE",
-            counter_reset.eq(1),
-            If(master.stb & master.cyc,
-                address.ce.eq(1),
-                If(master.we,
-                    NextState("WRITE")
-                ).Else(
-                    If(need_refill.q,
-                        NextState("REFILL")
-                    ).Else(
-                        NextState("READ")
-                    )
-                )
+        # Slave
+        slave_burst = Signal()
+        self.comb += [
+            master.ack.eq(write_ack | read_ack),
+            slave.stb.eq(evict_pending | read_fetch),
+            slave.cyc.eq(slave.stb | (master.cyc & slave_burst)),
+            If(evict_pending,
+                slave.adr.eq(evict_adr),
+                slave.we.eq(1),
+                slave.sel.eq(evict_sel),
+                slave.dat_w.eq(evict_data),
+                slave.cti.eq(Mux(evict_burst & master.cyc, 2, 7))
+            ).Else(
+                slave.adr.eq(adr),
+                slave.we.eq(0),
+                slave.sel.eq(2**len(slave.sel)-1),
+                slave.cti.eq(Mux(burst, 2, 7))
             )
-        )
-        fsm.act("WRITE",
-            If(master.stb & master.cyc,
-                write.eq(1),
-                counter_ce.eq(1),
-                master.ack.eq(1),
-                If(counter_done,
-                    NextState("EVICT")
-                )
+        ]
+        self.sync += \
+            If(slave.stb & slave.ack,
+                slave_burst.eq(slave.cti == 2)
             ).Elif(~master.cyc,
-                NextState("EVICT")
-            )
-        )
-        fsm.act("EVICT",
-            evict.eq(1),
-            slave.stb.eq(1),
-            slave.we.eq(1),
-            slave.cyc.eq(1),
-            slave.dat_w.eq(cached_data),
-            slave.sel.eq(cached_sel),
-            If(slave.ack,
-                NextState("IDLE")
+                slave_burst.eq(0)
             )
-        )
-        fsm.act("REFILL",
-            refill.eq(1),
-            slave.stb.eq(1),
-            slave.cyc.eq(1),
-            If(slave.ack,
-                need_refill.ce.eq(1),
-                NextState("READ")
-            )
-        )
-        fsm.act("READ",
-            read.eq(1),
-            If(master.stb & master.cyc,
-                master.ack.eq(1)
-            ),
-            NextState("IDLE")
-        )
 
-        # Address
-        self.comb += [
-            slave.cti.eq(7), # we are not able to generate bursts since up-converting
-            slave.adr.eq(address.q[ratiobits:])
-        ]
 
-        # Datapath
-        cached_datas = [FlipFlop(dw_from) for i in range(ratio)]
-        cached_sels = [FlipFlop(dw_from//8) for i in range(ratio)]
-        self.submodules += cached_datas, cached_sels
+class PipelinedToClassic(Module):
+    """PipelinedToClassic
 
-        cases = {}
-        for i in range(ratio):
-            write_sel = Signal()
-            cases[i] = write_sel.eq(1)
-            self.comb += [
-                cached_sels[i].reset.eq(counter_reset),
-                If(write,
-                    cached_datas[i].d.eq(master.dat_w),
-                ).Else(
-                    cached_datas[i].d.eq(slave.dat_r[dw_from*i:dw_from*(i+1)])
-                ),
-                cached_sels[i].d.eq(master.sel),
-                If((write & write_sel) | refill,
-                    cached_datas[i].ce.eq(1),
-                    cached_sels[i].ce.eq(1)
-                )
-            ]
-        self.comb += Case(counter + counter_offset, cases)
+    This module connects a pipelined master to a classic slave. The request
+    presented by the master is stalled until the slave acks it, so that the
+    slave sees one request at a time.
+    """
+    def __init__(self, master, slave):
+        self.master = master
+        self.slave = slave
 
-        cases = {}
-        for i in range(ratio):
-            cases[i] = master.dat_r.eq(cached_datas[i].q)
-        self.comb += Case(address.q[:ratiobits], cases)
+        # # #
 
-        self.comb += [
-            cached_data.eq(Cat([cached_data.q for cached_data in cached_datas])),
-            cached_sel.eq(Cat([cached_sel.q for cached_sel in cached_sels]))
-        ]
+        for name, size, direction in _layout:
+            if direction == DIR_M_TO_S:
+                self.comb += getattr(slave, name).eq(getattr(master, name))
+            else:
+                self.comb += getattr(master, name).eq(getattr(slave, name))
+        self.comb += master.stall.eq(~(slave.ack | slave.err))
+
+
+class ClassicToPipelined(Module):
+    """ClassicToPipelined
+
+    This module connects a classic master to a pipelined slave. Each request
+    of the master is issued once to the slave, and its ack is returned to
+    the master.
+    """
+    def __init__(self, master, slave):
+        self.master = master
+        self.slave = slave
+
+        # # #
+
+        issued = Signal()
+        for name, size, direction in _layout:
+            if direction == DIR_M_TO_S and name != "stb":
+                self.comb += getattr(slave, name).eq(getattr(master, name))
+            elif direction == DIR_S_TO_M:
+                self.comb += getattr(master, name).eq(getattr(slave, name))
+        self.comb += slave.stb.eq(master.cyc & master.stb & ~issued)
+        self.sync += \
+            If(~master.cyc | slave.ack | slave.err,
+                issued.eq(0)
+            ).Elif(slave.stb & ~slave.stall,
+                issued.eq(1)
+            )
 
 
 class Converter(Module):
@@ -437,6 +624,10 @@ class Converter(Module):
     This module is a wrapper for DownConverter and UpConverter.
     It should preferably be used rather than direct instantiations
     of specific converters.
+
+    Pipelined interfaces are bridged to classic ones around the data width
+    converters (except for pipelined slaves of the DownConverter, which
+    drives them directly), and directly when only the protocol differs.
     """
     def __init__(self, master, slave):
         self.master = master
@@ -446,25 +637,111 @@ class Converter(Module):
 
         dw_from = len(master.dat_r)
         dw_to = len(slave.dat_r)
+        master_pipelined = getattr(master, "pipelined", False)
+        slave_pipelined = getattr(slave, "pipelined", False)
+        if dw_from != dw_to:
+            if master_pipelined:
+                classic_master = Interface(dw_from)
+                self.submodules += PipelinedToClassic(master, classic_master)
+                master = classic_master
+            if slave_pipelined and dw_from < dw_to:
+                classic_slave = Interface(dw_to)
+                self.submodules += ClassicToPipelined(classic_slave, slave)
+                slave = classic_slave
+
         if dw_from > dw_to:
             downconverter = DownConverter(master, slave)
             self.submodules += downconverter
         elif dw_from < dw_to:
             upconverter = UpConverter(master, slave)
             self.submodules += upconverter
+        elif master_pipelined and not slave_pipelined:
+            self.submodules += PipelinedToClassic(master, slave)
+        elif slave_pipelined and not master_pipelined:
+            self.submodules += ClassicToPipelined(master, slave)
         else:
-            master.connect(slave)
+            self.comb += master.connect(slave)
+
+
+def _lru_victim(state, ways):
+    # state lists the ways from the most to the least recently used
+    wb = log2_int(ways)
+    return state[(ways-1)*wb:ways*wb]
+
+
+def _lru_update(state, way, ways):
+    wb = log2_int(ways)
+    entries = [state[i*wb:(i+1)*wb] for i in range(ways)]
+    new = [way]
+    seen = 0
+    for i in range(1, ways):
+        seen = seen | (entries[i-1] == way)
+        new.append(Mux(seen, entries[i], entries[i-1]))
+    return Cat(*new)
+
 
+def _lru_reset(ways):
+    wb = log2_int(ways)
+    return sum(i << (i*wb) for i in range(ways))
 
-class Cache(Module):
+
+def _plru_victim(state, ways):
+    # state is a binary tree of ways-1 bits, each pointing to the less
+    # recently used half of its subtree
+    prefix = None
+    for level in range(log2_int(ways)):
+        nodes = Array(state[2**level-1+i] for i in range(2**level))
+        bit = nodes[prefix] if prefix is not None else state[0]
+        prefix = Cat(bit, prefix) if prefix is not None else bit
+    return prefix
+
+
+def _plru_update(state, way, ways):
+    wb = log2_int(ways)
+    new = []
+    for level in range(wb):
+        for i in range(2**level):
+            on_path = (way[wb-level:] == i) if level else 1
+            new.append(Mux(on_path, ~way[wb-level-1], state[2**level-1+i]))
+    return Cat(*new)
+
+
+class Cache(Module, csr.AutoCSR):
     """Cache
 
     This module is a write-back wishbone cache that can be used as a L2 cache.
     Cachesize (in 32-bit words) is the size of the data store and must be a power of 2
+
+    The cache is organized in sets of ``ways`` lines (1, i.e. direct-mapped,
+    2, 4 or 8). On a miss, the line to replace is chosen with the
+    ``replacement`` policy, ``"lru"`` (least recently used) or ``"plru"``
+    (tree pseudo-LRU, using fewer bits and less logic for 4 and 8 ways).
+    ``linesize`` is the number of master words in a line and defaults to
+    the smallest possible (a single master or slave word).
+
+    With ``critical_word_first``, lines spanning several slave words are
+    refilled starting with the slave word holding the requested master word,
+    and a read is acked as soon as that word arrives. The rest of the line
+    is refilled before the next request is served.
+
+    With ``prefetch``, reading line N+1 right after line N starts fetching
+    line N+2 from the slave into a line buffer, while the master keeps
+    accessing the cache. A miss on the buffered line is refilled from the
+    buffer instead of the slave.
+
+    With ``with_perf_counters``, the cache counts read and write hits and
+    misses, evictions, refill cycles and stall cycles (cycles during which
+    a master request waits for a write-back or a refill). Writing ``update`` latches the counters into
+    their status registers and writing ``clear`` resets them.
     """
-    def __init__(self, cachesize, master, slave):
+    def __init__(self, cachesize, master, slave, ways=1, linesize=None,
+                 replacement="lru", critical_word_first=False, prefetch=False,
+                 with_perf_counters=False, counter_bits=32):
         self.master = master
         self.slave = slave
+        if with_perf_counters:
+            self._update = csr.CSR()
+            self._clear = csr.CSR()
 
         # # #
 
@@ -474,87 +751,204 @@ class Cache(Module):
             raise ValueError("Slave data width must be a multiple of {dw}".format(dw=dw_from))
         if dw_to < dw_from and (dw_from % dw_to) != 0:
             raise ValueError("Master data width must be a multiple of {dw}".format(dw=dw_to))
+        if ways not in (1, 2, 4, 8):
+            raise ValueError("Unsupported number of ways: {}".format(ways))
+        if replacement not in ("lru", "plru"):
+            raise ValueError("Unsupported replacement policy: {}".format(replacement))
+        if critical_word_first and dw_from > dw_to:
+            raise ValueError("Critical word first requires slave words at least as wide as master words")
+        if linesize is None:
+            linesize = max(dw_to//dw_from, 1)
+        linewidth = linesize*dw_from
+        if linewidth < dw_to or linesize & (linesize - 1):
+            raise ValueError("Line size must be a power of 2 and hold a slave word")
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+
+        # Address of the request. It is latched while a line is replaced, as
+        # the master can issue a new request after a critical word first
+        # response.
+        adr = Signal(len(master.adr))
+        adr_r = Signal(len(master.adr))
+        replacing = fsm.ongoing("EVICT") | fsm.ongoing("REFILL_WRTAG") | fsm.ongoing("REFILL")
+        self.comb += adr.eq(Mux(replacing, adr_r, master.adr))
+        self.sync += If(fsm.ongoing("TEST_HIT"), adr_r.eq(master.adr))
 
         # Split address:
-        # TAG | LINE NUMBER | LINE OFFSET
-        offsetbits = log2_int(max(dw_to//dw_from, 1))
-        addressbits = len(slave.adr) + offsetbits
-        linebits = log2_int(cachesize) - offsetbits
-        tagbits = addressbits - linebits
-        wordbits = log2_int(max(dw_from//dw_to, 1))
-        adr_offset, adr_line, adr_tag = split(master.adr, offsetbits, linebits, tagbits)
+        # TAG | SET | LINE OFFSET
+        offsetbits = log2_int(linesize)
+        wordbits = log2_int(linewidth//dw_to)
+        if cachesize < 2*linesize*ways:
+            raise ValueError("Cache must have at least two sets")
+        setbits = log2_int(cachesize//(linesize*ways))
+        tagbits = len(slave.adr) - wordbits - setbits
+        adr_offset, adr_set, adr_tag = split(adr, offsetbits, setbits, tagbits)
+        line = adr[offsetbits:]
         word = Signal(wordbits) if wordbits else None
+        way = Signal(max=max(ways, 2))  # way being replaced
 
-        # Data memory
-        data_mem = Memory(dw_to*2**wordbits, 2**linebits)
-        data_port = data_mem.get_port(write_capable=True, we_granularity=8)
-        self.specials += data_mem, data_port
-
-        write_from_slave = Signal()
+        # Position of the master word in the line. Master words are stored
+        # big-endian in slave words.
+        reversebits = log2_int(max(dw_to//dw_from, 1))
         if adr_offset is None:
-            adr_offset_r = None
+            master_index = master_index_r = None
         else:
-            adr_offset_r = Signal(offsetbits)
-            self.sync += adr_offset_r.eq(adr_offset)
+            if reversebits:
+                master_index = Cat(~adr_offset[:reversebits], adr_offset[reversebits:])
+            else:
+                master_index = adr_offset
+            master_index_r = Signal(offsetbits)
+            self.sync += master_index_r.eq(master_index)
 
+        critical_word_first = critical_word_first and word is not None
+        write_from_slave = Signal()
+        write_from_buffer = Signal()
+        hits = Signal(ways)
+        hit_way = Signal(max=max(ways, 2))
         self.comb += [
-            data_port.adr.eq(adr_line),
-            If(write_from_slave,
-                displacer(slave.dat_r, word, data_port.dat_w),
-                displacer(Replicate(1, dw_to//8), word, data_port.we)
-            ).Else(
-                data_port.dat_w.eq(Replicate(master.dat_w, max(dw_to//dw_from, 1))),
-                If(master.cyc & master.stb & master.we & master.ack,
-                    displacer(master.sel, adr_offset, data_port.we, 2**offsetbits, reverse=True)
-                )
-            ),
-            chooser(data_port.dat_r, word, slave.dat_w),
-            slave.sel.eq(2**(dw_to//8)-1),
-            chooser(data_port.dat_r, adr_offset_r, master.dat_r, reverse=True)
+            If(hits[i], hit_way.eq(i)) for i in reversed(range(ways))
         ]
 
+        # Prefetch buffer, holding line prefetch_line
+        prefetch_line = Signal(len(line))
+        prefetch_valid = Signal()
+        prefetch_busy = Signal()
+        prefetch_data = Signal(linewidth)
+        prefetch_hit = Signal()
+        self.comb += prefetch_hit.eq((prefetch_valid | prefetch_busy) &
+                                     (prefetch_line == line))
 
-        # Tag memory
+        # Data and tag memories, one per way
         tag_layout = [("tag", tagbits), ("dirty", 1)]
-        tag_mem = Memory(layout_len(tag_layout), 2**linebits)
-        tag_port = tag_mem.get_port(write_capable=True)
-        self.specials += tag_mem, tag_port
-        tag_do = Record(tag_layout)
         tag_di = Record(tag_layout)
+        self.comb += tag_di.tag.eq(adr_tag)
+        tag_dos = []
+        data_rs = []
+        for i in range(ways):
+            data_mem = Memory(linewidth, 2**setbits)
+            data_port = data_mem.get_port(write_capable=True, we_granularity=8)
+            self.specials += data_mem, data_port
+            self.comb += [
+                data_port.adr.eq(adr_set),
+                If(write_from_slave,
+                    displacer(slave.dat_r, word, data_port.dat_w),
+                    If(way == i,
+                        displacer(Replicate(1, dw_to//8), word, data_port.we)
+                    )
+                ).Elif(write_from_buffer,
+                    data_port.dat_w.eq(prefetch_data),
+                    If(way == i,
+                        data_port.we.eq(Replicate(1, linewidth//8))
+                    )
+                ).Else(
+                    data_port.dat_w.eq(Replicate(master.dat_w, linewidth//dw_from)),
+                    If(master.cyc & master.stb & master.we & master.ack & hits[i],
+                        displacer(master.sel, master_index, data_port.we,
+                                  linesize)
+                    )
+                )
+            ]
+            data_rs.append(data_port.dat_r)
+
+            tag_mem = Memory(layout_len(tag_layout), 2**setbits)
+            tag_port = tag_mem.get_port(write_capable=True)
+            self.specials += tag_mem, tag_port
+            tag_do = Record(tag_layout)
+            self.comb += [
+                tag_port.adr.eq(adr_set),
+                tag_do.raw_bits().eq(tag_port.dat_r),
+                tag_port.dat_w.eq(tag_di.raw_bits()),
+                hits[i].eq(tag_do.tag == adr_tag)
+            ]
+            tag_dos.append((tag_do, tag_port))
+
+        # Replacement state, one entry per set. It is updated on hits, and
+        # when the refill of a critical word first response completes.
+        replace_update = Signal()
+        victim = Signal(max=max(ways, 2))
+        if ways > 1:
+            if replacement == "lru":
+                victim_fn, update_fn = _lru_victim, _lru_update
+                repl_width, repl_reset = ways*log2_int(ways), _lru_reset(ways)
+            else:
+                victim_fn, update_fn = _plru_victim, _plru_update
+                repl_width, repl_reset = ways - 1, 0
+            repl_mem = Memory(repl_width, 2**setbits, init=[repl_reset]*2**setbits)
+            repl_port = repl_mem.get_port(write_capable=True)
+            self.specials += repl_mem, repl_port
+            self.comb += [
+                repl_port.adr.eq(adr_set),
+                repl_port.dat_w.eq(update_fn(repl_port.dat_r,
+                    Mux(fsm.ongoing("REFILL"), way, hit_way), ways)),
+                repl_port.we.eq(replace_update),
+                victim.eq(victim_fn(repl_port.dat_r, ways))
+            ]
+
+        # Data path to the master (selected by hit) and the slave (by way)
+        line_r = Signal(linewidth)
+        critical_ack = Signal()
         self.comb += [
-            tag_do.raw_bits().eq(tag_port.dat_r),
-            tag_port.dat_w.eq(tag_di.raw_bits())
+            line_r.eq(reduce(or_, [Replicate(hits[i], linewidth) & data_rs[i]
+                                   for i in range(ways)])),
+            chooser(line_r, master_index_r, master.dat_r, linesize),
+            chooser(Array(data_rs)[way], word, slave.dat_w),
+            slave.sel.eq(2**(dw_to//8)-1)
         ]
+        if critical_word_first:
+            self.comb += If(critical_ack,
+                chooser(slave.dat_r, adr_offset[:reversebits] if reversebits else None,
+                        master.dat_r, reverse=True)
+            )
 
+        tag_do = Record(tag_layout)
         self.comb += [
-            tag_port.adr.eq(adr_line),
-            tag_di.tag.eq(adr_tag)
+            tag_do.tag.eq(Array(t.tag for t, p in tag_dos)[way]),
+            tag_do.dirty.eq(Array(t.dirty for t, p in tag_dos)[way])
         ]
         if word is not None:
-            self.comb += slave.adr.eq(Cat(word, adr_line, tag_do.tag))
+            self.comb += slave.adr.eq(Cat(word, adr_set, tag_do.tag))
         else:
-            self.comb += slave.adr.eq(Cat(adr_line, tag_do.tag))
+            self.comb += slave.adr.eq(Cat(adr_set, tag_do.tag))
+
+        tag_we = Signal()
+        tag_hit_we = Signal()
+        for i, (t, port) in enumerate(tag_dos):
+            self.comb += port.we.eq((tag_we & (way == i)) | (tag_hit_we & hits[i]))
 
         # slave word computation, word_clr and word_inc will be simplified
-        # at synthesis when wordbits=0
+        # at synthesis when wordbits=0. The refill starts at word_first and
+        # wraps around.
         word_clr = Signal()
         word_inc = Signal()
+        word_last = Signal()
         if word is not None:
+            word_first = Signal(wordbits)
+            word_next = Signal(wordbits)
+            if critical_word_first:
+                self.comb += word_first.eq(adr_offset[reversebits:])
+            self.comb += [
+                word_next.eq(word + 1),
+                word_last.eq(word_next == word_first)
+            ]
             self.sync += \
                 If(word_clr,
-                    word.eq(0),
+                    word.eq(word_first),
                 ).Elif(word_inc,
-                    word.eq(word+1)
+                    word.eq(word_next)
                 )
+        else:
+            self.comb += word_last.eq(1)
 
-        def word_is_last(word):
-            if word is not None:
-                return word == 2**wordbits-1
-            else:
-                return 1
+        # Sequential access detection for the prefetcher
+        last_line = Signal(len(line))
+        sequential = Signal()
+        sequential_now = Signal()
+        prefetch_trigger = Signal()
+        self.comb += sequential_now.eq(line == last_line + 1)
 
         # Control FSM
-        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        retest = Signal()  # TEST_HIT after a refill
+        served = Signal()  # master acked during the refill
         fsm.act("IDLE",
             If(master.cyc & master.stb,
                 NextState("TEST_HIT")
@@ -562,15 +956,24 @@ class Cache(Module):
         )
         fsm.act("TEST_HIT",
             word_clr.eq(1),
-            If(tag_do.tag == adr_tag,
+            NextValue(retest, 0),
+            If(~retest,
+                NextValue(last_line, line),
+                NextValue(sequential, sequential_now)
+            ),
+            If(hits != 0,
                 master.ack.eq(1),
+                replace_update.eq(1),
                 If(master.we,
                     tag_di.dirty.eq(1),
-                    tag_port.we.eq(1)
+                    tag_hit_we.eq(1)
+                ).Else(
+                    prefetch_trigger.eq(Mux(retest, sequential, sequential_now))
                 ),
                 NextState("IDLE")
             ).Else(
-                If(tag_do.dirty,
+                NextValue(way, victim),
+                If(Array(t.dirty for t, p in tag_dos)[victim],
                     NextState("EVICT")
                 ).Else(
                     NextState("REFILL_WRTAG")
@@ -579,36 +982,140 @@ class Cache(Module):
         )
 
         fsm.act("EVICT",
-            slave.stb.eq(1),
-            slave.cyc.eq(1),
-            slave.we.eq(1),
-            If(slave.ack,
-                word_inc.eq(1),
-                 If(word_is_last(word),
-                    NextState("REFILL_WRTAG")
+            If(~prefetch_busy,
+                slave.stb.eq(1),
+                slave.cyc.eq(1),
+                slave.we.eq(1),
+                If(slave.ack,
+                    word_inc.eq(1),
+                     If(word_last,
+                        NextState("REFILL_WRTAG")
+                    )
                 )
             )
         )
         fsm.act("REFILL_WRTAG",
             # Write the tag first to set the slave address
-            tag_port.we.eq(1),
+            tag_we.eq(1),
             word_clr.eq(1),
             NextState("REFILL")
         )
         fsm.act("REFILL",
-            slave.stb.eq(1),
-            slave.cyc.eq(1),
-            slave.we.eq(0),
-            If(slave.ack,
-                write_from_slave.eq(1),
-                word_inc.eq(1),
-                If(word_is_last(word),
-                    NextState("TEST_HIT"),
-                ).Else(
-                    NextState("REFILL")
+            If(prefetch_hit,
+                If(prefetch_valid,
+                    write_from_buffer.eq(1),
+                    NextValue(retest, 1),
+                    NextState("TEST_HIT")
+                )
+            ).Elif(~prefetch_busy,
+                slave.stb.eq(1),
+                slave.cyc.eq(1),
+                slave.we.eq(0),
+                If(slave.ack,
+                    write_from_slave.eq(1),
+                    word_inc.eq(1),
+                    If(word_last,
+                        If(served,
+                            NextValue(served, 0),
+                            replace_update.eq(1),
+                            prefetch_trigger.eq(sequential),
+                            NextState("IDLE")
+                        ).Else(
+                            NextValue(retest, 1),
+                            NextState("TEST_HIT")
+                        )
+                    )
                 )
             )
         )
+        if critical_word_first:
+            self.comb += critical_ack.eq(fsm.ongoing("REFILL") & ~prefetch_hit &
+                                         ~prefetch_busy & slave.ack &
+                                         (word == word_first) & ~served &
+                                         master.cyc & master.stb & ~master.we)
+            self.comb += If(critical_ack, master.ack.eq(1))
+            self.sync += If(critical_ack, served.eq(1))
+
+        if prefetch:
+            prefetch_word = Signal(wordbits) if wordbits else None
+            prefetch_word_last = Signal()
+            prefetch_start = Signal()
+            prefetch_invalidate = Signal()
+            evicted_line = Signal(setbits + tagbits)
+            n = min(len(line), len(evicted_line))
+            self.comb += [
+                prefetch_start.eq(prefetch_trigger & ~prefetch_busy &
+                                  ~(prefetch_valid & (prefetch_line == line + 1))),
+                evicted_line.eq(Cat(adr_set, tag_do.tag)),
+                prefetch_invalidate.eq(
+                    write_from_buffer |
+                    (fsm.ongoing("EVICT") & slave.ack & word_last &
+                     (prefetch_line[:n] == evicted_line[:n]))),
+                If(prefetch_busy,
+                    slave.cyc.eq(1),
+                    slave.stb.eq(1),
+                    slave.we.eq(0),
+                )
+            ]
+            if prefetch_word is None:
+                self.comb += [
+                    prefetch_word_last.eq(1),
+                    If(prefetch_busy, slave.adr.eq(prefetch_line))
+                ]
+                store = [prefetch_data.eq(slave.dat_r)]
+            else:
+                self.comb += [
+                    prefetch_word_last.eq(prefetch_word == 2**wordbits-1),
+                    If(prefetch_busy, slave.adr.eq(Cat(prefetch_word, prefetch_line)))
+                ]
+                store = [
+                    Case(prefetch_word, {i: prefetch_data[i*dw_to:(i+1)*dw_to].eq(slave.dat_r)
+                                         for i in range(2**wordbits)}),
+                    prefetch_word.eq(prefetch_word + 1)
+                ]
+            self.sync += [
+                If(prefetch_start,
+                    prefetch_line.eq(line + 1),
+                    prefetch_busy.eq(1),
+                    prefetch_valid.eq(0)
+                ).Elif(prefetch_busy & slave.ack,
+                    *store,
+                    If(prefetch_word_last,
+                        prefetch_busy.eq(0),
+                        prefetch_valid.eq(1)
+                    )
+                ).Elif(prefetch_invalidate,
+                    prefetch_valid.eq(0)
+                )
+            ]
+
+        if with_perf_counters:
+            access = fsm.ongoing("TEST_HIT") & ~retest
+            hit = hits != 0
+            victim_dirty = Array(t.dirty for t, p in tag_dos)[victim]
+            events = [
+                ("read_hits",     access & hit & ~master.we),
+                ("read_misses",   access & ~hit & ~master.we),
+                ("write_hits",    access & hit & master.we),
+                ("write_misses",  access & ~hit & master.we),
+                ("evictions",     access & ~hit & victim_dirty),
+                ("refill_cycles", fsm.ongoing("REFILL_WRTAG") | fsm.ongoing("REFILL")),
+                ("stall_cycles",  master.cyc & master.stb & ~master.ack & replacing)
+            ]
+            for name, event in events:
+                status = csr.CSRStatus(counter_bits, name=name)
+                setattr(self, "_" + name, status)
+                counter = Signal(counter_bits)
+                self.sync += [
+                    If(self._clear.re,
+                        counter.eq(0)
+                    ).Elif(event,
+                        counter.eq(counter + 1)
+                    ),
+                    If(self._update.re,
+                        status.status.eq(counter)
+                    )
+                ]
 
 
 class SRAM(Module):
@@ -633,6 +1140,12 @@ class SRAM(Module):
         # memory
         port = self.mem.get_port(write_capable=not read_only, we_granularity=8)
         self.specials += self.mem, port
+        # on pipelined buses, one request is accepted every cycle
+        if getattr(self.bus, "pipelined", False):
+            self.comb += self.bus.stall.eq(0)
+            request = self.bus.cyc & self.bus.stb
+        else:
+            request = self.bus.cyc & self.bus.stb & ~self.bus.ack
         # generate write enable signal
         if not read_only:
             self.comb += [port.we[i].eq(self.bus.cyc & self.bus.stb & self.bus.we & self.bus.sel[i])
@@ -647,7 +1160,7 @@ class SRAM(Module):
         # generate ack
         self.sync += [
             self.bus.ack.eq(0),
-            If(self.bus.cyc & self.bus.stb & ~self.bus.ack,    self.bus.ack.eq(1))
+            If(request,    self.bus.ack.eq(1))
         ]
 
 
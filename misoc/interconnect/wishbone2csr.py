@@ -4,8 +4,12 @@ from migen.genlib.misc import timeline
 from misoc.interconnect import csr_bus, wishbone
 
 
+# With registered=False, the CSR bus is driven combinatorially from the
+# Wishbone bus and accesses are acked after one cycle, which requires CSR
+# slaves returning read data at most one cycle after the address (e.g.
+# non-registered register banks, or memories).
 class WB2CSR(Module):
-    def __init__(self, bus_wishbone=None, bus_csr=None):
+    def __init__(self, bus_wishbone=None, bus_csr=None, registered=True):
         if bus_wishbone is None:
             bus_wishbone = wishbone.Interface()
         self.wishbone = bus_wishbone
@@ -15,6 +19,18 @@ class WB2CSR(Module):
 
         ###
 
+        if not registered:
+            self.comb += [
+                self.csr.adr.eq(self.wishbone.adr),
+                self.csr.dat_w.eq(self.wishbone.dat_w),
+                self.csr.we.eq(self.wishbone.cyc & self.wishbone.stb &
+                               self.wishbone.we & ~self.wishbone.ack),
+                self.wishbone.dat_r.eq(self.csr.dat_r)
+            ]
+            self.sync += self.wishbone.ack.eq(self.wishbone.cyc &
+                self.wishbone.stb & ~self.wishbone.ack)
+            return
+
         self.sync += [
             self.csr.we.eq(0),
             self.csr.dat_w.eq(self.wishbone.dat_w),
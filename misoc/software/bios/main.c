@@ -183,6 +183,22 @@ static void ident(void)
 	printf("Ident: %s\n", buffer);
 }
 
+#ifdef CSR_L2_CACHE_UPDATE_ADDR
+static void l2stats(char *clear)
+{
+	l2_cache_update_write(1);
+	printf("Read hits:     %u\n", l2_cache_read_hits_read());
+	printf("Read misses:   %u\n", l2_cache_read_misses_read());
+	printf("Write hits:    %u\n", l2_cache_write_hits_read());
+	printf("Write misses:  %u\n", l2_cache_write_misses_read());
+	printf("Evictions:     %u\n", l2_cache_evictions_read());
+	printf("Refill cycles: %u\n", l2_cache_refill_cycles_read());
+	printf("Stall cycles:  %u\n", l2_cache_stall_cycles_read());
+	if(strcmp(clear, "clear") == 0)
+		l2_cache_clear_write(1);
+}
+#endif
+
 #ifdef __lm32__
 enum {
 	CSR_IE = 1, CSR_IM, CSR_IP, CSR_ICC, CSR_DCC, CSR_CC, CSR_CFG, CSR_EBA,
@@ -323,6 +339,9 @@ static void help(void)
 #ifdef CSR_DFII_BASE
 	puts("memtest    - run a memory test");
 #endif
+#ifdef CSR_L2_CACHE_UPDATE_ADDR
+	puts("l2stats    - display (and clear) L2 cache counters");
+#endif
 }
 
 static char *get_token(char **str)
@@ -356,6 +375,9 @@ static void do_command(char *c)
 #ifdef CONFIG_L2_SIZE
 	else if(strcmp(token, "flushl2") == 0) flush_l2_cache();
 #endif
+#ifdef CSR_L2_CACHE_UPDATE_ADDR
+	else if(strcmp(token, "l2stats") == 0) l2stats(get_token(&c));
+#endif
 
 #ifdef FLASH_BOOT_ADDRESS
 	else if(strcmp(token, "flashboot") == 0) flashboot();
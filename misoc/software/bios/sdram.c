@@ -77,7 +77,7 @@ void sdrrdbuf(int dq)
 
 	for(p=0;p<DFII_NPHASES;p++)
 		for(i=first_byte;i<DFII_PIX_DATA_SIZE;i+=step)
-			printf("%02x", MMPTR(dfii_pix_rddata_addr[p]+4*i));
+			printf("%02x", dfii_pix_rddata_read(p, i));
 	printf("\n");
 }
 
@@ -141,7 +141,7 @@ void sdrrderr(char *count)
 		cdelay(15);
 		for(p=0;p<DFII_NPHASES;p++)
 			for(i=0;i<DFII_PIX_DATA_SIZE;i++)
-				prev_data[p*DFII_PIX_DATA_SIZE+i] = MMPTR(dfii_pix_rddata_addr[p]+4*i);
+				prev_data[p*DFII_PIX_DATA_SIZE+i] = dfii_pix_rddata_read(p, i);
 
 		for(j=0;j<_count;j++) {
 			command_prd(DFII_COMMAND_CAS|DFII_COMMAND_CS|DFII_COMMAND_RDDATA);
@@ -150,7 +150,7 @@ void sdrrderr(char *count)
 				for(i=0;i<DFII_PIX_DATA_SIZE;i++) {
 					unsigned char new_data;
 
-					new_data = MMPTR(dfii_pix_rddata_addr[p]+4*i);
+					new_data = dfii_pix_rddata_read(p, i);
 					errs[p*DFII_PIX_DATA_SIZE+i] |= prev_data[p*DFII_PIX_DATA_SIZE+i] ^ new_data;
 					prev_data[p*DFII_PIX_DATA_SIZE+i] = new_data;
 				}
@@ -185,7 +185,7 @@ void sdrwr(char *startaddr)
 
 	for(p=0;p<DFII_NPHASES;p++)
 		for(i=0;i<DFII_PIX_DATA_SIZE;i++)
-			MMPTR(dfii_pix_wrdata_addr[p]+4*i) = 0x10*p + i;
+			dfii_pix_wrdata_write(p, i, 0x10*p + i);
 
 	dfii_piwr_address_write(addr);
 	dfii_piwr_baddress_write(0);
@@ -215,7 +215,7 @@ void sdrwloff(void)
 static int write_level(int *delay, int *high_skew)
 {
 	int i;
-	int dq_address;
+	int dq_byte;
 	unsigned char dq;
 	int ok;
 
@@ -224,7 +224,7 @@ static int write_level(int *delay, int *high_skew)
 	sdrwlon();
 	cdelay(100);
 	for(i=0;i<DFII_PIX_DATA_SIZE/2;i++) {
-		dq_address = dfii_pix_rddata_addr[0]+4*(DFII_PIX_DATA_SIZE/2-1-i);
+		dq_byte = DFII_PIX_DATA_SIZE/2-1-i;
 		ddrphy_dly_sel_write(1 << i);
 		ddrphy_wdly_dq_rst_write(1);
 		ddrphy_wdly_dqs_rst_write(1);
@@ -233,7 +233,7 @@ static int write_level(int *delay, int *high_skew)
 
 		ddrphy_wlevel_strobe_write(1);
 		cdelay(10);
-		dq = MMPTR(dq_address);
+		dq = dfii_pix_rddata_read(0, dq_byte);
 		if(dq != 0) {
 			/*
 			 * Assume this DQ group has between 1 and 2 bit times of skew.
@@ -248,7 +248,7 @@ static int write_level(int *delay, int *high_skew)
 				ddrphy_wdly_dqs_inc_write(1);
 				ddrphy_wlevel_strobe_write(1);
 				cdelay(10);
-				dq = MMPTR(dq_address);
+				dq = dfii_pix_rddata_read(0, dq_byte);
 			 }
 		} else
 			high_skew[i] = 0;
@@ -262,7 +262,7 @@ static int write_level(int *delay, int *high_skew)
 
 			ddrphy_wlevel_strobe_write(1);
 			cdelay(10);
-			dq = MMPTR(dq_address);
+			dq = dfii_pix_rddata_read(0, dq_byte);
 		}
 	}
 	sdrwloff();
@@ -334,7 +334,7 @@ static void read_delays(void)
 	/* Write test pattern */
 	for(p=0;p<DFII_NPHASES;p++)
 		for(i=0;i<DFII_PIX_DATA_SIZE;i++)
-			MMPTR(dfii_pix_wrdata_addr[p]+4*i) = prs[DFII_PIX_DATA_SIZE*p+i];
+			dfii_pix_wrdata_write(p, i, prs[DFII_PIX_DATA_SIZE*p+i]);
 	dfii_piwr_address_write(0);
 	dfii_piwr_baddress_write(0);
 	command_pwr(DFII_COMMAND_CAS|DFII_COMMAND_WE|DFII_COMMAND_CS|DFII_COMMAND_WRDATA);
@@ -353,9 +353,9 @@ static void read_delays(void)
 			cdelay(15);
 			working = 1;
 			for(p=0;p<DFII_NPHASES;p++) {
-				if(MMPTR(dfii_pix_rddata_addr[p]+4*i) != prs[DFII_PIX_DATA_SIZE*p+i])
+				if(dfii_pix_rddata_read(p, i) != prs[DFII_PIX_DATA_SIZE*p+i])
 					working = 0;
-				if(MMPTR(dfii_pix_rddata_addr[p]+4*(i+DFII_PIX_DATA_SIZE/2)) != prs[DFII_PIX_DATA_SIZE*p+i+DFII_PIX_DATA_SIZE/2])
+				if(dfii_pix_rddata_read(p, i+DFII_PIX_DATA_SIZE/2) != prs[DFII_PIX_DATA_SIZE*p+i+DFII_PIX_DATA_SIZE/2])
 					working = 0;
 			}
 			if(working)
@@ -377,9 +377,9 @@ static void read_delays(void)
 			cdelay(15);
 			working = 1;
 			for(p=0;p<DFII_NPHASES;p++) {
-				if(MMPTR(dfii_pix_rddata_addr[p]+4*i) != prs[DFII_PIX_DATA_SIZE*p+i])
+				if(dfii_pix_rddata_read(p, i) != prs[DFII_PIX_DATA_SIZE*p+i])
 					working = 0;
-				if(MMPTR(dfii_pix_rddata_addr[p]+4*(i+DFII_PIX_DATA_SIZE/2)) != prs[DFII_PIX_DATA_SIZE*p+i+DFII_PIX_DATA_SIZE/2])
+				if(dfii_pix_rddata_read(p, i+DFII_PIX_DATA_SIZE/2) != prs[DFII_PIX_DATA_SIZE*p+i+DFII_PIX_DATA_SIZE/2])
 					working = 0;
 			}
 			if(!working)
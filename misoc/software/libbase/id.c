@@ -8,12 +8,11 @@
 void get_ident(char *ident)
 {
 #ifdef CSR_IDENTIFIER_MEM_BASE
-    int len, i;
-    
-    len = MMPTR(CSR_IDENTIFIER_MEM_BASE);
-    for(i=0;i<len;i++)
-        ident[i] = MMPTR(CSR_IDENTIFIER_MEM_BASE + 4 + i*4);
-    ident[i] = 0;
+    unsigned char len;
+
+    identifier_mem_read_block(0, &len, 1);
+    identifier_mem_read_block(1, (unsigned char *)ident, len);
+    ident[len] = 0;
 #else
     ident[0] = 0;
 #endif
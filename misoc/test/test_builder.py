@@ -0,0 +1,267 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from migen import Signal
+from migen.fhdl import verilog
+from migen.build.xilinx.ise import XilinxISEToolchain
+from migen.build.xilinx.vivado import XilinxVivadoToolchain
+
+from misoc.interconnect import wishbone
+from misoc.integration.builder import (Builder, _GatewareCache, _SoftwareCache,
+                                       _DeferredRun, _run_scheduled,
+                                       _toolchain_options)
+
+
+class TestGatewareCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.build_dir = os.path.join(self.tmpdir.name, "gateware")
+        self.toolchain_runs = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _build(self, verilog, options=("xc6slx9", "XilinxISEToolchain"),
+               data_files=dict(), mtime_ns=None):
+        # mimics a Migen toolchain: write the inputs, then test ``run``
+        cache = _GatewareCache(self.build_dir, options=options)
+        os.makedirs(self.build_dir, exist_ok=True)
+        files = [("top.v", verilog), ("top.ucf", "NET clk LOC=A1;\n")]
+        for name, contents in files + sorted(data_files.items()):
+            filename = os.path.join(self.build_dir, name)
+            with open(filename, "w") as f:
+                f.write(contents)
+            if mtime_ns is not None:
+                os.utime(filename, ns=(mtime_ns, mtime_ns))
+        if cache:
+            self.toolchain_runs += 1
+            with open(os.path.join(self.build_dir, "top.bit"), "w") as f:
+                f.write("bitstream for " + verilog)
+            with open(os.path.join(self.build_dir, "top.ncd"), "w") as f:
+                f.write("intermediate")
+        cache.store()
+        with open(os.path.join(self.build_dir, "top.bit")) as f:
+            return f.read()
+
+    def test_hit(self):
+        self.assertEqual(self._build("module a;"), "bitstream for module a;")
+        self.assertEqual(self._build("module a;"), "bitstream for module a;")
+        self.assertEqual(self.toolchain_runs, 1)
+
+    def test_miss_and_restore(self):
+        self._build("module a;")
+        self.assertEqual(self._build("module b;"), "bitstream for module b;")
+        self.assertEqual(self._build("module a;"), "bitstream for module a;")
+        self.assertEqual(self.toolchain_runs, 2)
+
+    def test_options(self):
+        self._build("module a;")
+        self._build("module a;", options=("xc6slx9", "XilinxVivadoToolchain"))
+        self.assertEqual(self.toolchain_runs, 2)
+
+    def test_same_mtime(self):
+        # rewritten within the same timestamp tick
+        self._build("module a;", mtime_ns=10**18)
+        self.assertEqual(self._build("module b;", mtime_ns=10**18),
+                         "bitstream for module b;")
+        self.assertEqual(self.toolchain_runs, 2)
+
+    def test_mem_init(self):
+        # external files of Builder(mem_init_files=True)
+        self._build("module a;", data_files={"rom.init": "00000000\n"})
+        self._build("module a;", data_files={"rom.init": "00000000\n"})
+        self._build("module a;", data_files={"rom.init": "deadbeef\n"})
+        self.assertEqual(self.toolchain_runs, 2)
+
+    def test_converted_mem_init(self):
+        # the conversion writes the contents of initialized memories to
+        # their own files, so that the Verilog does not change with them
+        for init in [0x12345678], [0x12345678], [0x9abcdef0]:
+            output = verilog.convert(wishbone.SRAM(16, init=init))
+            self.assertTrue(output.data_files)
+            self._build(output.main_source, data_files=output.data_files)
+        self.assertEqual(self.toolchain_runs, 2)
+
+
+class TestToolchainOptions(unittest.TestCase):
+    def test_ise(self):
+        toolchain = XilinxISEToolchain()
+        options = _toolchain_options(toolchain)
+        self.assertIn(("par_opt", "-ol high -w"), options)
+        toolchain.par_opt = "-ol std -w"
+        self.assertNotEqual(_toolchain_options(toolchain), options)
+
+    def test_vivado(self):
+        toolchain = XilinxVivadoToolchain()
+        options = _toolchain_options(toolchain)
+        toolchain.additional_commands.append("report_power")
+        self.assertNotEqual(_toolchain_options(toolchain), options)
+        # HDL objects are left out
+        toolchain.clocks[Signal()] = 10.0
+        self.assertNotIn("clocks",
+                         [name for name, value in _toolchain_options(toolchain)])
+
+
+class TestSoftwareCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _build_dir(self, name, csr_header):
+        build_dir = os.path.join(self.tmpdir.name, name)
+        generated_dir = os.path.join(build_dir, "include", "generated")
+        os.makedirs(generated_dir)
+        with open(os.path.join(generated_dir, "csr.h"), "w") as f:
+            f.write(csr_header)
+        with open(os.path.join(generated_dir, "variables.mak"), "w") as f:
+            f.write("BUILDINC_DIRECTORY=" + build_dir + "\n")
+        lib_dir = os.path.join(build_dir, "libbase")
+        os.makedirs(lib_dir)
+        return generated_dir, lib_dir
+
+    def test_cache(self):
+        generated_a, lib_a = self._build_dir("a", "#define CSR_BASE 0\n")
+        generated_b, lib_b = self._build_dir("b", "#define CSR_BASE 0\n")
+        generated_c, lib_c = self._build_dir("c", "#define CSR_BASE 4\n")
+
+        cache = _SoftwareCache(self.cache_dir, "lm32", generated_a)
+        key = cache.key("libbase", "/src/libbase")
+        self.assertFalse(cache.fetch(key, lib_a))
+        with open(os.path.join(lib_a, "libbase.a"), "w") as f:
+            f.write("archive")
+        cache.store(key, lib_a)
+
+        # only the build paths differ
+        cache = _SoftwareCache(self.cache_dir, "lm32", generated_b)
+        self.assertEqual(cache.key("libbase", "/src/libbase"), key)
+        self.assertTrue(cache.fetch(key, lib_b))
+        with open(os.path.join(lib_b, "libbase.a")) as f:
+            self.assertEqual(f.read(), "archive")
+
+        cache = _SoftwareCache(self.cache_dir, "lm32", generated_c)
+        self.assertNotEqual(cache.key("libbase", "/src/libbase"), key)
+        cache = _SoftwareCache(self.cache_dir, "or1k", generated_a)
+        self.assertNotEqual(cache.key("libbase", "/src/libbase"), key)
+
+    def test_relative_directory(self):
+        # resolved before the pipelined build changes the working directory
+        builder = Builder(None, output_dir=self.tmpdir.name,
+                          software_cache="software_cache")
+        self.assertEqual(builder.software_cache,
+                         os.path.join(os.getcwd(), "software_cache"))
+
+    def test_sources(self):
+        generated_dir, lib_dir = self._build_dir("a", "#define CSR_BASE 0\n")
+        src_dir = os.path.join(self.tmpdir.name, "src")
+        os.makedirs(src_dir)
+        def write_source(contents):
+            with open(os.path.join(src_dir, "main.c"), "w") as f:
+                f.write(contents)
+        cache = _SoftwareCache(self.cache_dir, "lm32", generated_dir)
+        write_source("int x;\n")
+        key = cache.key("libbase", src_dir)
+        write_source("int y;\n")
+        self.assertNotEqual(cache.key("libbase", src_dir), key)
+        write_source("int x;\n")
+        self.assertEqual(cache.key("libbase", src_dir), key)
+
+    @unittest.skipIf(os.name == "nt", "the compiler stand-in is a shell script")
+    def test_compiler(self):
+        generated_dir, lib_dir = self._build_dir("a", "#define CSR_BASE 0\n")
+        bin_dir = os.path.join(self.tmpdir.name, "bin")
+        os.makedirs(bin_dir)
+        def install_compiler(version):
+            gcc = os.path.join(bin_dir, "lm32-elf-gcc")
+            with open(gcc, "w") as f:
+                f.write("#!/bin/sh\necho lm32-elf-gcc {}\n".format(version))
+            os.chmod(gcc, 0o755)
+            return _SoftwareCache(self.cache_dir, "lm32", generated_dir)
+        path = os.environ["PATH"]
+        os.environ["PATH"] = bin_dir + os.pathsep + path
+        try:
+            key = install_compiler("4.9.2").key("libbase", "/src/libbase")
+            self.assertNotEqual(install_compiler("5.3.0").key("libbase", "/src/libbase"),
+                                key)
+            self.assertEqual(install_compiler("4.9.2").key("libbase", "/src/libbase"),
+                             key)
+        finally:
+            os.environ["PATH"] = path
+
+
+class TestDeferredRun(unittest.TestCase):
+    def test_deferred_run(self):
+        log = []
+        run = _DeferredRun(lambda: log.append("hook"), True)
+        self.assertEqual(log, [])
+        self.assertTrue(run)
+        self.assertTrue(run)
+        self.assertEqual(log, ["hook"])
+        self.assertFalse(_DeferredRun(lambda: None, False))
+
+
+class TestScheduler(unittest.TestCase):
+    dependencies = {"bios": ["libcompiler-rt", "libbase", "libnet"]}
+    tasks = ["libcompiler-rt", "libbase", "libnet", "bios"]
+
+    def test_order(self):
+        lock = threading.Lock()
+        log = []
+        def fn(task, jobs):
+            with lock:
+                log.append(("start", task))
+            time.sleep(0.01)
+            with lock:
+                log.append(("end", task))
+        _run_scheduled(self.tasks, self.dependencies, fn, 4)
+        start_bios = log.index(("start", "bios"))
+        for dep in self.dependencies["bios"]:
+            self.assertLess(log.index(("end", dep)), start_bios)
+        # independent libraries are compiled concurrently
+        self.assertEqual([e for e, t in log[:3]], ["start"]*3)
+
+    def test_jobs(self):
+        lock = threading.Lock()
+        shares = dict()
+        running = [0]
+        peak = [0]
+        def fn(task, jobs):
+            with lock:
+                shares[task] = jobs
+                running[0] += jobs
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= jobs
+        _run_scheduled(self.tasks, self.dependencies, fn, 8)
+        # the slots of the libraries are split between them, then all go
+        # to the BIOS
+        self.assertEqual(shares, {"libcompiler-rt": 2, "libbase": 3,
+                                  "libnet": 3, "bios": 8})
+        self.assertEqual(peak[0], 8)
+
+    def test_sequential(self):
+        log = []
+        _run_scheduled(self.tasks, self.dependencies,
+                       lambda task, jobs: log.append(task), 1)
+        self.assertEqual(log, self.tasks)
+
+    def test_error(self):
+        log = []
+        def fn(task, jobs):
+            if task == "libbase":
+                raise OSError
+            log.append(task)
+        with self.assertRaises(OSError):
+            _run_scheduled(self.tasks, self.dependencies, fn, 2)
+        self.assertNotIn("bios", log)
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            _run_scheduled(["bios"], self.dependencies,
+                           lambda task, jobs: None, 2)
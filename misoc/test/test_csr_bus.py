@@ -0,0 +1,381 @@
+import unittest
+
+from migen import *
+from migen.util.misc import xdir
+
+from misoc.interconnect.csr import *
+from misoc.interconnect import csr_bus, wishbone, wishbone2csr
+from misoc.interconnect.csr_bus import CSRBankArray
+from misoc.integration.soc_core import _allocate_csr_addresses
+from misoc.integration.cpu_interface import get_csr_header, get_csr_rust
+
+
+class _Peripheral(Module, AutoCSR):
+    def __init__(self):
+        self._ctrl = CSRStorage(8)
+        self._status = CSRStatus(8)
+        self.mem = Memory(8, 16)
+
+
+class _Info(Module, AutoCSR):
+    # constants only, not a CSR device
+    def __init__(self):
+        self.revision = CSRConstant(3)
+
+
+class _Source(Module):
+    def __init__(self, n, n_other=0):
+        self.names = []
+        for i in range(n):
+            name = "periph{}".format(i)
+            setattr(self.submodules, name, _Peripheral())
+            self.names.append(name)
+        for i in range(n_other):
+            setattr(self.submodules, "other{}".format(i), Module())
+        self.submodules.info = _Info()
+
+
+def _scan(source, csr_devices, names):
+    addresses = _allocate_csr_addresses({}, csr_devices, 2**20)
+    def address_map(name, memory):
+        if memory is not None:
+            name = name + "_" + memory.name_override
+        return addresses.get(name)
+    return CSRBankArray(source, address_map, names=names)
+
+
+class _WidePeripheral(Module, AutoCSR):
+    def __init__(self):
+        self.timer = CSRStatus(64)
+        self.status = CSRStatus(12)
+        self.load = CSRStorage(64, atomic_write=True)
+        self.ctrl = CSRStorage(24)
+        self.mem = Memory(32, 1024, init=[0x12345678, 0x9abcdef0])
+
+
+class _WideSource(Module):
+    def __init__(self):
+        self.submodules.periph = _WidePeripheral()
+
+
+class _CSRSystem(Module):
+    # Wishbone to CSR bridge, a register bank and a paged memory
+    def __init__(self, data_width, bridge_registered=True, bank_registered=True):
+        self.data_width = data_width
+        self.wishbone = wishbone.Interface()
+        self.submodules.wishbone2csr = wishbone2csr.WB2CSR(
+            self.wishbone, csr_bus.Interface(data_width),
+            registered=bridge_registered)
+        self.source = _WideSource()
+        self.submodules.csrbankarray = CSRBankArray(self.source,
+            lambda name, memory: 0 if memory is None else 1,
+            registered=bank_registered, data_width=data_width)
+        self.submodules.csrcon = csr_bus.Interconnect(
+            self.wishbone2csr.csr, self.csrbankarray.get_buses())
+        self.submodules += self.source
+        name, self.csrs, _, _ = self.csrbankarray.banks[0]
+
+    def address(self, name):
+        # as in the generated headers, CSRs are allocated consecutive words
+        address = 0
+        for csr in self.csrs:
+            nwords = (csr.size + self.data_width - 1)//self.data_width
+            if csr.name == name:
+                return address, nwords
+            address += nwords
+        raise KeyError(name)
+
+    def read(self, name):
+        address, nwords = self.address(name)
+        r = 0
+        for i in range(nwords):
+            r = (r << self.data_width) | (yield from self.wishbone.read(address + i))
+        return r
+
+    def write(self, name, value):
+        address, nwords = self.address(name)
+        for i in range(nwords):
+            shift = (nwords - 1 - i)*self.data_width
+            yield from self.wishbone.write(address + i,
+                (value >> shift) & (2**self.data_width - 1))
+
+    def mem_address(self, index):
+        csrw_per_memw = (32 + self.data_width - 1)//self.data_width
+        offset = index*csrw_per_memw
+        return offset//512, 512 + offset % 512, csrw_per_memw
+
+    def mem_read(self, index):
+        page, address, nwords = self.mem_address(index)
+        yield from self.write("mem_page", page)
+        r = 0
+        for i in range(nwords):
+            r = (r << self.data_width) | (yield from self.wishbone.read(address + i))
+        return r
+
+    def mem_write(self, index, value):
+        page, address, nwords = self.mem_address(index)
+        yield from self.write("mem_page", page)
+        for i in range(nwords):
+            shift = (nwords - 1 - i)*self.data_width
+            yield from self.wishbone.write(address + i,
+                (value >> shift) & (2**self.data_width - 1))
+
+
+class TestDataWidth(unittest.TestCase):
+    def check(self, data_width, **kwargs):
+        dut = _CSRSystem(data_width, **kwargs)
+        periph = dut.source.periph
+        def gen():
+            yield periph.timer.status.eq(0x0123456789abcdef)
+            yield periph.status.status.eq(0xabc)
+            yield
+            self.assertEqual((yield from dut.read("timer")), 0x0123456789abcdef)
+            self.assertEqual((yield from dut.read("status")), 0xabc)
+
+            # atomic: the storage only changes when the last word is written
+            address, nwords = dut.address("load")
+            for i in range(nwords - 1):
+                yield from dut.wishbone.write(address + i, 2**data_width - 1)
+                self.assertEqual((yield periph.load.storage), 0)
+            yield from dut.wishbone.write(address + nwords - 1, 0)
+            yield
+            self.assertEqual((yield periph.load.storage),
+                             (2**64 - 1) ^ (2**data_width - 1))
+            yield from dut.write("load", 0xfedcba9876543210)
+            yield
+            self.assertEqual((yield periph.load.storage), 0xfedcba9876543210)
+            self.assertEqual((yield from dut.read("load")), 0xfedcba9876543210)
+
+            yield from dut.write("ctrl", 0x5a5a5a)
+            yield
+            self.assertEqual((yield periph.ctrl.storage), 0x5a5a5a)
+            self.assertEqual((yield from dut.read("ctrl")), 0x5a5a5a)
+
+            self.assertEqual((yield from dut.mem_read(1)), 0x9abcdef0)
+            for index in 0, 300, 1023:
+                yield from dut.mem_write(index, 0x1000*index + 0xcafe)
+            for index in 0, 300, 1023:
+                self.assertEqual((yield from dut.mem_read(index)), 0x1000*index + 0xcafe)
+        run_simulation(dut, gen())
+
+    def test_8(self):
+        self.check(8)
+
+    def test_16(self):
+        self.check(16)
+
+    def test_32(self):
+        self.check(32)
+
+    def test_header(self):
+        csrs = _CSRSystem(32).csrs
+        header = get_csr_header([("periph", 0xe0000000, 32, csrs)], [])
+        # one access per 32-bit word
+        self.assertIn("static inline unsigned long long int periph_timer_read(void) {\n"
+                      "\tunsigned long long int r = MMPTR(0xe0000000);\n"
+                      "\tr <<= 32;\n"
+                      "\tr |= MMPTR(0xe0000004);\n"
+                      "\treturn r;\n}\n", header)
+        self.assertIn("static inline unsigned int periph_ctrl_read(void) {\n"
+                      "\treturn MMPTR(0xe0000014);\n}\n", header)
+
+
+class TestMemoryAccessors(unittest.TestCase):
+    def regions(self, data_width):
+        dut = _CSRSystem(data_width)
+        _, memory, _, _ = dut.csrbankarray.srams[0]
+        return [("periph", 0xe0000000, data_width, dut.csrs),
+                ("periph_mem", 0xe0000800, data_width, memory)]
+
+    def test_paged(self):
+        header = get_csr_header(self.regions(8), [])
+        # four bytes per word, 128 words per page
+        self.assertIn("static inline void periph_mem_read_block(unsigned int offset, "
+                      "unsigned int *buf, unsigned int len) {\n", header)
+        self.assertIn("\t\tperiph_mem_page_write(offset/128);\n"
+                      "\t\tp = (volatile unsigned int *)0xe0000800 + 4*(offset % 128);\n"
+                      "\t\tn = 128 - offset % 128;\n", header)
+        self.assertIn("v = p[0]; v <<= 8; v |= p[1]; v <<= 8; v |= p[2]; "
+                      "v <<= 8; v |= p[3]; buf[0] = v;", header)
+        self.assertIn("p[0] = buf[0] >> 24; p[1] = buf[0] >> 16; "
+                      "p[2] = buf[0] >> 8; p[3] = buf[0];", header)
+
+    def test_unrolled(self):
+        header = get_csr_header(self.regions(32), [])
+        # one word per CSR word, unrolled by four
+        self.assertIn("\t\tperiph_mem_page_write(offset/512);\n", header)
+        self.assertIn("\t\tfor(; n >= 4; n -= 4) {\n"
+                      "\t\t\tbuf[0] = p[0];\n"
+                      "\t\t\tbuf[1] = p[1];\n"
+                      "\t\t\tbuf[2] = p[2];\n"
+                      "\t\t\tbuf[3] = p[3];\n", header)
+
+    def test_rust(self):
+        rust = get_csr_rust(self.regions(8), [])
+        self.assertIn("  pub mod periph_mem {\n", rust)
+        self.assertIn("    pub unsafe fn read_block(offset: usize, buf: &mut [u32]) {\n", rust)
+        self.assertIn("    pub unsafe fn write_block(offset: usize, buf: &[u32]) {\n", rust)
+        self.assertIn("        super::periph::mem_page_write((offset / 128) as u8);\n", rust)
+
+
+def _count_cycles(dut, generator):
+    cycles = 0
+    def gen():
+        nonlocal cycles
+        for _ in range(2):  # let the reset values settle
+            yield
+        start = dut.cycle
+        yield from generator
+        cycles = dut.cycle - start
+    dut.cycle = 0
+    done = False
+    def clock():
+        while not done:
+            dut.cycle += 1
+            yield
+    def run():
+        nonlocal done
+        yield from gen()
+        done = True
+    run_simulation(dut, [run(), clock()])
+    return cycles
+
+
+class TestLowLatency(unittest.TestCase):
+    def test_access(self):
+        for data_width in 8, 32:
+            for bank_registered in True, False:
+                with self.subTest(data_width=data_width,
+                                  bank_registered=bank_registered):
+                    TestDataWidth.check(self, data_width,
+                                        bridge_registered=False,
+                                        bank_registered=bank_registered)
+
+    def test_cycles(self):
+        def cycles(**kwargs):
+            dut = _CSRSystem(32, **kwargs)
+            def gen():
+                for i in range(8):
+                    yield from dut.wishbone.read(dut.address("status")[0])
+            return _count_cycles(dut, gen())
+        self.assertEqual(cycles(bridge_registered=False), 8*2)
+        self.assertEqual(cycles(bridge_registered=False, bank_registered=False), 8*2)
+        self.assertEqual(cycles(), 8*4)
+
+
+class TestAllocateCSRAddresses(unittest.TestCase):
+    def test_automatic(self):
+        self.assertEqual(_allocate_csr_addresses({}, ["a", "b", "c"], 32),
+                         {"a": 0, "b": 1, "c": 2})
+
+    def test_fixed(self):
+        self.assertEqual(_allocate_csr_addresses({"x": 1, "b": 5}, ["a", "b", "c"], 32),
+                         {"x": 1, "b": 5, "a": 0, "c": 2})
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            _allocate_csr_addresses({"a": 1, "b": 1}, [], 32)
+        with self.assertRaises(ValueError):
+            _allocate_csr_addresses({"a": 32}, [], 32)
+        with self.assertRaises(ValueError):
+            _allocate_csr_addresses({}, ["a", "b", "c"], 2)
+
+
+class TestCSRBankArray(unittest.TestCase):
+    def test_names(self):
+        source = _Source(4, 4)
+        csr_devices = ["periph0", "periph2", "periph2_mem", "periph3_mem"]
+        full = _scan(source, csr_devices, None)
+        indexed = _scan(source, csr_devices, ["periph0", "periph2", "periph3", "missing"])
+        for a, b in ((full.banks, indexed.banks), (full.srams, indexed.srams)):
+            self.assertEqual([(name, mapaddr) for name, _, mapaddr, _ in a],
+                             [(name, mapaddr) for name, _, mapaddr, _ in b])
+        self.assertEqual([name for name, *_ in indexed.banks],
+                         ["periph0", "periph2"])
+        self.assertEqual([name for name, *_ in indexed.srams],
+                         ["periph2", "periph3"])
+
+    def test_constants(self):
+        source = _Source(2)
+        indexed = _scan(source, ["periph0"], ["periph0"])
+        self.assertEqual([(name, constant.name, constant.value.value)
+                          for name, constant in indexed.constants],
+                         [("info", "revision", 3)])
+        self.assertEqual([name for name, *_ in indexed.banks], ["periph0"])
+
+
+def _benchmark():
+    import time
+
+    # Discovery only: the address map declines every object, so that the
+    # (identical) bank construction cost does not hide the scanning cost.
+    def discover(source, names):
+        CSRBankArray(source, lambda name, memory: None, names=names)
+
+    print("{:>8} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "devices", "attributes", "index (ms)", "dict (ms)",
+        "xdir (ms)", "named (ms)"))
+    for n in 16, 64, 256, 1024:
+        csr_devices = []
+        for i in range(n):
+            csr_devices += ["periph{}".format(i), "periph{}_mem".format(i)]
+
+        t0 = time.perf_counter()
+        for name in csr_devices:
+            csr_devices.index(name)
+        t_index = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        addresses = _allocate_csr_addresses({}, csr_devices, 2**20)
+        for name in csr_devices:
+            addresses.get(name)
+        t_dict = time.perf_counter() - t0
+
+        source = _Source(n, 4*n)
+        attributes = len(list(xdir(source)))
+        t0 = time.perf_counter()
+        discover(source, None)
+        t_xdir = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        discover(source, source.names)
+        t_named = time.perf_counter() - t0
+
+        print("{:>8} {:>10} {:>10.2f} {:>10.2f} {:>12.2f} {:>12.2f}".format(
+            n, attributes, 1e3*t_index, 1e3*t_dict, 1e3*t_xdir, 1e3*t_named))
+
+
+def _polling_benchmark():
+    # A CPU polls a 32-bit status register until it is non-zero, then
+    # acknowledges by writing a control register, with one cycle of
+    # instruction overhead between bus accesses.
+    polls = 64
+    configs = [
+        ("registered", {}),
+        ("low latency", {"bridge_registered": False}),
+        ("low latency, comb. banks", {"bridge_registered": False,
+                                      "bank_registered": False})
+    ]
+    print("{:<26} {:>6} {:>14} {:>16}".format(
+        "mode", "width", "cycles/read", "cycles/poll+ack"))
+    for data_width in 8, 32:
+        for name, kwargs in configs:
+            dut = _CSRSystem(data_width, **kwargs)
+            def read_loop():
+                for i in range(polls):
+                    yield from dut.read("status")
+                    yield
+            def poll_loop():
+                for i in range(polls):
+                    yield from dut.read("status")
+                    yield
+                    yield from dut.write("ctrl", i)
+                    yield
+            read = _count_cycles(dut, read_loop())/polls
+            dut = _CSRSystem(data_width, **kwargs)
+            poll = _count_cycles(dut, poll_loop())/polls
+            print("{:<26} {:>6} {:>14.2f} {:>16.2f}".format(
+                name, data_width, read, poll))
+
+
+if __name__ == "__main__":
+    _benchmark()
+    _polling_benchmark()
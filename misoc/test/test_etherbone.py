@@ -0,0 +1,362 @@
+import queue
+import socket
+import threading
+import time
+import unittest
+
+from migen import *
+from migen.sim import passive
+
+from misoc.cores.liteeth_mini.common import eth_phy_layout
+from misoc.cores.liteeth_mini.etherbone import LiteEthEtherbone
+from misoc.cores.liteeth_mini.mac import LiteEthMAC
+from misoc.interconnect import stream, wishbone
+from misoc.host import CSRMap, Client, EtherboneTransport
+from misoc.host.etherbone import encode_header, encode_record
+
+
+DEVICE_MAC = 0x10e2d5000000
+DEVICE_IP = "192.168.1.50"
+HOST_MAC = 0x02000000cafe
+HOST_IP = "192.168.1.100"
+HOST_PORT = 40000
+
+
+def _ip(address):
+    return int.from_bytes(socket.inet_aton(address), "big")
+
+
+def _checksum(header):
+    s = sum(int.from_bytes(header[i:i+2], "big") for i in range(0, len(header), 2))
+    while s >> 16:
+        s = (s & 0xffff) + (s >> 16)
+    return ~s & 0xffff
+
+
+def _ethernet(dst, src, ethertype, payload):
+    frame = dst.to_bytes(6, "big") + src.to_bytes(6, "big")
+    frame += ethertype.to_bytes(2, "big") + payload
+    # padded as by the MAC
+    return frame + bytes(max(60 - len(frame), 0))
+
+
+def _udp_frame(payload, dst_port=1234, dst_ip=DEVICE_IP, dst_mac=DEVICE_MAC):
+    udp = HOST_PORT.to_bytes(2, "big") + dst_port.to_bytes(2, "big")
+    udp += (8 + len(payload)).to_bytes(2, "big") + bytes(2) + payload
+    ip = bytes([0x45, 0]) + (20 + len(udp)).to_bytes(2, "big")
+    ip += bytes([0, 0, 0x40, 0, 64, 17, 0, 0])
+    ip += socket.inet_aton(HOST_IP) + socket.inet_aton(dst_ip)
+    ip = ip[:10] + _checksum(ip).to_bytes(2, "big") + ip[12:]
+    return _ethernet(dst_mac, HOST_MAC, 0x0800, ip + udp)
+
+
+def _arp_request(ip):
+    arp = bytes([0, 1, 8, 0, 6, 4, 0, 1])
+    arp += HOST_MAC.to_bytes(6, "big") + socket.inet_aton(HOST_IP)
+    arp += bytes(6) + socket.inet_aton(ip)
+    return _ethernet(2**48 - 1, HOST_MAC, 0x0806, arp)
+
+
+class _Network:
+    # socket-like host side of an _EtherboneSystem, used from another thread
+    # than the simulation. Replies are parsed and checked as by a host stack.
+    def __init__(self):
+        self.to_device = queue.Queue()
+        self.from_device = queue.Queue()
+        self.timeout = None
+        self.done = False
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendto(self, payload, address):
+        self.send_frame(_udp_frame(payload, address[1], address[0]))
+
+    def send_frame(self, frame, error=False):
+        self.to_device.put((frame, error))
+
+    def idle(self, cycles):
+        self.to_device.put(cycles)
+
+    def receive_frame(self):
+        # the simulation is much slower than a device: other timeouts than
+        # zero (non-blocking) are extended
+        try:
+            if self.timeout == 0:
+                return self.from_device.get_nowait()
+            return self.from_device.get(timeout=60)
+        except queue.Empty:
+            raise socket.timeout
+
+    def recvfrom(self, n):
+        frame = self.receive_frame()
+        assert int.from_bytes(frame[:6], "big") == HOST_MAC
+        assert int.from_bytes(frame[6:12], "big") == DEVICE_MAC
+        assert frame[12:14] == bytes([8, 0])
+        ip, udp = frame[14:34], frame[34:]
+        assert _checksum(ip) == 0
+        assert ip[16:20] == socket.inet_aton(HOST_IP)
+        length = int.from_bytes(ip[2:4], "big")
+        assert int.from_bytes(udp[2:4], "big") == HOST_PORT
+        assert int.from_bytes(udp[4:6], "big") == length - 20
+        address = (socket.inet_ntoa(ip[12:16]), int.from_bytes(udp[:2], "big"))
+        return bytes(udp[8:length - 20]), address
+
+
+class _PHY:
+    dw = 8
+
+    def __init__(self):
+        self.sink = stream.Endpoint(eth_phy_layout(8))
+        self.source = stream.Endpoint(eth_phy_layout(8))
+
+
+class _EtherboneSystem(Module):
+    # bridge to a SRAM, with frames exchanged either with the bridge
+    # directly, one word every ``cycles_per_word``, or with a full MAC
+    # through a PHY
+    def __init__(self, mac=False, cycles_per_word=1, ip_address=DEVICE_IP):
+        if mac:
+            self.clock_domains.cd_eth_rx = ClockDomain()
+            self.clock_domains.cd_eth_tx = ClockDomain()
+            phy = _PHY()
+            self.submodules.ethmac = LiteEthMAC(phy, 32, interface="etherbone",
+                with_preamble_crc=False,
+                mac_address=DEVICE_MAC, ip_address=_ip(ip_address))
+            master = self.ethmac.master
+            self.sink, self.source = phy.source, phy.sink
+            self.dw = 8
+        else:
+            self.submodules.etherbone = LiteEthEtherbone(DEVICE_MAC, _ip(ip_address))
+            master = self.etherbone.master
+            self.sink, self.source = self.etherbone.sink, self.etherbone.source
+            self.dw = 32
+        self.mac = mac
+        self.cycles_per_word = cycles_per_word
+        self.submodules.sram = wishbone.SRAM(4096)
+        self.submodules += wishbone.InterconnectPointToPoint(master, self.sram.bus)
+        self.network = _Network()
+        self.cycles = 0
+
+    def send(self, frame, error):
+        nbytes = self.dw//8
+        frame = frame + bytes(-len(frame) % nbytes)
+        for i in range(0, len(frame), nbytes):
+            last = i + nbytes >= len(frame)
+            yield self.sink.stb.eq(1)
+            yield self.sink.data.eq(int.from_bytes(frame[i:i+nbytes], "big"))
+            yield self.sink.eop.eq(last)
+            yield self.sink.error.eq(error and last)
+            yield
+            while not (yield self.sink.ack):
+                yield
+            yield self.sink.stb.eq(0)
+            for j in range(self.cycles_per_word - 1):
+                yield
+
+    def device_rx(self):
+        while True:
+            try:
+                item = self.network.to_device.get_nowait()
+            except queue.Empty:
+                if self.network.done:
+                    return
+                yield
+                continue
+            if isinstance(item, int):
+                for i in range(item):
+                    yield
+            else:
+                yield from self.send(*item)
+
+    @passive
+    def device_tx(self):
+        frame = bytearray()
+        while True:
+            yield self.source.ack.eq(1)
+            yield
+            if (yield self.source.stb):
+                data = (yield self.source.data)
+                if self.dw == 8:
+                    frame.append(data)
+                elif (yield self.source.eop):
+                    last_be = (yield self.source.last_be)
+                    frame += data.to_bytes(4, "big")[:4 - log2_int(last_be)]
+                else:
+                    frame += data.to_bytes(4, "big")
+                if (yield self.source.eop):
+                    self.network.from_device.put(bytes(frame))
+                    frame = bytearray()
+                if self.cycles_per_word > 1:
+                    yield self.source.ack.eq(0)
+                    for i in range(self.cycles_per_word - 1):
+                        yield
+
+    @passive
+    def clock(self):
+        while True:
+            self.cycles += 1
+            yield
+
+    def run(self, host):
+        error = None
+        def target():
+            nonlocal error
+            try:
+                host()
+            except BaseException as e:
+                error = e
+            finally:
+                self.network.done = True
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        if self.mac:
+            run_simulation(self, {
+                    "sys": [self.clock()],
+                    "eth_rx": [self.device_rx()],
+                    "eth_tx": [self.device_tx()]
+                }, clocks={"sys": 10, "eth_rx": 10, "eth_tx": 10})
+        else:
+            run_simulation(self, [self.device_rx(), self.device_tx(), self.clock()])
+        thread.join()
+        if error is not None:
+            raise error
+
+
+def _transport(dut, **kwargs):
+    return EtherboneTransport(DEVICE_IP, sock=dut.network, **kwargs)
+
+
+class TestEtherbone(unittest.TestCase):
+    def test_read_write(self):
+        dut = _EtherboneSystem()
+        transport = _transport(dut)
+        data = [(0x01020304*i) & 0xffffffff for i in range(16)]
+        def host():
+            self.assertEqual(transport.transact([
+                ("write", 0x100, data),
+                ("write", 0x20, [0xdeadbeef]),
+                ("read", 0x20, 1),
+                ("read", 0x100, 16),
+                ("write", 0x20, [0x12345678]),
+                ("read", 0x20, 1)
+            ]), [None, None, [0xdeadbeef], data, None, [0x12345678]])
+            # all records in one packet
+            self.assertEqual(transport.packets, 1)
+        dut.run(host)
+
+    def test_pipeline(self):
+        dut = _EtherboneSystem()
+        transport = _transport(dut, window=2)
+        transport.max_packet = 64
+        operations = [("write", 0x100 + 16*i, [i, i + 1, i + 2, i + 3])
+                      for i in range(8)]
+        operations += [("read", 0x100 + 16*i, 4) for i in range(8)]
+        def host():
+            results = transport.transact(operations)
+            self.assertEqual(results[8:],
+                             [[i, i + 1, i + 2, i + 3] for i in range(8)])
+            self.assertEqual(transport.packets, 8)
+        dut.run(host)
+
+    def test_late_reply(self):
+        # the reply to a read of an earlier transaction arrives during this
+        # one, with the same shape
+        dut = _EtherboneSystem()
+        transport = _transport(dut)
+        def host():
+            transport.transact([("write", 0x20, [0xdeadbeef]),
+                                ("write", 0x100, [0x12345678])])
+            dut.network.sendto(encode_header() + encode_record(
+                return_address=0, read_addresses=[0x20]), transport.address)
+            self.assertEqual(transport.transact([("read", 0x100, 1)]),
+                             [[0x12345678]])
+            # replies of earlier transactions left in the socket
+            dut.network.sendto(encode_header() + encode_record(
+                return_address=0, read_addresses=[0x20]), transport.address)
+            dut.network.sendto(encode_header(), transport.address)
+            while dut.network.from_device.qsize() < 2:
+                time.sleep(0.01)
+            self.assertEqual(transport.transact([("read", 0x100, 1)]),
+                             [[0x12345678]])
+        dut.run(host)
+
+    def test_client(self):
+        dut = _EtherboneSystem()
+        csr_map = CSRMap({"scratch": (0x40, 2, "rw")}, busword=32)
+        client = Client(csr_map, _transport(dut))
+        def host():
+            client.regs.scratch.write(0x0123456789abcdef)
+            self.assertEqual(client.regs.scratch.read(), 0x0123456789abcdef)
+        dut.run(host)
+
+    def test_probe(self):
+        dut = _EtherboneSystem()
+        transport = _transport(dut)
+        dut.run(lambda: self.assertTrue(transport.probe()))
+
+    def test_hostname(self):
+        # replies come from the address the name resolves to
+        dut = _EtherboneSystem(ip_address=socket.gethostbyname("localhost"))
+        transport = EtherboneTransport("localhost", sock=dut.network)
+        dut.run(lambda: self.assertTrue(transport.probe()))
+
+    def test_arp(self):
+        dut = _EtherboneSystem()
+        def host():
+            dut.network.send_frame(_arp_request("192.168.1.51"))
+            dut.network.send_frame(_arp_request(DEVICE_IP))
+            reply = dut.network.receive_frame()
+            self.assertEqual(reply, _ethernet(HOST_MAC, DEVICE_MAC, 0x0806,
+                bytes([0, 1, 8, 0, 6, 4, 0, 2])
+                + DEVICE_MAC.to_bytes(6, "big") + socket.inet_aton(DEVICE_IP)
+                + HOST_MAC.to_bytes(6, "big") + socket.inet_aton(HOST_IP))[:42])
+        dut.run(host)
+
+    def test_ignored(self):
+        dut = _EtherboneSystem()
+        transport = _transport(dut)
+        write = encode_header() + encode_record(0x20, [1])
+        def host():
+            network = dut.network
+            network.send_frame(_udp_frame(write, dst_port=1235))
+            network.send_frame(_udp_frame(write, dst_ip="192.168.1.51"))
+            network.send_frame(_udp_frame(write, dst_mac=DEVICE_MAC + 1))
+            network.send_frame(_udp_frame(b"\x00" + write[1:]))
+            network.send_frame(_udp_frame(write), error=True)
+            network.idle(500)
+            self.assertEqual(transport.transact([("read", 0x20, 1)]), [[0]])
+            self.assertTrue(network.from_device.empty())
+        dut.run(host)
+
+    def test_mac(self):
+        dut = _EtherboneSystem(mac=True)
+        transport = _transport(dut)
+        def host():
+            self.assertEqual(transport.transact([
+                ("write", 0x40, [0x11223344, 0x55667788]),
+                ("read", 0x40, 2)
+            ]), [None, [0x11223344, 0x55667788]])
+        dut.run(host)
+
+
+def _benchmark():
+    # memory reads at one word every 4 cycles (1Gbps at 125MHz), against
+    # the number of packets in flight
+    nwords = 1020
+    print("{:>7} {:>8} {:>15}".format("window", "packets", "cycles/word"))
+    for window in 1, 2:
+        dut = _EtherboneSystem(cycles_per_word=4)
+        transport = _transport(dut, window=window)
+        cycles = []
+        def host():
+            start = dut.cycles
+            transport.transact([("read", 4*i, 255) for i in range(0, nwords, 255)])
+            cycles.append(dut.cycles - start)
+        dut.run(host)
+        print("{:>7} {:>8} {:>15.2f}".format(
+            window, transport.packets, cycles[0]/nwords))
+
+
+if __name__ == "__main__":
+    _benchmark()
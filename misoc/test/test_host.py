@@ -0,0 +1,135 @@
+import unittest
+
+from misoc.integration.cpu_interface import get_csr_csv
+from misoc.host import CSRMap, Client, Transport, SimulationTransport
+from misoc.test.test_csr_bus import _CSRSystem
+
+
+def _csr_map(dut, **kwargs):
+    regions = [("periph", 0, dut.data_width, dut.csrs)]
+    constants = [("CONFIG_CSR_DATA_WIDTH", dut.data_width),
+                 ("CONFIG_SOC_PLATFORM", "lx9,\"mini\""),
+                 ("ROM_BOOT", None)]
+    return CSRMap.from_lines(get_csr_csv(regions, constants).splitlines(),
+                             **kwargs)
+
+
+class _RecordingTransport(Transport):
+    max_burst = 4
+
+    def __init__(self):
+        Transport.__init__(self)
+        self.operations = []
+
+    def _transact(self, operations):
+        self.operations.append(operations)
+        return [[0]*data if kind == "read" else None
+                for kind, address, data in operations]
+
+
+class TestCSRMap(unittest.TestCase):
+    def test_csv(self):
+        csr_map = _csr_map(_CSRSystem(8))
+        self.assertEqual(csr_map.registers["periph_timer"], (0x0, 8, "ro"))
+        self.assertEqual(csr_map.registers["periph_status"], (0x20, 2, "ro"))
+        self.assertEqual(csr_map.registers["periph_load"], (0x28, 8, "rw"))
+        self.assertEqual(csr_map.registers["periph_mem_page"], (0x54, 1, "rw"))
+        self.assertEqual(csr_map.constants, {
+            "CONFIG_CSR_DATA_WIDTH": 8,
+            "CONFIG_SOC_PLATFORM": "lx9,\"mini\"",
+            "ROM_BOOT": None})
+        self.assertEqual(csr_map.busword, 8)
+        self.assertEqual(_csr_map(_CSRSystem(8), busword=32).busword, 32)
+
+    def test_csv_registers_only(self):
+        # the default format, without constants
+        dut = _CSRSystem(32)
+        lines = get_csr_csv([("periph", 0, 32, dut.csrs)]).splitlines()
+        self.assertEqual(lines[0], "periph_timer,0x00000000,2,ro")
+        self.assertFalse([line for line in lines if line.endswith(",constant")])
+        csr_map = CSRMap.from_lines(lines, busword=32)
+        self.assertEqual(csr_map.registers["periph_status"], (0x8, 1, "ro"))
+        self.assertEqual(csr_map.constants, {})
+        self.assertEqual(csr_map.busword, 32)
+
+
+class TestClient(unittest.TestCase):
+    def test_coalesce(self):
+        client = Client(_csr_map(_CSRSystem(8)), _RecordingTransport())
+        client.regs.periph_ctrl.write(0x123456)
+        with client.batch():
+            timer = client.regs.periph_timer.read()
+            status = client.regs.periph_status.read()
+            client.regs.periph_mem_page.write(1)
+            client.regs.periph_mem_page.write(2)
+            self.assertFalse(timer.done)
+        self.assertEqual(client.transport.operations, [
+            [("write", 0x48, [0x12, 0x34, 0x56])],
+            [("read", 0x00, 4), ("read", 0x10, 4), ("read", 0x20, 2),
+             ("write", 0x54, [1]), ("write", 0x54, [2])]])
+        self.assertEqual(timer.value, 0)
+        self.assertEqual(status.value, 0)
+
+    def test_read_only(self):
+        client = Client(_csr_map(_CSRSystem(8)), _RecordingTransport())
+        with self.assertRaises(ValueError):
+            client.regs.periph_status.write(0)
+        with self.assertRaises(AttributeError):
+            client.regs.periph_missing
+        self.assertEqual(client.constants.CONFIG_CSR_DATA_WIDTH, 8)
+        self.assertEqual(client.transport.operations, [])
+
+    def check_simulation(self, data_width):
+        dut = _CSRSystem(data_width)
+        transport = SimulationTransport(dut.wishbone)
+        client = Client(_csr_map(dut), transport)
+        regs = client.regs
+        def host():
+            self.assertEqual(regs.periph_timer.read(), 0)
+            regs.periph_load.write(0xfedcba9876543210)
+            self.assertEqual(regs.periph_load.read(), 0xfedcba9876543210)
+            with client.batch():
+                regs.periph_ctrl.write(0x5a5a5a)
+                regs.periph_mem_page.write(1)
+                ctrl = regs.periph_ctrl.read()
+                load = regs.periph_load.read()
+            self.assertEqual(ctrl.value, 0x5a5a5a)
+            self.assertEqual(load.value, 0xfedcba9876543210)
+            self.assertEqual(transport.transactions, 4)
+        transport.run(dut, host)
+
+    def test_simulation_8(self):
+        self.check_simulation(8)
+
+    def test_simulation_32(self):
+        self.check_simulation(32)
+
+
+def _benchmark():
+    # calibration-style sweep: write a setting, read back a status
+    print("{:>10} {:>8} {:>13} {:>11}".format(
+        "CSR width", "batched", "round trips", "bus cycles"))
+    for data_width in 8, 32:
+        for batched in False, True:
+            dut = _CSRSystem(data_width)
+            transport = SimulationTransport(dut.wishbone)
+            client = Client(_csr_map(dut), transport)
+            regs = client.regs
+            def sweep():
+                for i in range(64):
+                    regs.periph_ctrl.write(i)
+                    regs.periph_status.read()
+            def host():
+                if batched:
+                    with client.batch():
+                        sweep()
+                else:
+                    sweep()
+            transport.run(dut, host)
+            print("{:>10} {:>8} {:>13} {:>11}".format(
+                data_width, str(batched), transport.transactions,
+                transport.cycles))
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from migen import *
+from migen.fhdl import verilog
+
+from misoc.integration.mem_init import *
+
+
+class _ROM(Module):
+    def __init__(self, mem):
+        self.adr = Signal(4)
+        self.dat_r = Signal(32)
+        port = mem.get_port()
+        self.specials += mem, port
+        self.comb += [port.adr.eq(self.adr), self.dat_r.eq(port.dat_r)]
+
+
+class TestFileInitMemory(unittest.TestCase):
+    def convert(self, mem):
+        dut = _ROM(mem)
+        return str(verilog.convert(dut, {dut.adr, dut.dat_r}))
+
+    def test_no_init_file(self):
+        mem = FileInitMemory(32, 16, init=[0x12345678], name="rom")
+        ref = Memory(32, 16, init=[0x12345678], name="rom")
+        self.assertEqual(self.convert(mem), self.convert(ref))
+
+    def test_init_file(self):
+        mem = FileInitMemory(32, 16, init=[0x12345678], name="rom",
+                             init_file="bios.init")
+        v = self.convert(mem)
+        self.assertIn("$readmemh(\"bios.init\", rom);", v)
+        self.assertNotIn("12345678", v)
+        self.assertEqual(mem.init, [0x12345678])
+
+    def test_write_mem_init(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "rom.init")
+            write_mem_init(filename, [0x12345678, 0xa, 0xffffffff])
+            with open(filename) as f:
+                self.assertEqual(f.read(), "12345678\n0000000a\nffffffff\n")
+
+    def test_write_mem_init_odd_width(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "rom.init")
+            write_mem_init(filename, [0x123456789, 1], 36)
+            with open(filename) as f:
+                self.assertEqual(f.read(), "123456789\n000000001\n")
+
+    def test_read_mem_words(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "bios.bin")
+            with open(filename, "wb") as f:
+                f.write(bytes([0x12, 0x34, 0x56, 0x78, 0xab]))
+            self.assertEqual(read_mem_words(filename).tolist(),
+                             [0x12345678, 0xab000000])
+            self.assertEqual(read_mem_words(filename, 16, "little").tolist(),
+                             [0x3412, 0x7856, 0x00ab])
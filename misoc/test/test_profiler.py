@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+
+from migen import *
+from migen.fhdl import verilog
+
+from misoc.interconnect.csr import *
+from misoc.interconnect import csr_bus
+from misoc.integration.profiler import Profiler, phase
+
+
+class _Peripheral(Module, AutoCSR):
+    def __init__(self):
+        self._scratch = CSRStorage(32)
+
+
+class _SoC(Module):
+    def __init__(self):
+        self.submodules.peripheral = _Peripheral()
+
+    def do_finalize(self):
+        self.submodules.csrbankarray = csr_bus.CSRBankArray(self,
+            lambda name, memory: 0)
+
+
+class TestProfiler(unittest.TestCase):
+    def test_phases(self):
+        with Profiler(trace_memory=True) as profiler:
+            soc = _SoC()
+            with phase("outer"):
+                verilog.convert(soc)
+        names = {s[0] for s in profiler.summary()}
+        self.assertIn("_SoC.do_finalize", names)
+        self.assertIn("CSRBankArray.scan", names)
+        self.assertIn("HDL conversion", names)
+        self.assertIn("outer", names)
+        self.assertIn("HDL conversion", profiler.report())
+
+        summary = {s[0]: s for s in profiler.summary()}
+        name, count, total, self_time, blocks, nbytes = summary["outer"]
+        self.assertEqual(count, 1)
+        self.assertLess(self_time, total)
+        self.assertIsNotNone(nbytes)
+
+    def test_trace(self):
+        with Profiler() as profiler:
+            verilog.convert(_SoC())
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "trace.json")
+            profiler.write_trace(filename)
+            with open(filename) as f:
+                trace = json.load(f)
+        events = trace["traceEvents"]
+        self.assertTrue(events)
+        for event in events:
+            self.assertEqual(event["ph"], "X")
+            self.assertGreaterEqual(event["dur"], 0)
+
+    def test_inactive(self):
+        original = verilog.convert
+        with Profiler():
+            self.assertIsNot(verilog.convert, original)
+        self.assertIs(verilog.convert, original)
+        with phase("nothing") as event:
+            self.assertIsNone(event)
@@ -0,0 +1,127 @@
+import unittest
+
+from migen import *
+
+from misoc.interconnect import wishbone, wishbone2csr, csr_bus
+from misoc.interconnect.csr import CSRStorage
+from misoc.integration.soc_core import (SoCCore, mem_decoder,
+                                        _wishbone_interconnects)
+
+
+def _word_address(name, offset=0):
+    return (SoCCore.mem_map[name] >> 2) + offset
+
+
+class _InterconnectSoC(Module):
+    # the main interconnect of SoCCore, between a CPU data bus and a DMA
+    # master, and SRAM, main RAM and CSR slaves
+    def __init__(self, interconnect, register=True):
+        self.cpu = wishbone.Interface()
+        self.dma = wishbone.Interface()
+        self.submodules.sram = wishbone.SRAM(4096)
+        self.submodules.main_ram = wishbone.SRAM(16*1024)
+        self.submodules.wishbone2csr = wishbone2csr.WB2CSR()
+        self.scratch = CSRStorage(8)
+        self.submodules.csrbank = csr_bus.CSRBank([self.scratch])
+        self.submodules.csrcon = csr_bus.Interconnect(
+            self.wishbone2csr.csr, [self.csrbank.bus])
+        slaves = [(mem_decoder(SoCCore.mem_map[name]), bus)
+                  for name, bus in (("sram", self.sram.bus),
+                                    ("main_ram", self.main_ram.bus),
+                                    ("csr", self.wishbone2csr.wishbone))]
+        self.submodules.wishbonecon = _wishbone_interconnects[interconnect](
+            [self.cpu, self.dma], slaves, register=register)
+        self.cycle = 0
+        self.done = False
+
+    def clock(self):
+        while not self.done:
+            self.cycle += 1
+            yield
+
+    def dma_generator(self, burst=32):
+        # saturates main RAM with read bursts, releasing the bus for one
+        # cycle between them
+        adr = _word_address("main_ram")
+        while not self.done:
+            yield from self.dma.read_burst(adr, burst)
+            yield
+
+    def run(self, cpu_generator, dma=True):
+        def cpu():
+            yield from cpu_generator
+            self.done = True
+        generators = [cpu(), self.clock()]
+        if dma:
+            generators.append(self.dma_generator())
+        run_simulation(self, generators)
+
+
+def _cpu_latencies(soc, n=32):
+    # latencies of CPU reads alternating between SRAM and CSRs, with idle
+    # cycles in between as a CPU executing code would have
+    latencies = []
+    def gen():
+        for i in range(n):
+            yield
+            yield
+            start = soc.cycle
+            name = ("sram", "csr")[i % 2]
+            yield from soc.cpu.read(_word_address(name))
+            latencies.append(soc.cycle - start)
+    return gen(), latencies
+
+
+class TestInterconnect(unittest.TestCase):
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            SoCCore(None, 0, wishbone_interconnect="ring")
+
+    def test_access(self):
+        for interconnect in sorted(_wishbone_interconnects):
+            for register in False, True:
+                with self.subTest(interconnect=interconnect, register=register):
+                    soc = _InterconnectSoC(interconnect, register)
+                    def gen():
+                        yield from soc.cpu.write(_word_address("sram", 3), 0x12345678)
+                        yield from soc.cpu.write(_word_address("csr"), 0x5a)
+                        yield from soc.cpu.write(_word_address("main_ram", 7), 42)
+                        self.assertEqual((yield from soc.cpu.read(_word_address("sram", 3))),
+                                         0x12345678)
+                        self.assertEqual((yield from soc.cpu.read(_word_address("csr"))),
+                                         0x5a)
+                        self.assertEqual((yield from soc.cpu.read(_word_address("main_ram", 7))),
+                                         42)
+                    soc.run(gen())
+
+    def test_dma_isolation(self):
+        latency = dict()
+        for interconnect in sorted(_wishbone_interconnects):
+            soc = _InterconnectSoC(interconnect)
+            gen, latencies = _cpu_latencies(soc)
+            soc.run(gen)
+            latency[interconnect] = max(latencies)
+        # with the crossbar, the DMA bursts to main RAM do not delay the CPU
+        soc = _InterconnectSoC("crossbar")
+        gen, latencies = _cpu_latencies(soc)
+        soc.run(gen, dma=False)
+        self.assertEqual(latency["crossbar"], max(latencies))
+        self.assertLess(latency["crossbar"], latency["shared"])
+
+
+def _benchmark():
+    print("{:<10} {:>9} {:>5} {:>14} {:>13}".format(
+        "topology", "register", "dma", "mean latency", "max latency"))
+    for interconnect in sorted(_wishbone_interconnects):
+        for register in False, True:
+            for dma in False, True:
+                soc = _InterconnectSoC(interconnect, register)
+                gen, latencies = _cpu_latencies(soc, 256)
+                soc.run(gen, dma)
+                print("{:<10} {:>9} {:>5} {:>14.2f} {:>13}".format(
+                    interconnect, str(register), str(dma),
+                    sum(latencies)/len(latencies), max(latencies)))
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,305 @@
+import random
+import unittest
+
+from migen import *
+from migen.fhdl.tools import list_targets
+
+from misoc.interconnect import stream
+
+
+def _send(endpoint, data, prng=None, valid_rate=1.0, eops=None):
+    for i, d in enumerate(data):
+        while prng is not None and prng.random() > valid_rate:
+            yield endpoint.stb.eq(0)
+            yield
+        yield endpoint.stb.eq(1)
+        yield endpoint.data.eq(d)
+        if eops is not None:
+            yield endpoint.eop.eq(eops[i])
+        yield
+        while not (yield endpoint.ack):
+            yield
+    yield endpoint.stb.eq(0)
+
+
+def _receive(endpoint, n, received, prng=None, ready_rate=1.0, eops=None):
+    while len(received) < n:
+        ack = prng is None or prng.random() <= ready_rate
+        yield endpoint.ack.eq(ack)
+        yield
+        if ack and (yield endpoint.stb):
+            received.append((yield endpoint.data))
+            if eops is not None:
+                eops.append((yield endpoint.eop))
+
+
+class _Cycles:
+    def __init__(self):
+        self.count = 0
+
+    def generator(self, done):
+        while not done():
+            self.count += 1
+            yield
+
+
+class TestPipeline(unittest.TestCase):
+    stages = {
+        "PipeValid": lambda: stream.PipeValid([("data", 8)]),
+        "PipeReady": lambda: stream.PipeReady([("data", 8)]),
+        "Buffer": lambda: stream.Buffer([("data", 8)])
+    }
+
+    def check(self, dut, valid_rate=1.0, ready_rate=1.0, n=64):
+        prng = random.Random(42)
+        data = [prng.randrange(256) for i in range(n)]
+        received = []
+        cycles = _Cycles()
+        run_simulation(dut, [
+            _send(dut.sink, data, prng, valid_rate),
+            _receive(dut.source, n, received, prng, ready_rate),
+            cycles.generator(lambda: len(received) == n)])
+        self.assertEqual(received, data)
+        return cycles.count
+
+    def test_throughput(self):
+        for name, stage in self.stages.items():
+            with self.subTest(stage=name):
+                # one transfer per cycle, after the latency of the stage
+                self.assertLessEqual(self.check(stage()), 64 + 3)
+
+    def test_backpressure(self):
+        for name, stage in self.stages.items():
+            with self.subTest(stage=name):
+                self.check(stage(), valid_rate=0.7, ready_rate=0.5)
+
+    def pipeline(self):
+        stages = [stream.PipeValid([("data", 8)]), stream.PipeReady([("data", 8)]),
+                  stream.SyncFIFO([("data", 8)], 4), stream.Buffer([("data", 8)])]
+        dut = stream.Pipeline(*stages)
+        dut.submodules += stages
+        self.assertIs(dut.sink, stages[0].sink)
+        self.assertIs(dut.source, stages[-1].source)
+        return dut
+
+    def test_pipeline(self):
+        self.check(self.pipeline(), valid_rate=0.8, ready_rate=0.6)
+        self.assertLessEqual(self.check(self.pipeline()), 64 + 8)
+
+    def test_ready_registered(self):
+        dut = stream.PipeReady([("data", 8)])
+        def generator():
+            yield dut.sink.stb.eq(1)
+            yield dut.source.ack.eq(0)
+            yield
+            # the first word is taken into the skid buffer, then the sink
+            # is stalled without looking at the source
+            self.assertEqual((yield dut.sink.ack), 1)
+            yield
+            self.assertEqual((yield dut.sink.ack), 0)
+            self.assertEqual((yield dut.source.stb), 1)
+            yield dut.source.ack.eq(1)
+            yield
+            yield
+            self.assertEqual((yield dut.sink.ack), 1)
+        run_simulation(dut, generator())
+
+
+def _regroup(packets, nbits_from, nbits_to, reverse):
+    # reference model: the bits of each packet, in order, cut into output
+    # words, the last one padded with zeros
+    words, eops = [], []
+    for packet in packets:
+        bits = []
+        for word in packet:
+            b = [(word >> i) & 1 for i in range(nbits_from)]
+            bits += b[::-1] if reverse else b
+        bits += [0]*(-len(bits) % nbits_to)
+        for i in range(0, len(bits), nbits_to):
+            b = bits[i:i+nbits_to]
+            if reverse:
+                b = b[::-1]
+            words.append(sum(bit << j for j, bit in enumerate(b)))
+            eops.append(int(i + nbits_to == len(bits)))
+    return words, eops
+
+
+class TestGearbox(unittest.TestCase):
+    def check(self, nbits_from, nbits_to, reverse=False, packet_lengths=[48],
+              valid_rate=1.0, ready_rate=1.0):
+        prng = random.Random(nbits_from*nbits_to)
+        packets = [[prng.randrange(2**nbits_from) for i in range(n)]
+                   for n in packet_lengths]
+        data = sum(packets, [])
+        eops = sum([[0]*(len(p) - 1) + [1] for p in packets], [])
+        expected, expected_eops = _regroup(packets, nbits_from, nbits_to, reverse)
+        dut = stream.Converter(nbits_from, nbits_to, reverse)
+        received, received_eops = [], []
+        cycles = _Cycles()
+        run_simulation(dut, [
+            _send(dut.sink, data, prng, valid_rate, eops),
+            _receive(dut.source, len(expected), received, prng, ready_rate,
+                     received_eops),
+            cycles.generator(lambda: len(received) == len(expected))])
+        self.assertEqual(received, expected)
+        self.assertEqual(received_eops, expected_eops)
+        return cycles.count, len(data), len(expected)
+
+    def test_widths(self):
+        for nbits_from, nbits_to in (10, 32), (24, 32), (32, 24), (32, 10), (3, 5):
+            for reverse in False, True:
+                with self.subTest(nbits_from=nbits_from, nbits_to=nbits_to,
+                                  reverse=reverse):
+                    self.check(nbits_from, nbits_to, reverse)
+
+    def test_throughput(self):
+        # as many cycles as words on the wider side
+        for nbits_from, nbits_to in (10, 32), (24, 32), (32, 24), (32, 10):
+            with self.subTest(nbits_from=nbits_from, nbits_to=nbits_to):
+                cycles, n_in, n_out = self.check(nbits_from, nbits_to,
+                                                 packet_lengths=[96])
+                self.assertLessEqual(cycles, max(n_in, n_out) + 2)
+
+    def test_packets(self):
+        for nbits_from, nbits_to in (10, 32), (32, 24):
+            with self.subTest(nbits_from=nbits_from, nbits_to=nbits_to):
+                self.check(nbits_from, nbits_to, packet_lengths=[1, 7, 3, 12, 2],
+                           valid_rate=0.7, ready_rate=0.6)
+
+
+def _packets(source, lengths):
+    # words tagged with their source, packet and position
+    return [[(source << 12) | (packet << 6) | i for i in range(length)]
+            for packet, length in enumerate(lengths)]
+
+
+def _split(words, eops):
+    packets, packet = [], []
+    for word, eop in zip(words, eops):
+        packet.append(word)
+        if eop:
+            packets.append(packet)
+            packet = []
+    return packets
+
+
+class TestArbiter(unittest.TestCase):
+    def run_arbiter(self, policy, lengths, valid_rate=1.0, ready_rate=1.0):
+        prng = random.Random(len(lengths))
+        dut = stream.Arbiter([("data", 16)], len(lengths), policy)
+        sent = [_packets(i, l) for i, l in enumerate(lengths)]
+        n = sum(sum(l) for l in lengths)
+        received, eops = [], []
+        cycles = _Cycles()
+        generators = [_send(sink, sum(packets, []), prng, valid_rate,
+                            sum([[0]*(len(p) - 1) + [1] for p in packets], []))
+                      for sink, packets in zip(dut.sinks, sent)]
+        generators += [
+            _receive(dut.source, n, received, prng, ready_rate, eops),
+            cycles.generator(lambda: len(received) == n)]
+        run_simulation(dut, generators)
+        packets = _split(received, eops)
+        # packets are not interleaved, and each sink's are in order
+        for i in range(len(lengths)):
+            self.assertEqual([p for p in packets if p[0] >> 12 == i], sent[i])
+        return packets, cycles.count, n
+
+    def test_round_robin(self):
+        packets, cycles, n = self.run_arbiter("round_robin", [[3, 1, 4]]*3)
+        self.assertEqual([p[0] >> 12 for p in packets], [0, 1, 2]*3)
+        # no idle cycle between packets
+        self.assertLessEqual(cycles, n + 2)
+
+    def test_priority(self):
+        packets, cycles, n = self.run_arbiter("priority", [[2, 5], [3, 1], [4]])
+        self.assertEqual([p[0] >> 12 for p in packets], [0, 0, 1, 1, 2])
+        self.assertLessEqual(cycles, n + 4)
+
+    def test_backpressure(self):
+        for policy in "round_robin", "priority":
+            with self.subTest(policy=policy):
+                self.run_arbiter(policy, [[1, 6, 2, 3], [4, 4], [1, 1, 1]],
+                                 valid_rate=0.6, ready_rate=0.6)
+
+
+class TestDispatcher(unittest.TestCase):
+    def run_dispatcher(self, destinations, valid_rate=1.0, ready_rate=1.0):
+        prng = random.Random(len(destinations))
+        dut = stream.Dispatcher([("data", 16), ("dest", 2)], 3, "dest")
+        packets = _packets(0, [prng.randrange(1, 6) for d in destinations])
+        words = sum(packets, [])
+        eops = sum([[0]*(len(p) - 1) + [1] for p in packets], [])
+        dests = sum([[d] + [prng.randrange(4)]*(len(p) - 1)
+                     for d, p in zip(destinations, packets)], [])
+        expected = [[p for p, d in zip(packets, destinations) if d == i]
+                    for i in range(3)]
+        received = [[] for i in range(3)]
+        received_eops = [[] for i in range(3)]
+        cycles = _Cycles()
+        def send():
+            # only the first word of a packet selects its destination
+            for i, d in enumerate(dests):
+                while prng.random() > valid_rate:
+                    yield dut.sink.stb.eq(0)
+                    yield
+                yield dut.sink.stb.eq(1)
+                yield dut.sink.data.eq(words[i])
+                yield dut.sink.dest.eq(d)
+                yield dut.sink.eop.eq(eops[i])
+                yield
+                while not (yield dut.sink.ack):
+                    yield
+            yield dut.sink.stb.eq(0)
+        generators = [send()]
+        generators += [_receive(source, sum(len(p) for p in expected[i]),
+                                received[i], prng, ready_rate, received_eops[i])
+                       for i, source in enumerate(dut.sources)]
+        done = lambda: all(len(r) == sum(len(p) for p in e)
+                           for r, e in zip(received, expected))
+        generators.append(cycles.generator(done))
+        run_simulation(dut, generators)
+        for i in range(3):
+            self.assertEqual(_split(received[i], received_eops[i]), expected[i])
+        return cycles.count, len(words)
+
+    def test_dispatch(self):
+        cycles, n = self.run_dispatcher([0, 1, 2, 2, 1, 0, 3, 1, 2, 0])
+        # no idle cycle between packets
+        self.assertLessEqual(cycles, n + 2)
+
+    def test_backpressure(self):
+        self.run_dispatcher([2, 0, 1, 1, 3, 0, 2, 2, 1, 0],
+                            valid_rate=0.6, ready_rate=0.6)
+
+
+def _register_bits(module):
+    fragment = module.get_fragment()
+    bits = sum(len(s) for statements in fragment.sync.values()
+               for s in list_targets(statements))
+    memory_bits = sum(special.width*special.depth
+                      for special in fragment.specials
+                      if isinstance(special, Memory))
+    return bits, memory_bits
+
+
+def _benchmark():
+    # resources, and memory traffic for 1024 24-bit pixels, against the
+    # padding of each pixel into a 32-bit word
+    print("{:<28} {:>14} {:>12}".format("", "register bits", "memory bits"))
+    for name, module in [
+            ("PipeValid 32", stream.PipeValid([("data", 32)])),
+            ("PipeReady 32", stream.PipeReady([("data", 32)])),
+            ("Buffer 32", stream.Buffer([("data", 32)])),
+            ("SyncFIFO 32, depth 2", stream.SyncFIFO([("data", 32)], 2)),
+            ("Converter 8 -> 32", stream.Converter(8, 32)),
+            ("Converter 24 -> 32", stream.Converter(24, 32)),
+            ("Converter 10 -> 32", stream.Converter(10, 32)),
+            ("Converter 32 -> 24", stream.Converter(32, 24))]:
+        print("{:<28} {:>14} {:>12}".format(name, *_register_bits(module)))
+    npixels = 1024
+    print("memory words for {} pixels: padded {}, packed {}".format(
+        npixels, npixels, len(_regroup([[0]*npixels], 24, 32, False)[0])))
+
+
+if __name__ == "__main__":
+    _benchmark()
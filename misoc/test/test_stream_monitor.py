@@ -0,0 +1,68 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.stream_monitor import StreamMonitor
+from misoc.interconnect import stream
+
+
+# per-cycle stb, ack and eop, giving over 8 cycles 4 transfers (2 of
+# them ending packets), 1 stall and 3 idle cycles
+_PATTERN = [
+    (1, 1, 0),
+    (1, 0, 0),
+    (1, 1, 1),
+    (0, 1, 0),
+    (1, 1, 1),
+    (1, 1, 0),
+    (0, 1, 0),
+    (0, 0, 0)
+]
+
+
+class _MonitoredSystem(Module):
+    def __init__(self, clock_domain):
+        if clock_domain != "sys":
+            self.clock_domains.cd_eth_rx = ClockDomain()
+        self.endpoint = stream.Endpoint([("data", 8)])
+        self.submodules.monitor = StreamMonitor(self.endpoint, clock_domain,
+                                                window=64)
+
+
+class TestStreamMonitor(unittest.TestCase):
+    def check(self, clock_domain):
+        dut = _MonitoredSystem(clock_domain)
+        done = []
+        def traffic():
+            i = 0
+            while not done:
+                stb, ack, eop = _PATTERN[i % len(_PATTERN)]
+                yield dut.endpoint.stb.eq(stb)
+                yield dut.endpoint.ack.eq(ack)
+                yield dut.endpoint.eop.eq(eop)
+                yield
+                i += 1
+        def host():
+            monitor = dut.monitor
+            for i in range(400):
+                yield
+            yield monitor._update.re.eq(1)
+            yield
+            yield monitor._update.re.eq(0)
+            yield
+            self.assertEqual((yield monitor._transfers.status), 32)
+            self.assertEqual((yield monitor._stalls.status), 8)
+            self.assertEqual((yield monitor._idle.status), 24)
+            self.assertEqual((yield monitor._packets.status), 16)
+            done.append(True)
+        if clock_domain == "sys":
+            run_simulation(dut, [traffic(), host()])
+        else:
+            run_simulation(dut, {"sys": host(), clock_domain: traffic()},
+                           clocks={"sys": 10, clock_domain: 7})
+
+    def test_sys(self):
+        self.check("sys")
+
+    def test_cdc(self):
+        self.check("eth_rx")
@@ -0,0 +1,101 @@
+import time
+import unittest
+
+from migen import *
+
+from misoc.interconnect import stream
+from misoc.interconnect.stream_sim import StreamSource, StreamSink
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestStreamSim(unittest.TestCase):
+    def loopback(self, dut, packets, valid_rate=1.0, ready_rate=1.0):
+        source = StreamSource(dut.sink, valid_rate=valid_rate, seed=1)
+        sink = StreamSink(dut.source, ready_rate=ready_rate, seed=2)
+        for packet in packets:
+            source.send(packet)
+        run_simulation(dut, [source.generator(),
+                             sink.generator(len(source.words))])
+        return source, sink
+
+    def test_buffers(self):
+        packets = [b"\x01\x02\x03", bytearray(range(200, 256)), [7], list(range(9))]
+        source, sink = self.loopback(stream.SyncFIFO([("data", 8)], 4), packets,
+                                     valid_rate=0.5, ready_rate=0.5)
+        self.assertEqual(sink.packets, [list(p) for p in packets])
+        self.assertEqual(sink.words, source.words)
+
+    def test_empty(self):
+        source = StreamSource(stream.Endpoint([("data", 8)]))
+        source.send([1, 2])
+        with self.assertRaises(ValueError):
+            source.send(b"")
+        source.send([3, 4])
+        self.assertEqual(source.words, [1, 2, 3, 4])
+        self.assertEqual(source.eops, [0, 1, 0, 1])
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_numpy(self):
+        data = numpy.arange(1000, dtype=numpy.uint16)
+        source, sink = self.loopback(stream.SyncFIFO([("data", 16)], 4), [data])
+        self.assertEqual(sink.words, data.tolist())
+
+    def test_timestamps(self):
+        source, sink = self.loopback(stream.PipeValid([("data", 8)]), [range(64)])
+        # one transfer per cycle, one cycle through the register
+        self.assertEqual(source.timestamps, list(range(1, 65)))
+        self.assertEqual(sink.timestamps, [t + 1 for t in source.timestamps])
+
+    def test_backpressure(self):
+        source, sink = self.loopback(stream.PipeValid([("data", 8)]),
+                                     [range(256)], ready_rate=0.25)
+        self.assertEqual(sink.words, list(range(256)))
+        # about one transfer every 4 cycles
+        self.assertGreater(sink.timestamps[-1], 2*256)
+
+    def test_passive(self):
+        dut = stream.PipeValid([("data", 8)])
+        source = StreamSource(dut.sink)
+        sink = StreamSink(dut.source)
+        source.send(range(10))
+        run_simulation(dut, [source.generator(), sink.generator()])
+        # the simulation stops with the source, before the last word is out
+        self.assertEqual(sink.words, list(range(9)))
+
+
+def _benchmark():
+    from misoc.test.test_stream import _send, _receive
+
+    nwords = 10000
+    data = [i & 0xff for i in range(nwords)]
+    print("{:<12} {:>10} {:>10}".format("drivers", "cycles", "cycles/s"))
+    for name in "generators", "StreamSource":
+        dut = stream.PipeValid([("data", 8)])
+        if name == "generators":
+            received = []
+            generators = [_send(dut.sink, data),
+                          _receive(dut.source, nwords, received)]
+        else:
+            source = StreamSource(dut.sink)
+            sink = StreamSink(dut.source)
+            source.send(data)
+            generators = [source.generator(), sink.generator(nwords)]
+            received = sink.words
+        cycles = [0]
+        def count():
+            while len(received) < nwords:
+                cycles[0] += 1
+                yield
+        start = time.perf_counter()
+        run_simulation(dut, generators + [count()])
+        elapsed = time.perf_counter() - start
+        assert received == data
+        print("{:<12} {:>10} {:>10.0f}".format(name, cycles[0], cycles[0]/elapsed))
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,284 @@
+import asyncio
+import queue
+import threading
+import unittest
+
+from migen import *
+from migen.sim import passive
+
+from misoc.cores.uart import RS232PHY, UARTWishboneBridge
+from misoc.cores.uart.bridge import CMD_WRITE, ACK_CRCERROR
+from misoc.interconnect import stream, wishbone
+from misoc.host import CSRMap, Client
+from misoc.tools.uart_bridge import (UARTBridgeDriver, UARTBridgeTransport,
+                                     encode_command, crc16)
+
+
+class _SimulatedPort:
+    # asyncserial-like port to the host side of a _BridgeSystem, used from
+    # another thread than the simulation
+    def __init__(self):
+        self.to_device = queue.Queue()
+        self.from_device = bytearray()
+        self.wanted = 0
+        self.received = threading.Condition()
+        self.done = False
+
+    async def write_exactly(self, data):
+        for c in data:
+            self.to_device.put(c)
+
+    async def read_exactly(self, n):
+        with self.received:
+            self.wanted = n
+            if not self.received.wait_for(lambda: len(self.from_device) >= n,
+                                          timeout=60):
+                raise TimeoutError
+            r = bytes(self.from_device[:n])
+            del self.from_device[:n]
+            return r
+
+    def idle(self, cycles):
+        self.to_device.put(-cycles)
+
+    def put(self, c):
+        # only wakes the reader once it has all the bytes it waits for
+        with self.received:
+            self.from_device.append(c)
+            if len(self.from_device) >= self.wanted:
+                self.received.notify()
+
+
+class _PHY:
+    def __init__(self):
+        self.sink = stream.Endpoint([("data", 8)])
+        self.source = stream.Endpoint([("data", 8)])
+
+
+class _BridgeSystem(Module):
+    # bridge to a SRAM. The host either exchanges bytes with the bridge
+    # directly, one every ``cycles_per_byte``, or goes through a second PHY
+    # on the other side of the UART.
+    def __init__(self, with_crc=False, cycles_per_byte=4, uart=False,
+                 timeout_cycles=1000):
+        clk_freq = 1e6
+        if uart:
+            baudrate = 10*clk_freq/cycles_per_byte
+            host_pads = Record([("rx", 1), ("tx", 1)])
+            device_pads = Record([("rx", 1), ("tx", 1)])
+            self.comb += [
+                device_pads.rx.eq(host_pads.tx),
+                host_pads.rx.eq(device_pads.tx)
+            ]
+            self.submodules.host_phy = RS232PHY(host_pads, clk_freq, baudrate)
+            phy = RS232PHY(device_pads, clk_freq, baudrate)
+            self.submodules += phy
+        else:
+            self.host_phy = None
+            phy = self.phy = _PHY()
+        self.cycles_per_byte = cycles_per_byte
+        self.submodules.bridge = UARTWishboneBridge(phy, clk_freq,
+            with_crc, timeout=timeout_cycles/clk_freq)
+        self.submodules.sram = wishbone.SRAM(4096)
+        self.submodules += wishbone.InterconnectPointToPoint(
+            self.bridge.wishbone, self.sram.bus)
+        self.port = _SimulatedPort()
+        self.cycles = 0
+
+    def send(self, c):
+        if self.host_phy is None:
+            source = self.phy.source
+            yield source.stb.eq(1)
+            yield source.data.eq(c)
+            yield
+            yield source.stb.eq(0)
+            for i in range(self.cycles_per_byte - 1):
+                yield
+        else:
+            sink = self.host_phy.sink
+            yield sink.stb.eq(1)
+            yield sink.data.eq(c)
+            yield
+            while not (yield sink.ack):
+                yield
+            yield sink.stb.eq(0)
+
+    def host_tx(self):
+        while True:
+            try:
+                c = self.port.to_device.get_nowait()
+            except queue.Empty:
+                if self.port.done:
+                    return
+                yield
+                continue
+            if c < 0:
+                for i in range(-c):
+                    yield
+            else:
+                yield from self.send(c)
+
+    @passive
+    def host_rx(self):
+        while True:
+            if self.host_phy is None:
+                sink = self.phy.sink
+                if (yield sink.stb):
+                    # the ack is seen by the bridge one cycle after it is
+                    # written
+                    for i in range(self.cycles_per_byte - 2):
+                        yield
+                    self.port.put((yield sink.data))
+                    yield sink.ack.eq(1)
+                    yield
+                    yield sink.ack.eq(0)
+            else:
+                source = self.host_phy.source
+                if (yield source.stb):
+                    self.port.put((yield source.data))
+            yield
+
+    @passive
+    def clock(self):
+        while True:
+            self.cycles += 1
+            yield
+
+    def run(self, host):
+        # runs ``host``, a function or coroutine function, in another thread
+        # against the simulation
+        error = None
+        def target():
+            nonlocal error
+            try:
+                if asyncio.iscoroutinefunction(host):
+                    loop = asyncio.new_event_loop()
+                    try:
+                        loop.run_until_complete(host())
+                    finally:
+                        loop.close()
+                else:
+                    host()
+            except BaseException as e:
+                error = e
+            finally:
+                self.port.done = True
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        run_simulation(self, [self.host_tx(), self.host_rx(), self.clock()])
+        thread.join()
+        if error is not None:
+            raise error
+
+
+class TestUARTBridge(unittest.TestCase):
+    def test_read_write(self):
+        for with_crc in False, True:
+            with self.subTest(with_crc=with_crc):
+                dut = _BridgeSystem(with_crc)
+                driver = UARTBridgeDriver(dut.port, with_crc)
+                data = [(0x01020304*i) & 0xffffffff for i in range(16)]
+                async def host():
+                    await driver.write(0x10, [0xdeadbeef])
+                    self.assertEqual(await driver.read(0x10), [0xdeadbeef])
+                    await driver.write(0x100, data)
+                    self.assertEqual(await driver.read(0x100, 16), data)
+                    self.assertEqual(await driver.read(0x10), [0xdeadbeef])
+                dut.run(host)
+
+    def test_longest_burst(self):
+        # 256 words, sent with a length byte of 0
+        dut = _BridgeSystem(cycles_per_byte=2)
+        driver = UARTBridgeDriver(dut.port)
+        data = [(0x01020304*i) & 0xffffffff for i in range(256)]
+        async def host():
+            await driver.write(0x100, data)
+            self.assertEqual(await driver.read(0x100, 256), data)
+        dut.run(host)
+
+    def test_split(self):
+        dut = _BridgeSystem()
+        driver = UARTBridgeDriver(dut.port)
+        driver.max_burst = 4
+        async def host():
+            await driver.write(0x100, list(range(10)))
+            self.assertEqual(await driver.read(0x100, 10), list(range(10)))
+        dut.run(host)
+
+    def test_uart(self):
+        dut = _BridgeSystem(with_crc=True, cycles_per_byte=40, uart=True,
+                            timeout_cycles=4000)
+        driver = UARTBridgeDriver(dut.port, with_crc=True)
+        async def host():
+            await driver.write(0x20, [0x12345678, 0x9abcdef0])
+            self.assertEqual(await driver.read(0x20, 2), [0x12345678, 0x9abcdef0])
+        dut.run(host)
+
+    def test_crc_error(self):
+        dut = _BridgeSystem(with_crc=True)
+        driver = UARTBridgeDriver(dut.port, with_crc=True)
+        async def host():
+            packet = bytearray(encode_command(CMD_WRITE, 0x20, 1, [42], True))
+            packet[-1] ^= 1
+            await dut.port.write_exactly(packet)
+            self.assertEqual(await dut.port.read_exactly(1), bytes([ACK_CRCERROR]))
+            self.assertEqual(await driver.read(0x20), [0])
+            await driver.write(0x20, [42])
+            self.assertEqual(await driver.read(0x20), [42])
+        dut.run(host)
+
+    def test_crc(self):
+        # the CRC is CRC-16/XMODEM
+        self.assertEqual(crc16(b"123456789"), 0x31c3)
+
+    def test_timeout(self):
+        dut = _BridgeSystem(timeout_cycles=1000)
+        driver = UARTBridgeDriver(dut.port)
+        async def host():
+            # an incomplete write, then nothing
+            await dut.port.write_exactly(encode_command(CMD_WRITE, 0x30, 2, [1, 2])[:9])
+            dut.port.idle(2000)
+            await driver.write(0x30, [3, 4])
+            self.assertEqual(await driver.read(0x30, 2), [3, 4])
+        dut.run(host)
+
+    def test_transport(self):
+        dut = _BridgeSystem()
+        csr_map = CSRMap({"scratch": (0x40, 2, "rw")}, busword=32)
+        def host():
+            loop = asyncio.new_event_loop()
+            transport = UARTBridgeTransport(UARTBridgeDriver(dut.port), loop)
+            client = Client(csr_map, transport)
+            client.regs.scratch.write(0x0123456789abcdef)
+            self.assertEqual(client.regs.scratch.read(), 0x0123456789abcdef)
+            self.assertEqual(transport.transactions, 2)
+            loop.close()
+        dut.run(host)
+
+
+def _benchmark():
+    # memory dump throughput at 115200 baud (one bit per cycle), against
+    # the hex text of the BIOS mr command: 78 characters per 16 bytes
+    baudrate = 115200
+    print("{:<10} {:>6} {:>7} {:>13}".format("method", "burst", "crc", "KB/s"))
+    print("{:<10} {:>6} {:>7} {:>13.2f}".format(
+        "mr", "", "", baudrate/10*16/78/1024))
+    nwords = 64
+    for with_crc in False, True:
+        for burst in 1, 8, 64:
+            dut = _BridgeSystem(with_crc, cycles_per_byte=10)
+            driver = UARTBridgeDriver(dut.port, with_crc)
+            driver.max_burst = burst
+            cycles = []
+            async def host():
+                start = dut.cycles
+                await driver.read(0, nwords)
+                cycles.append(dut.cycles - start)
+            dut.run(host)
+            print("{:<10} {:>6} {:>7} {:>13.2f}".format(
+                "bridge", burst, str(with_crc),
+                4*nwords/(cycles[0]/baudrate)/1024))
+
+
+if __name__ == "__main__":
+    _benchmark()
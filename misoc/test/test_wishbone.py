@@ -0,0 +1,602 @@
+import unittest
+
+from migen import *
+
+from misoc.interconnect import wishbone
+
+
+def _decoder(n):
+    return lambda a: a[10:12] == n
+
+
+class _PipelinedSystem(Module):
+    # a pipelined master in front of a pipelined SRAM and a classic SRAM
+    def __init__(self, masters=1):
+        self.masters = [wishbone.Interface(pipelined=True) for i in range(masters)]
+        self.submodules.sram = wishbone.SRAM(1024,
+            bus=wishbone.Interface(pipelined=True))
+        self.submodules.classic_sram = wishbone.SRAM(1024)
+        classic_port = wishbone.Interface(pipelined=True)
+        self.submodules += wishbone.PipelinedToClassic(classic_port,
+                                                       self.classic_sram.bus)
+        self.submodules.interconnect = wishbone.InterconnectShared(
+            self.masters, [(_decoder(0), self.sram.bus),
+                           (_decoder(1), classic_port)])
+
+
+def _count_cycles(dut, generator):
+    cycles = 0
+    result = None
+    done = False
+    def counter():
+        nonlocal cycles
+        while not done:
+            cycles += 1
+            yield
+    def run():
+        nonlocal result, done
+        result = yield from generator
+        done = True
+    run_simulation(dut, [run(), counter()])
+    return result, cycles
+
+
+class TestPipelined(unittest.TestCase):
+    def test_burst(self):
+        dut = _PipelinedSystem()
+        bus = dut.masters[0]
+        data = [0x1000*i + 7 for i in range(16)]
+        def gen():
+            yield from bus.write_burst(0, data)
+            return (yield from bus.read_burst(0, 16))
+        result, cycles = _count_cycles(dut, gen())
+        self.assertEqual(result, data)
+        # back-to-back: about one cycle per word
+        self.assertLess(cycles, 2*16 + 10)
+
+    def test_slave_switch(self):
+        dut = _PipelinedSystem()
+        bus = dut.masters[0]
+        def gen():
+            yield from bus.write_burst(0x3fe, [1, 2, 3, 4])
+            yield from bus.write(0x402, 5)
+            # crosses from the pipelined to the classic slave
+            r = yield from bus.read_burst(0x3fe, 4)
+            r.append((yield from bus.read(0x402)))
+            return r
+        result, cycles = _count_cycles(dut, gen())
+        self.assertEqual(result, [1, 2, 3, 4, 5])
+
+    def test_arbiter(self):
+        dut = _PipelinedSystem(masters=2)
+        results = {}
+        def gen(n):
+            bus = dut.masters[n]
+            base = 0x100*n
+            yield from bus.write_burst(base, [base + i for i in range(8)])
+            results[n] = yield from bus.read_burst(base, 8)
+        run_simulation(dut, [gen(0), gen(1)])
+        for n in range(2):
+            self.assertEqual(results[n], [0x100*n + i for i in range(8)])
+
+    def test_classic_to_pipelined(self):
+        master = wishbone.Interface()
+        sram = wishbone.SRAM(1024, bus=wishbone.Interface(pipelined=True))
+        dut = Module()
+        dut.submodules += sram, wishbone.Converter(master, sram.bus)
+        def gen():
+            yield from master.write_burst(4, [10, 11, 12])
+            return (yield from master.read_burst(4, 3))
+        result, cycles = _count_cycles(dut, gen())
+        self.assertEqual(result, [10, 11, 12])
+
+
+class _ConverterSystem(Module):
+    # a master in front of a converter and a slave model that logs
+    # (adr, we, cti) for each access. The pipelined slave model accepts
+    # one request per cycle and acks it latency cycles later.
+    def __init__(self, dw_from, dw_to, latency=0, pipelined=False):
+        self.master = wishbone.Interface(dw_from)
+        self.slave = wishbone.Interface(dw_to, pipelined=pipelined)
+        self.submodules.converter = wishbone.Converter(self.master, self.slave)
+        self.latency = latency
+        self.memory = dict()
+        self.accesses = []
+        self.cycles = 0
+        self.done = False
+
+    def _access(self):
+        bus = self.slave
+        adr = yield bus.adr
+        we = yield bus.we
+        self.accesses.append((adr, we, (yield bus.cti)))
+        if we:
+            sel = yield bus.sel
+            mask = sum(0xff << 8*i for i in range(len(bus.sel))
+                       if sel & (1 << i))
+            old = self.memory.get(adr, 0)
+            self.memory[adr] = (old & ~mask) | ((yield bus.dat_w) & mask)
+        return self.memory.get(adr, 0)
+
+    def slave_generator(self):
+        bus = self.slave
+        wait = 0
+        while not self.done:
+            self.cycles += 1
+            if (yield bus.cyc) and (yield bus.stb) and not (yield bus.ack):
+                if wait < self.latency:
+                    wait += 1
+                    yield
+                    continue
+                wait = 0
+                yield bus.dat_r.eq((yield from self._access()))
+                yield bus.ack.eq(1)
+            else:
+                yield bus.ack.eq(0)
+            yield
+
+    def pipelined_slave_generator(self):
+        bus = self.slave
+        responses = []
+        while not self.done:
+            self.cycles += 1
+            if (yield bus.cyc) and (yield bus.stb):
+                responses.append((self.cycles + 1 + self.latency,
+                                  (yield from self._access())))
+            if responses and responses[0][0] == self.cycles + 1:
+                yield bus.dat_r.eq(responses.pop(0)[1])
+                yield bus.ack.eq(1)
+            else:
+                yield bus.ack.eq(0)
+            yield
+
+    def run(self, generator):
+        def master():
+            yield from generator
+            self.done = True
+        if self.slave.pipelined:
+            slave = self.pipelined_slave_generator()
+        else:
+            slave = self.slave_generator()
+        run_simulation(self, [master(), slave])
+
+
+def _check_converter(test, dut, seed=0):
+    # random single and burst accesses, checked against a model of the
+    # master address space
+    import random
+    prng = random.Random(seed)
+    dw = len(dut.master.dat_w)
+    reference = dict()
+    def write(adr, data, sel=2**(dw//8)-1):
+        mask = sum(0xff << 8*i for i in range(dw//8) if sel & (1 << i))
+        reference[adr] = (reference.get(adr, 0) & ~mask) | (data & mask)
+    def gen():
+        for i in range(60):
+            adr = prng.randrange(64)
+            n = prng.randrange(1, 10)
+            kind = prng.randrange(4)
+            if kind == 0:
+                data = prng.randrange(2**dw)
+                sel = prng.randrange(2**(dw//8))
+                yield from dut.master.write(adr, data, sel)
+                write(adr, data, sel)
+            elif kind == 1:
+                test.assertEqual((yield from dut.master.read(adr)),
+                                 reference.get(adr, 0))
+            elif kind == 2:
+                data = [prng.randrange(2**dw) for _ in range(n)]
+                yield from dut.master.write_burst(adr, data)
+                for j, d in enumerate(data):
+                    write(adr + j, d)
+            else:
+                test.assertEqual((yield from dut.master.read_burst(adr, n)),
+                                 [reference.get(adr + j, 0) for j in range(n)])
+    dut.run(gen())
+
+
+class TestUpConverter(unittest.TestCase):
+    def test_random(self):
+        for dw_to in 64, 128:
+            with self.subTest(dw_to=dw_to):
+                _check_converter(self, _ConverterSystem(32, dw_to))
+
+    def test_burst(self):
+        dut = _ConverterSystem(32, 64)
+        data = list(range(100, 111))
+        def gen():
+            yield from dut.master.write_burst(3, data)
+            self.assertEqual((yield from dut.master.read_burst(3, 11)), data)
+        dut.run(gen())
+        # words 3..13 span the wide words 1..6, each accessed once
+        writes = [(adr, cti) for adr, we, cti in dut.accesses if we]
+        reads = [(adr, cti) for adr, we, cti in dut.accesses if not we]
+        self.assertEqual([adr for adr, cti in writes], list(range(1, 7)))
+        self.assertEqual([cti for adr, cti in writes], [2]*5 + [7])
+        self.assertEqual([adr for adr, cti in reads], list(range(1, 7)))
+        # reads are fetched before the master signals the end of the burst
+        self.assertEqual([cti for adr, cti in reads], [2]*6)
+
+    def test_write_overlap(self):
+        # the slave write of a wide word overlaps with the next fill
+        dut = _ConverterSystem(32, 128, latency=3)
+        def gen():
+            yield from dut.master.write_burst(0, list(range(32)))
+        dut.run(gen())
+        # 8 wide words: serialized, that would be 8*(3 + 1) + 32 cycles
+        self.assertLess(dut.cycles, 8*(3 + 1) + 32)
+
+
+class TestDownConverter(unittest.TestCase):
+    def test_random(self):
+        for dw_from in 64, 128:
+            for pipelined in False, True:
+                with self.subTest(dw_from=dw_from, pipelined=pipelined):
+                    _check_converter(self, _ConverterSystem(
+                        dw_from, 32, latency=1, pipelined=pipelined))
+
+    def test_burst(self):
+        dut = _ConverterSystem(64, 32)
+        def gen():
+            yield from dut.master.write(3, 0x1122334455667788)
+        dut.run(gen())
+        self.assertEqual(dut.accesses, [(6, 1, 2), (7, 1, 7)])
+        self.assertEqual(dut.memory, {6: 0x55667788, 7: 0x11223344})
+
+    def test_overlap(self):
+        # pipelined sub-accesses are in flight back-to-back: the slave
+        # latency is paid once per wide word
+        for pipelined, bound in (False, 4*(3 + 2)), (True, 4 + 3 + 1):
+            dut = _ConverterSystem(128, 32, latency=3, pipelined=pipelined)
+            def gen():
+                for i in range(4):
+                    yield from dut.master.read(i)
+            dut.run(gen())
+            self.assertLessEqual(dut.cycles, 4*bound + 2)
+
+
+class _CacheSystem(Module):
+    # latency is the number of wait states of the slave
+    def __init__(self, cachesize, dw_from, dw_to, latency=0, **kwargs):
+        self.master = wishbone.Interface(dw_from)
+        self.slave = wishbone.Interface(dw_to)
+        self.submodules.cache = wishbone.Cache(cachesize, self.master,
+                                               self.slave, **kwargs)
+        self.latency = latency
+        self.memory = dict()
+        self.refills = 0
+        self.cycles = 0
+        self.done = False
+
+    def slave_generator(self):
+        bus = self.slave
+        wait = 0
+        while not self.done:
+            self.cycles += 1
+            if (yield bus.cyc) and (yield bus.stb) and not (yield bus.ack):
+                if wait < self.latency:
+                    wait += 1
+                    yield
+                    continue
+                wait = 0
+                adr = yield bus.adr
+                if (yield bus.we):
+                    self.memory[adr] = yield bus.dat_w
+                else:
+                    self.refills += 1
+                yield bus.dat_r.eq(self.memory.get(adr, 0))
+                yield bus.ack.eq(1)
+            else:
+                yield bus.ack.eq(0)
+            yield
+
+    def run(self, generator):
+        def master():
+            yield from generator
+            self.done = True
+        run_simulation(self, [master(), self.slave_generator()])
+
+
+def _random_accesses(n, span, dw, seed=0):
+    import random
+    prng = random.Random(seed)
+    accesses = []
+    for i in range(n):
+        adr = prng.randrange(span)
+        if prng.randrange(2):
+            accesses.append((adr, prng.randrange(2**dw)))
+        else:
+            accesses.append((adr, None))
+    return accesses
+
+
+def _sequential_accesses(start, n, dw, seed=0):
+    # write a buffer, read it back and update it in place, like memcpy
+    # and streaming code do
+    import random
+    prng = random.Random(seed)
+    accesses = [(start + i, prng.randrange(2**dw)) for i in range(n)]
+    accesses += [(start + i, None) for i in range(n)]
+    for i in range(n):
+        accesses += [(start + i, None), (start + i, prng.randrange(2**dw))]
+    accesses += [(start + i, None) for i in range(n)]
+    return accesses
+
+
+class TestCache(unittest.TestCase):
+    def check(self, dw_from=32, dw_to=32, accesses=None, **kwargs):
+        dut = _CacheSystem(64, dw_from, dw_to, **kwargs)
+        if accesses is None:
+            accesses = _random_accesses(150, 256, dw_from)
+        reference = dict()
+        def gen():
+            for adr, data in accesses:
+                if data is None:
+                    self.assertEqual((yield from dut.master.read(adr)),
+                                     reference.get(adr, 0), hex(adr))
+                else:
+                    yield from dut.master.write(adr, data)
+                    reference[adr] = data
+        dut.run(gen())
+
+    def test_direct_mapped(self):
+        self.check()
+        self.check(32, 128)
+        self.check(64, 32)
+
+    def test_ways(self):
+        for ways in 2, 4, 8:
+            for replacement in "lru", "plru":
+                with self.subTest(ways=ways, replacement=replacement):
+                    self.check(ways=ways, replacement=replacement)
+
+    def test_linesize(self):
+        self.check(32, 32, linesize=4, ways=2)
+        self.check(32, 64, linesize=4, ways=2)
+        self.check(64, 32, linesize=2, ways=2)
+
+    def test_critical_word_first(self):
+        self.check(32, 32, linesize=4, critical_word_first=True)
+        self.check(32, 64, linesize=8, ways=2, critical_word_first=True)
+        self.check(32, 128, linesize=8, critical_word_first=True,
+                   accesses=_sequential_accesses(100, 48, 32))
+
+    def test_prefetch(self):
+        self.check(32, 32, linesize=4, ways=2, prefetch=True,
+                   accesses=_sequential_accesses(100, 96, 32))
+        self.check(32, 64, linesize=4, prefetch=True, critical_word_first=True,
+                   accesses=_sequential_accesses(30, 64, 32) +
+                            _random_accesses(100, 256, 32))
+        self.check(64, 32, prefetch=True,
+                   accesses=_sequential_accesses(200, 48, 64))
+
+    def test_sequential_cycles(self):
+        def cycles(**kwargs):
+            dut = _CacheSystem(256, 32, 32, latency=4, linesize=4, **kwargs)
+            def gen():
+                for adr in range(1024, 1152):
+                    yield from dut.master.read(adr)
+            dut.run(gen())
+            return dut.cycles
+        baseline = cycles()
+        self.assertLess(cycles(critical_word_first=True), baseline)
+        self.assertLess(cycles(prefetch=True), baseline)
+
+    def test_aliasing(self):
+        # two buffers one cache size apart
+        def trace():
+            for i in range(4):
+                for adr in range(16):
+                    yield from dut.master.read(adr + 64)
+                    yield from dut.master.read(adr + 128)
+        dut = _CacheSystem(64, 32, 32)
+        dut.run(trace())
+        self.assertEqual(dut.refills, 4*2*16)
+        dut = _CacheSystem(64, 32, 32, ways=2)
+        dut.run(trace())
+        self.assertEqual(dut.refills, 2*16)
+
+
+class TestCachePerfCounters(unittest.TestCase):
+    def test_counters(self):
+        dut = _CacheSystem(64, 32, 32, with_perf_counters=True)
+        cache = dut.cache
+        def pulse(c):
+            yield c.re.eq(1)
+            yield
+            yield c.re.eq(0)
+            yield
+        def counters():
+            yield from pulse(cache._update)
+            r = dict()
+            for name in ("read_hits", "read_misses", "write_hits",
+                         "write_misses", "evictions"):
+                r[name] = yield getattr(cache, "_" + name).status
+            r["refill_cycles"] = yield cache._refill_cycles.status
+            r["stall_cycles"] = yield cache._stall_cycles.status
+            return r
+        def gen():
+            yield from dut.master.write(0x40, 1)  # miss
+            yield from dut.master.write(0x40, 2)  # hit
+            yield from dut.master.read(0x40)      # hit
+            yield from dut.master.read(0x80)      # miss, evicts 0x40
+            yield from dut.master.read(0x81)      # miss
+            r = yield from counters()
+            self.assertEqual(r["read_hits"], 1)
+            self.assertEqual(r["read_misses"], 2)
+            self.assertEqual(r["write_hits"], 1)
+            self.assertEqual(r["write_misses"], 1)
+            self.assertEqual(r["evictions"], 1)
+            self.assertGreater(r["refill_cycles"], 0)
+            self.assertGreater(r["stall_cycles"], 0)
+            yield from pulse(cache._clear)
+            yield from dut.master.read(0x81)
+            yield from dut.master.write(0x80, 3)
+            yield from dut.master.read(0x80)
+            r = yield from counters()
+            self.assertEqual(r["read_hits"], 2)
+            self.assertEqual(r["write_hits"], 1)
+            self.assertEqual(r["read_misses"], 0)
+            self.assertEqual(r["stall_cycles"], 0)
+        dut.run(gen())
+
+    def test_header(self):
+        from misoc.integration.cpu_interface import get_csr_header
+        dut = _CacheSystem(64, 32, 32, with_perf_counters=True)
+        header = get_csr_header([("l2_cache", 0xe0000000, 8,
+                                  dut.cache.get_csrs())], [])
+        self.assertIn("l2_cache_update_write(", header)
+        self.assertIn("unsigned int l2_cache_stall_cycles_read(", header)
+
+
+def _benchmark():
+    n = 256
+    print("{:<12} {:>8} {:>14}".format("bus", "words", "cycles/word"))
+    for pipelined in False, True:
+        bus = wishbone.Interface(pipelined=pipelined)
+        dut = wishbone.SRAM(4*n, bus=bus)
+        def gen():
+            yield from bus.write_burst(0, list(range(n)))
+            yield from bus.read_burst(0, n)
+        _, cycles = _count_cycles(dut, gen())
+        print("{:<12} {:>8} {:>14.2f}".format(
+            "pipelined" if pipelined else "classic", 2*n, cycles/(2*n)))
+
+
+def _cache_benchmark():
+    import random
+
+    cachesize = 256
+    base = 16*cachesize  # away from the initial (zero) tags
+    prng = random.Random(0)
+    working_set = prng.sample(range(base, base + 8*cachesize), cachesize//2)
+    traces = {
+        # three buffers aliasing in a direct-mapped cache
+        "aliasing": [base + b + i for _ in range(4) for i in range(64)
+                     for b in (0, cachesize, 2*cachesize)],
+        # random accesses to a scattered working set half the cache size
+        "working set": [prng.choice(working_set) for _ in range(1024)],
+        # mostly hot data, with a streaming scan interleaved
+        "hot + scan": [a for i in range(512)
+                       for a in (base + prng.randrange(cachesize//4),
+                                 base + cachesize + i)],
+    }
+    configs = [(1, "lru", 1)] + [(w, r, 1) for w in (2, 4, 8) for r in ("lru", "plru")] + \
+        [(4, "lru", 4)]
+    print("{:<12} {:>5} {:>5} {:>9} {:>10}".format(
+        "trace", "ways", "repl", "linesize", "hit rate"))
+    for name, trace in traces.items():
+        for ways, replacement, linesize in configs:
+            dut = _CacheSystem(cachesize, 32, 32, ways=ways,
+                               replacement=replacement, linesize=linesize)
+            def gen():
+                for adr in trace:
+                    yield from dut.master.read(adr)
+            dut.run(gen())
+            misses = dut.refills//linesize
+            print("{:<12} {:>5} {:>5} {:>9} {:>9.1f}%".format(
+                name, ways, replacement, linesize, 100*(1 - misses/len(trace))))
+
+
+def _refill_benchmark():
+    import random
+
+    cachesize = 256
+    base = 16*cachesize
+    prng = random.Random(0)
+    traces = {
+        "stream": [(base + i, None) for i in range(512)],
+        # read one buffer, write another
+        "memcpy": [(a, d) for i in range(512)
+                   for a, d in ((base + i, None),
+                                (base + 4*cachesize + i, i))],
+        "random": [(base + prng.randrange(8*cachesize), None)
+                   for _ in range(512)],
+    }
+    configs = [
+        ("baseline", {}),
+        ("cwf", {"critical_word_first": True}),
+        ("prefetch", {"prefetch": True}),
+        ("cwf+prefetch", {"critical_word_first": True, "prefetch": True}),
+    ]
+    print("{:<12} {:<14} {:>8} {:>14}".format(
+        "trace", "config", "cycles", "cycles/access"))
+    for name, trace in traces.items():
+        for config, kwargs in configs:
+            dut = _CacheSystem(cachesize, 32, 32, latency=4, ways=2,
+                               linesize=4, **kwargs)
+            def gen():
+                for adr, data in trace:
+                    if data is None:
+                        yield from dut.master.read(adr)
+                    else:
+                        yield from dut.master.write(adr, data)
+            dut.run(gen())
+            print("{:<12} {:<14} {:>8} {:>14.2f}".format(
+                name, config, dut.cycles, dut.cycles/len(trace)))
+
+
+def _converter_benchmark():
+    n = 256
+    print("{:<8} {:>8} {:<8} {:>14} {:>14}".format(
+        "dw_to", "latency", "access", "write c/word", "read c/word"))
+    for dw_to in 64, 128:
+        for latency in 0, 4:
+            for access in "single", "burst":
+                cycles = []
+                for write in True, False:
+                    dut = _ConverterSystem(32, dw_to, latency)
+                    def gen():
+                        if access == "burst":
+                            if write:
+                                yield from dut.master.write_burst(0, list(range(n)))
+                            else:
+                                yield from dut.master.read_burst(0, n)
+                        else:
+                            for i in range(n):
+                                if write:
+                                    yield from dut.master.write(i, i)
+                                else:
+                                    yield from dut.master.read(i)
+                    dut.run(gen())
+                    cycles.append(dut.cycles/n)
+                print("{:<8} {:>8} {:<8} {:>14.2f} {:>14.2f}".format(
+                    dw_to, latency, access, *cycles))
+
+
+def _downconverter_benchmark():
+    n = 64
+    print("{:<8} {:<10} {:>8} {:<8} {:>14} {:>14}".format(
+        "dw_from", "slave", "latency", "access", "write c/word", "read c/word"))
+    for dw_from in 64, 128:
+        for pipelined in False, True:
+            for latency in 0, 4:
+                for access in "single", "burst":
+                    cycles = []
+                    for write in True, False:
+                        dut = _ConverterSystem(dw_from, 32, latency, pipelined)
+                        def gen():
+                            if access == "burst":
+                                if write:
+                                    yield from dut.master.write_burst(0, list(range(n)))
+                                else:
+                                    yield from dut.master.read_burst(0, n)
+                            else:
+                                for i in range(n):
+                                    if write:
+                                        yield from dut.master.write(i, i)
+                                    else:
+                                        yield from dut.master.read(i)
+                        dut.run(gen())
+                        cycles.append(dut.cycles/n)
+                    print("{:<8} {:<10} {:>8} {:<8} {:>14.2f} {:>14.2f}".format(
+                        dw_from, "pipelined" if pipelined else "classic",
+                        latency, access, *cycles))
+
+
+if __name__ == "__main__":
+    _benchmark()
+    _cache_benchmark()
+    _refill_benchmark()
+    _converter_benchmark()
+    _downconverter_benchmark()
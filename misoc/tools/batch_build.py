@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import argparse
+import importlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+
+def build_target(target, output_dir, software_cache, extra_args):
+    """Builds ``misoc.targets.<target>`` by invoking its ``main()`` with
+    the given command line arguments. Returns the wall time in seconds."""
+    module = importlib.import_module("misoc.targets." + target)
+    argv = [target, "--output-dir", output_dir]
+    if software_cache is not None:
+        argv += ["--software-cache", software_cache]
+    argv += extra_args
+    saved_argv = sys.argv
+    sys.argv = argv
+    t0 = time.perf_counter()
+    try:
+        module.main()
+    finally:
+        sys.argv = saved_argv
+    return time.perf_counter() - t0
+
+
+def _build_target_catch(*args):
+    try:
+        return build_target(*args), None
+    except BaseException:
+        return None, traceback.format_exc()
+
+
+def batch_build(targets, output_dir, software_cache=None, jobs=1,
+                extra_args=[]):
+    """Builds several targets, ``jobs`` at a time, in separate processes.
+
+    Software libraries are shared between targets through
+    ``software_cache`` (by default ``<output_dir>/software_cache``).
+    Returns a list of ``(target, wall_time, error)`` tuples, where
+    ``error`` is ``None`` or the formatted exception.
+    """
+    if software_cache is None:
+        software_cache = os.path.join(output_dir, "software_cache")
+    software_cache = os.path.abspath(software_cache)
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(_build_target_catch, target,
+                                   os.path.join(output_dir, target),
+                                   software_cache, extra_args)
+                   for target in targets]
+        results = [f.result() for f in futures]
+    return [(target, wall_time, error)
+            for target, (wall_time, error) in zip(targets, results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build several MiSoC targets, sharing compiled software "
+                    "libraries between them.",
+        epilog="Arguments after '--' are passed to every target.")
+    parser.add_argument("targets", nargs="+",
+                        help="names of the modules in misoc.targets to build")
+    parser.add_argument("--output-dir", default="misoc_batch",
+                        help="base output directory; each target is built "
+                             "in a subdirectory")
+    parser.add_argument("--software-cache", default=None,
+                        help="directory where compiled software libraries "
+                             "are shared (default: OUTPUT_DIR/software_cache)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of targets built in parallel")
+    argv = sys.argv[1:]
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra_args = argv[:i], argv[i+1:]
+    else:
+        extra_args = []
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    results = batch_build(args.targets, args.output_dir, args.software_cache,
+                          args.jobs, extra_args)
+    total = time.perf_counter() - t0
+
+    failed = False
+    for target, wall_time, error in results:
+        if error is not None:
+            failed = True
+            print("{} failed:\n{}".format(target, error), file=sys.stderr)
+    print("{:<30} {:>12}".format("target", "wall time (s)"))
+    for target, wall_time, error in results:
+        print("{:<30} {:>12}".format(
+            target, "FAILED" if error is not None else "{:.1f}".format(wall_time)))
+    print("{:<30} {:>12.1f}".format("total", total))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3.5
+
+import os
+import time
+import asyncio
+import argparse
+
+from misoc.cores.uart.bridge import (CMD_WRITE, CMD_READ,
+                                     ACK_SUCCESS, ACK_CRCERROR)
+from misoc.host.transport import Transport
+
+
+def crc16(l):
+    # CRC-16/XMODEM, as flterm.crc16
+    crc = 0
+    for d in l:
+        crc ^= d << 8
+        for i in range(8):
+            crc <<= 1
+            if crc & 0x10000:
+                crc ^= 0x1021
+    return crc & 0xffff
+
+
+def encode_command(cmd, address, length, data=[], with_crc=False):
+    """Encodes a bridge command. ``address`` is a byte address, ``length``
+    a number of words (1 to 256) and ``data`` the words to write."""
+    packet = bytes([cmd, length & 0xff])
+    packet += (address >> 2).to_bytes(4, "big")
+    for word in data:
+        packet += word.to_bytes(4, "big")
+    if with_crc:
+        packet += crc16(packet).to_bytes(2, "big")
+    return packet
+
+
+def decode_words(data):
+    return [int.from_bytes(data[i:i+4], "big") for i in range(0, len(data), 4)]
+
+
+class BridgeError(Exception):
+    pass
+
+
+class UARTBridgeDriver:
+    """Accesses the bus of a SoC through a ``UARTWishboneBridge``
+
+    ``port`` is an ``asyncserial.AsyncSerial`` or an object with the same
+    ``read_exactly`` and ``write_exactly`` coroutines. Addresses are byte
+    addresses.
+    """
+    max_burst = 256
+
+    def __init__(self, port, with_crc=False, retries=3):
+        self.port = port
+        self.with_crc = with_crc
+        self.retries = retries
+
+    async def _command(self, cmd, address, length, data=[]):
+        packet = encode_command(cmd, address, length, data, self.with_crc)
+        response_length = 4*length if cmd == CMD_READ else 0
+        if not self.with_crc:
+            await self.port.write_exactly(packet)
+            if response_length:
+                return await self.port.read_exactly(response_length)
+            return b""
+        for i in range(self.retries + 1):
+            await self.port.write_exactly(packet)
+            ack = (await self.port.read_exactly(1))[0]
+            if ack == ACK_CRCERROR:
+                continue
+            elif ack != ACK_SUCCESS:
+                raise BridgeError("unexpected reply 0x{:02x}".format(ack))
+            if not response_length:
+                return b""
+            response = await self.port.read_exactly(response_length + 2)
+            if crc16(response[:-2]) == int.from_bytes(response[-2:], "big"):
+                return response[:-2]
+            # the read is repeated, which is harmless for memories
+        raise BridgeError("CRC error after {} retries".format(self.retries))
+
+    async def read(self, address, count=1):
+        r = []
+        while count:
+            length = min(count, self.max_burst)
+            r += decode_words(await self._command(CMD_READ, address, length))
+            address += 4*length
+            count -= length
+        return r
+
+    async def write(self, address, data):
+        data = list(data)
+        while data:
+            burst, data = data[:self.max_burst], data[self.max_burst:]
+            await self._command(CMD_WRITE, address, len(burst), burst)
+            address += 4*len(burst)
+
+
+class UARTBridgeTransport(Transport):
+    """``misoc.host`` transport over a ``UARTBridgeDriver``"""
+    max_burst = UARTBridgeDriver.max_burst
+
+    def __init__(self, driver, loop=None):
+        Transport.__init__(self)
+        self.driver = driver
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+    async def _transact_async(self, operations):
+        results = []
+        for kind, address, data in operations:
+            if kind == "read":
+                results.append(await self.driver.read(address, data))
+            else:
+                await self.driver.write(address, data)
+                results.append(None)
+        return results
+
+    def _transact(self, operations):
+        return self.loop.run_until_complete(self._transact_async(operations))
+
+
+async def _main_coro(driver, args):
+    if args.action == "read":
+        for i, word in enumerate(await driver.read(args.address, args.count)):
+            print("0x{:08x}: 0x{:08x}".format(args.address + 4*i, word))
+    elif args.action == "write":
+        await driver.write(args.address, args.values)
+    elif args.action == "dump":
+        start = time.time()
+        words = await driver.read(args.address, (args.length + 3)//4)
+        elapsed = time.time() - start
+        with open(args.file, "wb") as f:
+            for word in words:
+                f.write(word.to_bytes(4, "big"))
+        print("Dumped {} bytes ({:.1f}KB/s).".format(
+            4*len(words), 4*len(words)/(elapsed*1024)))
+    elif args.action == "load":
+        with open(args.file, "rb") as f:
+            data = f.read()
+        data += bytes(-len(data) % 4)
+        start = time.time()
+        await driver.write(args.address, decode_words(data))
+        elapsed = time.time() - start
+        print("Loaded {} bytes ({:.1f}KB/s).".format(
+            len(data), len(data)/(elapsed*1024)))
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(
+        description="Access the bus of a SoC through its UART bridge")
+    parser.add_argument("port", help="serial port")
+    parser.add_argument("--speed", default=115200, help="serial baudrate")
+    parser.add_argument("--crc", default=False, action="store_true",
+                        help="the bridge checks CRCs")
+    number = lambda a: int(a, 0)
+    subparsers = parser.add_subparsers(dest="action")
+    subparsers.required = True
+
+    parser_read = subparsers.add_parser("read", help="read words")
+    parser_read.add_argument("address", type=number)
+    parser_read.add_argument("count", type=number, nargs="?", default=1)
+
+    parser_write = subparsers.add_parser("write", help="write words")
+    parser_write.add_argument("address", type=number)
+    parser_write.add_argument("values", type=number, nargs="+")
+
+    parser_dump = subparsers.add_parser("dump", help="dump memory to a file")
+    parser_dump.add_argument("address", type=number)
+    parser_dump.add_argument("length", type=number, help="length in bytes")
+    parser_dump.add_argument("file")
+
+    parser_load = subparsers.add_parser("load", help="load a file into memory")
+    parser_load.add_argument("address", type=number)
+    parser_load.add_argument("file")
+    return parser.parse_args()
+
+
+def main():
+    import asyncserial
+
+    if os.name == "nt":
+        loop = asyncio.ProactorEventLoop()
+        asyncio.set_event_loop(loop)
+    else:
+        loop = asyncio.get_event_loop()
+    try:
+        args = _get_args()
+        port = asyncserial.AsyncSerial(args.port, baudrate=args.speed)
+        try:
+            driver = UARTBridgeDriver(port, args.crc)
+            loop.run_until_complete(_main_coro(driver, args))
+        finally:
+            port.close()
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -36,7 +36,9 @@ setup(
     entry_points={
         "console_scripts": [
             "flterm=misoc.tools.flterm:main",
+            "misoc_uart_bridge=misoc.tools.uart_bridge:main",
             "mkmscimg=misoc.tools.mkmscimg:main",
+            "misoc_batch_build=misoc.tools.batch_build:main",
         ],
     },
 )